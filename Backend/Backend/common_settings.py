@@ -61,6 +61,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ebayItems.profiling.RequestProfilerMiddleware',
+    'ebayItems.slowsql.SlowQueryMiddleware',
 ]
 
 
@@ -93,6 +95,31 @@ DATABASES = {
     }
 }
 
+# Shared by the web and the worker processes of all nodes through the database,
+# create its table with `python manage.py createcachetable` on deploy. The
+# catalog version the cached tables are keyed by is kept in the database, too.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ebayitems_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+# Seconds a rendered item table is cached, writes to EbayItem invalidate it
+TABLE_CACHE_SECONDS = 3600
+
+# Reads of the item pages, the REST list and the exports go to this alias
+# when it is configured in DATABASES, see ebayItems.routers
+DATABASE_ROUTERS = ['ebayItems.routers.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# Reads of a client stay on the primary for so many seconds after it wrote
+REPLICA_PIN_SECONDS = 5
+# Largest replication lag in seconds the replica is read with, None to not
+# check the lag (needs the REPLICATION CLIENT privilege)
+REPLICA_MAX_LAG = None
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
@@ -104,6 +131,98 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# Periodic sync -> status -> Badewanne pipeline
+# Number of worker processes for the partitioned pipeline, 1 runs it serially
+PIPELINE_WORKERS = int(os.getenv('DJANGO_PIPELINE_WORKERS', '1'))
+# Partitioning of status transitions and pricing, 'country_channel' or 'hash'.
+# The diff is always partitioned by the item_no hash.
+PIPELINE_PARTITION_BY = os.getenv('DJANGO_PIPELINE_PARTITION_BY', 'country_channel')
+# item_no hash partitions of the diff and of the leases. Leased cycles filter
+# on the indexed item bucket when the count divides models.ITEM_BUCKETS (256),
+# other counts compute item_no modulo the count for every row.
+PIPELINE_HASH_PARTITIONS = 16
+PIPELINE_PARALLEL_MIN_ITEMS = 10000
+# Seconds between two pipeline runs
+PIPELINE_CYCLE_SECONDS = 900
+# Lease based partition ownership, lets the workers of several nodes share the
+# pipeline. Every node then runs `run_worker`, which schedules the pipeline on
+# the PIPELINE_NODE_NAME queue and processes that queue. The node name is
+# required with leases, it has to be unique and stable across restarts.
+PIPELINE_LEASES = os.getenv('DJANGO_PIPELINE_LEASES', 'false').lower() == 'true'
+PIPELINE_LEASE_SECONDS = 300
+PIPELINE_NODE_NAME = os.getenv('DJANGO_PIPELINE_NODE_NAME')
+# Items a tracking run claimed and did not price for this long belong to a
+# run that died, the next tracking run returns them to their status
+BADEWANNE_CLAIM_SECONDS = 3600
+# Queue of the background lane, the pipeline runs there unless leases are on
+BACKGROUND_QUEUE = os.getenv('DJANGO_BACKGROUND_QUEUE', 'background')
+# Queue of the interactive lane. The tracking of items moved in the table view
+# runs there, served by `run_worker --lane interactive` or the reserved
+# process of `run_worker --lane all`, never behind the pipeline.
+INTERACTIVE_QUEUE = os.getenv('DJANGO_INTERACTIVE_QUEUE', 'interactive')
+# Seconds of completed tasks the wait times per lane are taken from
+TASK_LANE_STATS_SECONDS = 3600
+# Progress of the pipeline jobs, published to the shared cache for the item
+# page, which polls it every PROGRESS_POLL_SECONDS. Rows are written at most
+# every PROGRESS_PUBLISH_SECONDS, a job is kept for PROGRESS_TTL after its
+# last write.
+PROGRESS_PUBLISH_SECONDS = 1.0
+PROGRESS_TTL = 86400
+PROGRESS_POLL_SECONDS = 5
+# Server-Sent Events of the progress instead of polling, off by default. An
+# event stream holds a web worker for PROGRESS_STREAM_SECONDS, enable it only
+# behind an asynchronous server or workers dedicated to /progress/stream/.
+PROGRESS_STREAM = os.getenv('DJANGO_PROGRESS_STREAM', 'false').lower() == 'true'
+PROGRESS_STREAM_SECONDS = 60
+PROGRESS_STREAM_INTERVAL = 2.0
+# Local Arrow snapshots of the BIServer data. The sync diffs against the
+# previous snapshot instead of reading the ebayitem table. Disabled when unset.
+BISERVER_SNAPSHOT_DIR = os.getenv('DJANGO_BISERVER_SNAPSHOT_DIR')
+BISERVER_SNAPSHOT_RETENTION = 5
+# A full diff against the ebayitem table runs when the last snapshot is older
+BISERVER_SNAPSHOT_MAX_AGE = 86400
+# and at least this often while the syncs keep the snapshots fresh. A snapshot
+# diff only sees what changed in BIServer, items edited locally by the
+# pipeline, the admin or the api drift from BIServer until a full diff
+# overwrites them, 0 diffs against the table on every sync
+BISERVER_SNAPSHOT_FULL_DIFF_SECONDS = 21600
+# Opt-in tracemalloc profiling of the pipeline runs, a JSON report with peak
+# and retained memory per phase is written here per run. Disabled when unset.
+PIPELINE_MEMORY_PROFILE_DIR = os.getenv('DJANGO_PIPELINE_MEMORY_PROFILE_DIR')
+# Allocation sites reported per phase
+PIPELINE_MEMORY_PROFILE_TOP = 10
+# Items missing from BIServer for this many consecutive syncs are moved to the
+# archive table and restored when they reappear. 0 keeps them in place.
+ARCHIVE_MISSING_CYCLES = int(os.getenv('DJANGO_ARCHIVE_MISSING_CYCLES', '3'))
+ARCHIVE_BATCH_SIZE = 500
+# A sync missing more than this share of the items is not counted
+ARCHIVE_MAX_MISSING_SHARE = 0.5
+# MySQL partitioning of the ebayitem table by country, 'key' or 'list', the
+# default of the partition_item_table command. To change it later merge the
+# partitions with "partition_item_table --merge" and partition again. 'list'
+# needs every country of BIServer in ITEM_PARTITION_COUNTRIES, by partition
+# name.
+ITEM_PARTITIONING = os.getenv('DJANGO_ITEM_PARTITIONING') or None
+ITEM_PARTITION_COUNT = 16
+ITEM_PARTITION_COUNTRIES = {}
+
+# Request profiling, off unless one of the first two is set. A fraction of
+# the requests runs under cProfile, requests slower than REQUEST_PROFILE_SLOW_MS
+# keep their sampled stacks. Listed for staff under /profiles/.
+REQUEST_PROFILE_SAMPLE_RATE = float(os.getenv('DJANGO_REQUEST_PROFILE_SAMPLE_RATE', '0'))
+REQUEST_PROFILE_SLOW_MS = (float(os.environ['DJANGO_REQUEST_PROFILE_SLOW_MS'])
+                           if os.getenv('DJANGO_REQUEST_PROFILE_SLOW_MS') else None)
+# Seconds between two stack samples of a request
+REQUEST_PROFILE_INTERVAL = 0.005
+REQUEST_PROFILE_KEEP = 500
+# Slow SQL of requests and background tasks, off when unset. Statements slower
+# than SLOW_SQL_MS are stored with their call site and EXPLAIN, aggregated by
+# normalized statement. Listed for staff under /slow-queries/.
+SLOW_SQL_MS = (float(os.environ['DJANGO_SLOW_SQL_MS'])
+               if os.getenv('DJANGO_SLOW_SQL_MS') else None)
+# Distinct slow statements captured per request or task
+SLOW_SQL_CAPTURE_LIMIT = 100
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -16,4 +16,12 @@ DATABASES['default'].update({
     'PASSWORD': os.getenv('DJANGO_DB_PASSWORD'),
     'HOST': os.getenv('DJANGO_DB_HOST'),
     'PORT': os.getenv('DJANGO_DB_PORT')
-})
\ No newline at end of file
+})
+
+if os.getenv('DJANGO_DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=os.getenv('DJANGO_DB_REPLICA_HOST'),
+        PORT=os.getenv('DJANGO_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'}
+    )
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include
-from ebayItems.tasks import ebay_badewanne_update
 
 
 urlpatterns = [
@@ -9,5 +8,3 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework'))
 ]
-
-ebay_badewanne_update(repeat=900, repeat_until=None)
\ No newline at end of file
@@ -0,0 +1,5 @@
+"""
+    Benchmarks of the ebayItems pipeline and web layer.
+    Run them from the Backend directory, e.g.
+    python -m benchmarks.bench_parallel_pipeline
+"""
@@ -0,0 +1,74 @@
+"""
+    Threshold sweep of the badewanne simulator over a synthetic catalog.
+
+    python -m benchmarks.bench_badewanne_simulator [rows]
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .harness import setup_django, timed, print_table
+
+
+def synthetic_catalog_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a frame of the simulator CATALOG_COLUMNS
+    :param rows: number of rows
+    :param seed: random seed
+    :return: pandas dataframe
+    """
+    from ebayItems.models import BWStageEnum
+
+    rng = np.random.RandomState(seed)
+    purchase = np.round(rng.uniform(5, 300, size=rows), 2)
+    current = np.round(purchase * rng.uniform(1.3, 2.5, size=rows), 2)
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'item_status': rng.choice([stage.value for stage in BWStageEnum], size=rows),
+        'sales_goal_reached_in_last7days': np.round(rng.uniform(0, 200, size=rows), 2),
+        'sales_goal_reached_in_last14days': np.round(rng.uniform(0, 200, size=rows), 2),
+        'cogs_24h_vs_7d': np.round(rng.uniform(0, 100, size=rows), 2),
+        'item_ranking_today': rng.randint(1, 502, size=rows),
+        'our_purchase_price': purchase,
+        'current_sale_price': current,
+        'last_humansetprice_before_badewanne': np.round(current * 1.1, 2),
+    })
+
+
+def main(rows: int = 200000) -> None:
+    """
+    Run the benchmark
+    :param rows: number of rows
+    :return: None
+    """
+    setup_django()
+    from ebayItems import simulator
+
+    results = {}
+    frame = synthetic_catalog_frame(rows)
+    with timed(results, 'catalog'):
+        catalog = simulator.catalog_from_frame(frame)
+    combinations = simulator.threshold_grid(
+        first_threshold=[80.0, 85.0, 90.0, 95.0, 100.0],
+        second_threshold=[90.0, 100.0, 110.0],
+        stage2_rank=[30, 50, 70],
+        stage2_cogs=[20.0, 30.0, 40.0],
+        increase_10percent=[110.0, 120.0, 130.0, 140.0],
+    )
+    with timed(results, 'sweep'):
+        summaries = simulator.sweep(catalog, combinations)
+    print('rows: {}, combinations: {}, catalog {:.3f}s, sweep {:.3f}s'.format(
+        rows, len(combinations), results['catalog'], results['sweep']))
+    best = summaries.sort_values('revenue_delta', ascending=False).head(5)
+    print_table(
+        ['first', 'second', 'rank2', 'cogs2', 'inc10', 'moved', 'revenue_delta'],
+        [[row.first_threshold, row.second_threshold, row.stage2_rank, row.stage2_cogs,
+          row.increase_10percent, row.moved, '{:.2f}'.format(row.revenue_delta)]
+         for row in best.itertuples()]
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+"""
+    Memory footprint of the BIServer frame as `SELECT *` with inferred
+    dtypes against the projected frame with the explicit BISERVER_SCHEMA.
+
+    python -m benchmarks.bench_biserver_frame [rows]
+"""
+
+import sys
+
+import numpy as np
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+# Columns of vFactEbayPrices the sync does not use, approximated
+UNUSED_COLUMNS = 12
+
+
+def main(rows: int = 200000) -> None:
+    """
+    Run the benchmark
+    :param rows: number of rows
+    :return: None
+    """
+    setup_django()
+    from ebayItems import tasks
+
+    select_all = synthetic_biserver_frame(rows)
+    select_all['Channel'] = select_all['Channel'].astype(object)
+    select_all['Country'] = select_all['Country'].astype(object)
+    rng = np.random.RandomState(1)
+    for index in range(UNUSED_COLUMNS):
+        if index % 3:
+            select_all['Unused{}'.format(index)] = rng.uniform(0, 100, size=rows)
+        else:
+            select_all['Unused{}'.format(index)] = rng.choice(['a', 'bb', 'ccc'], size=rows)
+    projected = select_all[list(tasks.BISERVER_SCHEMA)].copy()
+
+    results = {}
+    with timed(results, 'coerce'):
+        coerced = tasks.coerce_biserver_frame(select_all)
+    print('rows: {}, coercion took {:.3f}s'.format(rows, results['coerce']))
+    print_table(
+        ['frame', 'columns', 'MiB'],
+        [[name, frame.shape[1], '{:.1f}'.format(tasks.frame_memory_usage(frame) / 2 ** 20)]
+         for name, frame in [('SELECT * inferred', select_all),
+                             ('projected inferred', projected),
+                             ('projected schema', coerced)]]
+    )
+    print_table(['column', 'inferred', 'schema'],
+                [[column, str(projected[column].dtype), str(coerced[column].dtype)]
+                 for column in tasks.BISERVER_SCHEMA])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
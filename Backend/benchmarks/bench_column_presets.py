@@ -0,0 +1,71 @@
+"""
+    Time and size of one rendered table page for every column preset. The
+    page is rendered the way FilteredEbayItemListView does it, with the
+    projected queryset, and all data is rolled back afterwards.
+
+    python -m benchmarks.bench_column_presets [rows] [per_page] [repeats]
+"""
+
+import sys
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back the benchmark data
+    """
+
+
+def main(rows: int = 20000, per_page: int = 500, repeats: int = 5) -> None:
+    """
+    Run the benchmark
+    :param rows: number of items
+    :param per_page: rows of the rendered page
+    :param repeats: number of renderings per preset
+    :return: None
+    """
+    setup_django()
+    from django.db import transaction
+    from django.test import RequestFactory
+    from django_tables2 import RequestConfig
+    from ebayItems import tasks
+    from ebayItems.models import EbayItem
+    from ebayItems.tables import COLUMN_PRESETS, EbayItemTable, preset_exclude, preset_fields
+
+    daily = tasks.coerce_biserver_frame(synthetic_biserver_frame(rows))
+    daily['ItemDescription'] = daily['ItemDescription'].str.pad(600, fillchar='x')
+    request = RequestFactory().get('/', {'sort': 'item_no', 'per_page': per_page})
+    results, sizes = {}, {}
+    try:
+        with transaction.atomic():
+            EbayItem.objects.bulk_create(
+                [tasks.ebay_item_from_row(row) for row in daily.to_dict('records')],
+                batch_size=500
+            )
+            for preset in COLUMN_PRESETS:
+                for repeat in range(repeats):
+                    with timed(results, '{} {}'.format(preset, repeat)):
+                        table = EbayItemTable(
+                            EbayItem.objects.only(*preset_fields(preset)),
+                            exclude=preset_exclude(preset),
+                            sequence=['selection'] + preset_fields(preset)
+                        )
+                        RequestConfig(request).configure(table)
+                        sizes[preset] = len(table.as_html(request).encode('utf-8'))
+            raise Rollback()
+    except Rollback:
+        pass
+
+    print('items: {}, page of {}, best of {}'.format(rows, per_page, repeats))
+    print_table(['preset', 'columns', 'seconds', 'kilobytes'], [
+        [preset, len(preset_fields(preset)),
+         '{:.3f}'.format(min(results['{} {}'.format(preset, repeat)]
+                             for repeat in range(repeats))),
+         '{:.0f}'.format(sizes[preset] / 1024)]
+        for preset in COLUMN_PRESETS
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
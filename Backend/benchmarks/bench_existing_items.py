@@ -0,0 +1,81 @@
+"""
+    Time and memory of loading the existing items with str(query) and
+    read_sql_query against the typed cursor loader. The items are created
+    inside a transaction which is rolled back afterwards.
+
+    python -m benchmarks.bench_existing_items [rows]
+"""
+
+import sys
+import tracemalloc
+
+import pandas as pd
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back the benchmark data
+    """
+
+
+def measure(results: dict, name: str, load) -> pd.DataFrame:
+    """
+    Run a loader and record its wall clock time and peak memory
+    :param results: dict collecting the measurements
+    :param name: name of the loader
+    :param load: loader without arguments
+    :return: loaded frame
+    """
+    with timed(results, name):
+        frame = load()
+    # tracing slows down allocations, so the peak is taken in a second run
+    tracemalloc.start()
+    load()
+    results[name + ' peak'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return frame
+
+
+def main(rows: int = 100000) -> None:
+    """
+    Run the benchmark
+    :param rows: number of rows
+    :return: None
+    """
+    setup_django()
+    from django.db import connection, transaction
+    from ebayItems import tasks
+    from ebayItems.models import EbayItem
+
+    daily = tasks.coerce_biserver_frame(synthetic_biserver_frame(rows))
+    results = {}
+    try:
+        with transaction.atomic():
+            EbayItem.objects.bulk_create(
+                [tasks.ebay_item_from_row(row) for row in daily.to_dict('records')],
+                batch_size=500
+            )
+            read_sql = measure(results, 'read_sql_query', lambda: pd.read_sql_query(
+                str(EbayItem.objects.values('id', 'item_no', 'auction_id', 'item_status').query),
+                connection
+            ))
+            typed = measure(results, 'typed cursor', tasks.get_all_django_exist_items)
+            raise Rollback()
+    except Rollback:
+        pass
+
+    print('rows: {}'.format(rows))
+    print_table(
+        ['loader', 'seconds', 'peak MiB', 'frame MiB', 'columns'],
+        [[name, '{:.3f}'.format(results[name]),
+          '{:.1f}'.format(results[name + ' peak'] / 2 ** 20),
+          '{:.1f}'.format(tasks.frame_memory_usage(frame) / 2 ** 20),
+          ' '.join(frame.columns)]
+         for name, frame in [('read_sql_query', read_sql), ('typed cursor', typed)]]
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
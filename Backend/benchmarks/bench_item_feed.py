@@ -0,0 +1,75 @@
+"""
+    Full catalog pull through the paged item API against the NDJSON feed:
+    requests, queries, time and peak Python memory to read every item. The
+    items are inserted into the configured database and deleted afterwards.
+
+    python -m benchmarks.bench_item_feed [rows]
+"""
+
+import sys
+import tracemalloc
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+
+def main(rows: int = 20000) -> None:
+    """
+    Run the benchmark
+    :param rows: number of items
+    :return: None
+    """
+    setup_django()
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from ebayItems import tasks
+    from ebayItems.models import EbayItem
+    from ebayItems.views import EbayItemsFeedView, EbayItemsListView
+
+    daily = tasks.coerce_biserver_frame(synthetic_biserver_frame(rows))
+    first_id = (EbayItem.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    EbayItem.objects.bulk_create(
+        [tasks.ebay_item_from_row(row) for row in daily.to_dict('records')], batch_size=500
+    )
+    factory = RequestFactory()
+    list_view, feed_view = EbayItemsListView.as_view(), EbayItemsFeedView.as_view()
+    params = {'id': '', 'item_no': ''}
+    results, stats = {}, {}
+
+    def paged():
+        page, read = 1, 0
+        while True:
+            response = list_view(factory.get('/items/', dict(params, page=page)))
+            response.render()
+            read += len(response.data['results'])
+            if not response.data['next']:
+                return page, read
+            page += 1
+
+    def streamed():
+        response = feed_view(factory.get('/items/feed/', params))
+        return 1, sum(block.count(b'\n') for block in response.streaming_content)
+
+    try:
+        for name, pull in [('paged /items/', paged), ('NDJSON feed', streamed)]:
+            tracemalloc.start()
+            with override_settings(ALLOWED_HOSTS=['testserver']), \
+                    CaptureQueriesContext(connection) as queries, timed(results, name):
+                requests, read = pull()
+            query_count = len(queries)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            stats[name] = [requests, read, query_count, peak]
+    finally:
+        EbayItem.objects.filter(id__gte=first_id).delete()
+
+    print('items in the table: {} inserted'.format(rows))
+    print_table(['pull', 'requests', 'items', 'queries', 'seconds', 'peak MB'], [
+        [name, requests, read, query_count, '{:.2f}'.format(results[name]),
+         '{:.1f}'.format(peak / 2 ** 20)]
+        for name, (requests, read, query_count, peak) in stats.items()
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,90 @@
+"""
+    Several local worker processes sharing the catalog partitions through
+    leases in one database. Every process plays one node: it claims its
+    partitions, processes them (simulated work) and renews its leases. One
+    node is killed halfway to show the takeover after lease expiry. The run
+    fails if a partition is processed twice in one cycle.
+
+    python manage.py migrate && python -m benchmarks.bench_lease_nodes [nodes] [seconds]
+"""
+
+import collections
+import multiprocessing
+import sys
+import time
+
+from .harness import setup_django, print_table
+
+CYCLE_SECONDS = 4
+LEASE_SECONDS = 3
+PARTITIONS = 16
+WORK_SECONDS_PER_PARTITION = 0.05
+
+
+def run_node(name: str, seconds: float, results) -> None:
+    """
+    Play one worker node for a while
+    :param name: node name
+    :param seconds: how long the node runs
+    :param results: queue receiving (node, cycle, partition) per processed partition
+    :return: None
+    """
+    setup_django()
+    from django.test import override_settings
+    from ebayItems import leases
+
+    with override_settings(PIPELINE_CYCLE_SECONDS=CYCLE_SECONDS,
+                           PIPELINE_LEASE_SECONDS=LEASE_SECONDS,
+                           PIPELINE_HASH_PARTITIONS=PARTITIONS):
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            owned = leases.claim_partitions(name)
+            cycle = leases.current_cycle()
+            for partition in leases.start_cycle(name, owned, cycle):
+                time.sleep(WORK_SECONDS_PER_PARTITION)
+                results.put((name, cycle, partition))
+                leases.renew_partitions(name, owned)
+            time.sleep(0.2)
+
+
+def main(nodes: int = 3, seconds: float = 20) -> None:
+    """
+    Run the nodes and check the processed partitions
+    :param nodes: number of node processes
+    :param seconds: run time of every node
+    :return: None
+    """
+    setup_django()
+    from ebayItems.models import PartitionLease, PipelineNode
+    PartitionLease.objects.all().delete()
+    PipelineNode.objects.all().delete()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_node, args=('node-{}'.format(i), seconds, results))
+        for i in range(nodes)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(seconds / 2)
+    processes[0].terminate()
+    for process in processes:
+        process.join()
+
+    processed = []
+    while not results.empty():
+        processed.append(results.get())
+    per_cycle = collections.Counter((cycle, partition) for _, cycle, partition in processed)
+    duplicates = [key for key, count in per_cycle.items() if count > 1]
+    per_node = collections.Counter(name for name, _, _ in processed)
+    print_table(['node', 'partitions processed'], sorted(per_node.items()))
+    print('cycles: {}, partitions processed: {}, processed twice in a cycle: {}'.format(
+        len({cycle for _, cycle, _ in processed}), len(processed), len(duplicates)
+    ))
+    if duplicates:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*[float(arg) if index else int(arg) for index, arg in enumerate(sys.argv[1:])])
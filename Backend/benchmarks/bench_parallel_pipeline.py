@@ -0,0 +1,88 @@
+"""
+    Wall clock scaling of the partitioned pipeline with the number of
+    worker processes. Only the in-memory parts (diff, status transitions and
+    pricing preparation) are measured, no database is needed.
+
+    python -m benchmarks.bench_parallel_pipeline [rows]
+"""
+
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+
+def main(rows: int = 200000) -> None:
+    """
+    Run the benchmark
+    :param rows: catalog size
+    :return: None
+    """
+    setup_django()
+    from django.test import override_settings
+    from django.utils.timezone import get_current_timezone
+    from ebayItems import tasks
+    from ebayItems.models import EbayItem, BWStageEnum
+
+    items_new = synthetic_biserver_frame(rows)
+    items_old = items_new[['ItemNo', 'AuctionID']].iloc[:int(rows * 0.9)].copy()
+    items_old['id'] = np.arange(1, len(items_old) + 1)
+    now = datetime.datetime.now(tz=get_current_timezone())
+    statuses = np.array([stage.value for stage in BWStageEnum])
+    status_items = pd.DataFrame({
+        'id': np.arange(rows),
+        'item_no': items_new['ItemNo'].values,
+        'country': items_new['Country'].values,
+        'channel': items_new['Channel'].values,
+        'item_status': statuses[np.arange(rows) % len(statuses)],
+        'lrw': items_new['LRW'].values,
+        'stock': items_new['Bestand_Gesamt'].values,
+        'fc': items_new['FC'].values,
+        'item_ranking_today': items_new['PositionCurrentDay'].values,
+        'sales_goal_reached_in_last7days': items_new['SalesGoalReachedInLast7Days'].values,
+        'sales_goal_reached_in_last14days': items_new['SalesGoalReachedInLast14Days'].values,
+        'sales_goal_reached_mtd': items_new['FC_Erf_MTD'].values,
+        'last_bw_start_date': pd.Series([now - datetime.timedelta(days=40)] * rows),
+        'last_bw_end_date': pd.Series([now - datetime.timedelta(days=10)] * rows),
+    })
+    pricing_items = [
+        EbayItem(item_no=row.ItemNo, country=row.Country, channel=row.Channel,
+                 last_humansetprice_before_badewanne=row.CurrentSalePrice,
+                 our_purchase_price=row.OurPurchasePrice)
+        for row in items_new.itertuples()
+    ]
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    rows_out = []
+    baseline = None
+    for workers in worker_counts:
+        results = {}
+        with override_settings(PIPELINE_WORKERS=workers, PIPELINE_PARTITION_BY='hash',
+                               PIPELINE_HASH_PARTITIONS=max(workers * 2, 2)):
+            with timed(results, 'diff'):
+                tasks.diff_ebay_items(items_new, items_old)
+            with timed(results, 'status'):
+                tasks.status_transitions(status_items, now)
+            with timed(results, 'pricing'):
+                tasks.get_smart_prices(pricing_items, 0.3)
+        total = sum(results.values())
+        baseline = baseline or total
+        rows_out.append([
+            workers,
+            '{:.3f}'.format(results['diff']),
+            '{:.3f}'.format(results['status']),
+            '{:.3f}'.format(results['pricing']),
+            '{:.3f}'.format(total),
+            '{:.2f}x'.format(baseline / total),
+        ])
+    print('rows: {}, cores: {}'.format(rows, cores))
+    print_table(['workers', 'diff s', 'status s', 'pricing s', 'total s', 'speedup'], rows_out)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+"""
+    Overhead of the price history on forward_badewanne_stage and the time of
+    the history lookup of many items. The pricing api is replaced by an
+    always successful response and all data is rolled back afterwards.
+
+    python -m benchmarks.bench_price_history [rows] [repeats]
+"""
+
+import sys
+from unittest import mock
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+
+class Rollback(Exception):
+    """
+    Raised to roll back the benchmark data
+    """
+
+
+def main(rows: int = 20000, repeats: int = 3) -> None:
+    """
+    Run the benchmark
+    :param rows: number of items repriced per stage application
+    :param repeats: number of stage applications per variant
+    :return: None
+    """
+    setup_django()
+    from django.db import transaction
+    from ebayItems import history, tasks
+    from ebayItems.models import EbayItem, BWStageEnum
+
+    daily = tasks.coerce_biserver_frame(synthetic_biserver_frame(rows))
+    response = mock.Mock(json=mock.Mock(return_value={'HasErrors': False}))
+    results = {}
+    try:
+        with transaction.atomic(), \
+                mock.patch.object(tasks, 'execute_ebay_batch_pricing_api', return_value=response):
+            EbayItem.objects.bulk_create(
+                [tasks.ebay_item_from_row(row) for row in daily.to_dict('records')],
+                batch_size=500
+            )
+            for repeat in range(repeats):
+                with timed(results, 'without history {}'.format(repeat)), \
+                        mock.patch.object(history, 'record_price_changes'):
+                    tasks.forward_badewanne_stage(list(EbayItem.objects.all()),
+                                                  BWStageEnum.BW_STAGE1_30D, 0.3)
+                with timed(results, 'with history {}'.format(repeat)):
+                    tasks.forward_badewanne_stage(list(EbayItem.objects.all()),
+                                                  BWStageEnum.BW_STAGE1_30D, 0.3)
+            item_ids = list(EbayItem.objects.values_list('id', flat=True)[:1000])
+            with timed(results, 'lookup'):
+                history.get_price_history(item_ids, last=2)
+            raise Rollback()
+    except Rollback:
+        pass
+
+    without = min(results['without history {}'.format(repeat)] for repeat in range(repeats))
+    with_history = min(results['with history {}'.format(repeat)] for repeat in range(repeats))
+    print('items: {}, best of {}'.format(rows, repeats))
+    print_table(['variant', 'seconds'], [
+        ['without history', '{:.3f}'.format(without)],
+        ['with history', '{:.3f}'.format(with_history)],
+        ['overhead', '{:.1f}%'.format((with_history / without - 1) * 100)],
+        ['last 2 changes of 1000 items', '{:.3f}'.format(results['lookup'])],
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
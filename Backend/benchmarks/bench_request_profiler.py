@@ -0,0 +1,58 @@
+"""
+    Overhead of RequestProfilerMiddleware on requests which are not stored:
+    a view running a few queries, called directly, through the middleware in
+    slow request mode (below the threshold) and with a cProfile sample rate of
+    zero after sampling once. Nothing is written to the database.
+
+    python -m benchmarks.bench_request_profiler [requests] [queries] [repeats]
+"""
+
+import sys
+
+from .harness import setup_django, timed, print_table
+
+
+def main(requests: int = 2000, queries: int = 5, repeats: int = 5) -> None:
+    """
+    Run the benchmark
+    :param requests: number of requests per variant
+    :param queries: queries per request
+    :param repeats: rounds over all variants, the best round counts
+    :return: None
+    """
+    setup_django()
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from ebayItems import profiling
+    from ebayItems.models import EbayItem
+
+    def view(request):  # pylint: disable=unused-argument
+        for _ in range(queries):
+            EbayItem.objects.filter(id=0).exists()
+        return HttpResponse('ok')
+
+    with override_settings(REQUEST_PROFILE_SAMPLE_RATE=0, REQUEST_PROFILE_SLOW_MS=60000):
+        slow_mode = profiling.RequestProfilerMiddleware(view)
+    with override_settings(REQUEST_PROFILE_SAMPLE_RATE=1e-9, REQUEST_PROFILE_SLOW_MS=None):
+        sample_mode = profiling.RequestProfilerMiddleware(view)
+    request = RequestFactory().get('/items/')
+    variants = [('plain view', view), ('slow request mode', slow_mode),
+                ('sample rate mode', sample_mode)]
+    results, best = {}, {}
+    for _ in range(repeats):
+        for name, handler in variants:
+            with timed(results, name):
+                for _ in range(requests):
+                    handler(request)
+            best[name] = min(best.get(name, results[name]), results[name])
+
+    print('requests: {}, queries per request: {}, best of {}'.format(requests, queries, repeats))
+    print_table(['variant', 'ms per request', 'overhead'], [
+        [name, '{:.3f}'.format(best[name] / requests * 1000),
+         '{:.1f}%'.format((best[name] / best['plain view'] - 1) * 100)]
+        for name, _ in variants
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
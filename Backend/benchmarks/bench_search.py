@@ -0,0 +1,67 @@
+"""
+    Time of the item search on the configured database: description words,
+    SKU prefix and the search combined with a range filter. The items are
+    committed, because InnoDB updates a FULLTEXT index at commit only, and
+    deleted afterwards.
+
+    python -m benchmarks.bench_search [rows] [repeats]
+"""
+
+import sys
+
+import numpy as np
+
+from .harness import setup_django, synthetic_biserver_frame, timed, print_table
+
+WORDS = ['Klarstein', 'oneConcept', 'Einkochtopf', 'Kühlschrank', 'Mikrowelle', 'Heizlüfter',
+         'Standventilator', 'Gefrierschrank', 'Edelstahl', 'schwarz', 'weiß', 'Liter']
+
+QUERIES = [
+    ('description words', {'search': 'Klarstein Einkochtopf'}),
+    ('description prefix', {'search': 'Gefrier'}),
+    ('sku prefix', {'search': '1000123'}),
+    ('words and rank < 50', {'search': 'Edelstahl schwarz', 'rank': '50', 'rank_lookup': 'lt'}),
+]
+
+
+def main(rows: int = 100000, repeats: int = 5) -> None:
+    """
+    Run the benchmark
+    :param rows: number of items
+    :param repeats: number of runs per query
+    :return: None
+    """
+    setup_django()
+    from ebayItems import tasks
+    from ebayItems.models import EbayItem, EbayItemsFilter
+
+    rng = np.random.RandomState(0)
+    daily = tasks.coerce_biserver_frame(synthetic_biserver_frame(rows))
+    daily['ItemDescription'] = [' '.join(rng.choice(WORDS, size=4, replace=False))
+                                for _ in range(rows)]
+    first_id = (EbayItem.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    EbayItem.objects.bulk_create(
+        [tasks.ebay_item_from_row(row) for row in daily.to_dict('records')], batch_size=500
+    )
+    results, counts = {}, {}
+    try:
+        items = EbayItem.objects.filter(id__gte=first_id)
+        for name, data in QUERIES:
+            for repeat in range(repeats):
+                with timed(results, '{} {}'.format(name, repeat)):
+                    counts[name] = len(EbayItemsFilter(data, queryset=items).qs[:50]
+                                       .values_list('id', flat=True))
+    finally:
+        EbayItem.objects.filter(id__gte=first_id).delete()
+
+    print('items: {}, best of {}, first page of 50'.format(rows, repeats))
+    print_table(['query', 'rows', 'milliseconds'], [
+        [name, counts[name],
+         '{:.1f}'.format(min(results['{} {}'.format(name, repeat)]
+                             for repeat in range(repeats)) * 1000)]
+        for name, _ in QUERIES
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+"""
+    Startup cost of a web process: import time and RSS of wsgi.application
+    with its URLconf loaded, as a web worker has it after the first request.
+    The before variant also imports ebayItems.tasks, as Backend/urls.py did
+    before the web and worker entry points were split. Every round starts
+    fresh interpreters.
+
+    python -m benchmarks.bench_startup [repeats]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from .harness import print_table
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pymssql', 'requests', 'pyarrow']
+
+CHILD = '''
+import json, os, sys, time
+started = time.perf_counter()
+from Backend.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+if sys.argv[1] == 'before':
+    import ebayItems.tasks
+seconds = time.perf_counter() - started
+with open('/proc/self/status') as status:
+    rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+print(json.dumps({'seconds': seconds, 'rss_kb': rss,
+                  'heavy': [name for name in sys.argv[2:] if name in sys.modules]}))
+'''
+
+
+def measure(variant: str) -> dict:
+    """
+    Start wsgi.application in a fresh interpreter
+    :param variant: 'before' or 'after'
+    :return: seconds, rss_kb and loaded heavy modules
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.dev_settings')
+    output = subprocess.run([sys.executable, '-c', CHILD, variant] + HEAVY_MODULES,
+                            env=env, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(repeats: int = 5) -> None:
+    """
+    Run the benchmark
+    :param repeats: interpreters started per variant, the fastest counts
+    :return: None
+    """
+    variants = [('before: web imports tasks', 'before'), ('after: web only', 'after')]
+    best = {}
+    for _ in range(repeats):
+        for _, variant in variants:
+            result = measure(variant)
+            if variant not in best or result['seconds'] < best[variant]['seconds']:
+                best[variant] = result
+
+    print('best of {} interpreter starts'.format(repeats))
+    print_table(['variant', 'startup ms', 'RSS MB', 'heavy modules loaded'], [
+        [name, '{:.0f}'.format(best[variant]['seconds'] * 1000),
+         '{:.1f}'.format(best[variant]['rss_kb'] / 1024),
+         ', '.join(best[variant]['heavy']) or '-']
+        for name, variant in variants
+    ])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,85 @@
+"""
+    Small harness shared by the benchmarks: django setup, synthetic
+    BIServer data, timing and result tables.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+import django
+import numpy as np
+import pandas as pd
+
+
+def setup_django(settings_module: str = 'Backend.dev_settings') -> None:
+    """
+    Configure django the same way manage.py does
+    :param settings_module: default settings module
+    :return: None
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def synthetic_biserver_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a frame shaped like vFactEbayPrices
+    :param rows: number of rows
+    :param seed: random seed
+    :return: pandas dataframe
+    """
+    rng = np.random.RandomState(seed)
+    countries = np.array(['DE', 'FR', 'IT', 'ES', 'UK', 'AT'])
+    item_no = 10000000 + rng.randint(0, rows // 2 + 1, size=rows)
+    purchase = np.round(rng.uniform(5, 300, size=rows), 2)
+    return pd.DataFrame({
+        'ItemNo': item_no,
+        'eBayItemID': rng.randint(10000, 99999, size=rows).astype(str),
+        'AuctionID': (100000000000 + np.arange(rows)).astype(str),
+        'SKU': ['{};0'.format(no) for no in item_no],
+        'ItemDescription': ['Klarstein item {}'.format(no) for no in item_no],
+        'SalesGoalReachedInLast14Days': np.round(rng.uniform(0, 200, size=rows), 2),
+        'SalesGoalReachedInLast7Days': np.round(rng.uniform(0, 200, size=rows), 2),
+        'FC_Erf_MTD': np.round(rng.uniform(0, 200, size=rows), 2),
+        'Channel': rng.choice(['ebay', 'ebay-plus'], size=rows),
+        'Country': rng.choice(countries, size=rows),
+        'OurPurchasePrice': purchase,
+        'CurrentSalePrice': np.round(purchase * rng.uniform(1.3, 2.5, size=rows), 2),
+        'SuggestedSalePrice': np.round(purchase * 1.6, 2),
+        'DIO1': rng.randint(0, 300, size=rows),
+        'DIO2': rng.randint(0, 300, size=rows),
+        'Bestand_Gesamt': rng.randint(0, 2000, size=rows),
+        'LRW': rng.randint(0, 400, size=rows),
+        'FC': rng.randint(0, 200, size=rows),
+        'PositionCurrentDay': rng.randint(1, 502, size=rows),
+        'COGS24HVS7D': np.round(rng.uniform(0, 100, size=rows), 2),
+    })
+
+
+@contextmanager
+def timed(results: Dict[str, float], name: str):
+    """
+    Measure the wall clock time of the block into results[name]
+    :param results: dict collecting timings
+    :param name: name of the measurement
+    """
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
+
+
+def print_table(header: List[str], rows: List[list]) -> None:
+    """
+    Print a plain text result table
+    :param header: column names
+    :param rows: table rows
+    :return: None
+    """
+    cells = [[str(cell) for cell in row] for row in [header] + rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    for index, row in enumerate(cells):
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if index == 0:
+            print('  '.join('-' * width for width in widths))
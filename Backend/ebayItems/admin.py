@@ -3,7 +3,146 @@
 """
 
 from django.contrib import admin
-from .models import EbayItem
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-# Register your models here.
-admin.site.register(EbayItem)
+from .models import EbayItem, BWStageEnum
+from .search import search_items
+from . import transitions
+
+# Unfiltered changelists of tables with more rows than this show the row
+# estimate of the database instead of counting
+ESTIMATED_COUNT_ABOVE = 100000
+
+
+def estimated_row_count(items) -> int:
+    """
+    Row estimate of the table of items from the statistics of MySQL
+    :param items: queryset
+    :return: estimated rows or None when unknown
+    """
+    db_connection = connections[items.db]
+    if db_connection.vendor != 'mysql':
+        return None
+    with db_connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [items.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class DeferredJoinPaginator(Paginator):
+    """
+    Paginator which reads a page by its primary keys first, a deferred join.
+    The keys of the page are selected with OFFSET on the index of the
+    ordering and the rows of the page are loaded by key afterwards.
+
+    This is not seek pagination: the database still walks every index entry
+    before the page, so a page costs in proportion to its number. It only
+    saves reading the full rows of the skipped entries. The admin links
+    pages by number with any ordering, which rules out seeking by the last
+    key. Unfiltered lists of big tables are not counted.
+    """
+
+    @cached_property
+    def count(self):
+        """
+            Number of items, estimated for big unfiltered tables
+        :return: count
+        """
+        if not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list)
+            if estimate is not None and estimate > ESTIMATED_COUNT_ABOVE:
+                return estimate
+        return super().count
+
+    def page(self, number):
+        """
+            Page of the items, loaded by the keys of the page
+        :param number: page number
+        :return: Page
+        """
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        keys = list(self.object_list.values_list('pk', flat=True)[bottom:bottom + self.per_page])
+        return self._get_page(self.object_list.filter(pk__in=keys), number, self)
+
+
+class ItemStatusListFilter(admin.SimpleListFilter):
+    """
+    Filter by the status values, the choices of the field hold enum members
+    """
+    title = 'status'
+    parameter_name = 'item_status'
+
+    def lookups(self, request, model_admin):
+        """
+            All statuses
+        :param request:
+        :param model_admin:
+        :return: list of value and label
+        """
+        return [(tag.value, tag.value) for tag in BWStageEnum]
+
+    def queryset(self, request, queryset):
+        """
+            Items of the chosen status
+        :param request:
+        :param queryset:
+        :return: queryset
+        """
+        if self.value():
+            return queryset.filter(item_status=self.value())
+        return queryset
+
+
+@admin.register(EbayItem)
+class EbayItemAdmin(admin.ModelAdmin):
+    """
+    Changelist of the items which stays fast on millions of rows
+    """
+    list_display = ['item_no', 'sku', 'country', 'item_status', 'stock',
+                    'item_ranking_today', 'current_sale_price', 'last_bw_start_date']
+    list_filter = [ItemStatusListFilter, 'country']
+    search_fields = ['sku']
+    ordering = ['-id']
+    list_per_page = 100
+    paginator = DeferredJoinPaginator
+    show_full_result_count = False
+    actions = ['start_badewanne', 'stop_badewanne']
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+            Search the description words and SKU prefix through their indexes
+        :param request:
+        :param queryset:
+        :param search_term:
+        :return: queryset and whether it may contain duplicates
+        """
+        return search_items(queryset, search_term), False
+
+    def start_badewanne(self, request, queryset):
+        """
+            Start the badewanne of the selected ready items
+        :param request:
+        :param queryset:
+        :return: None
+        """
+        ids = transitions.start_badewanne(queryset)
+        self.message_user(request, "Badewanne started for {} items.".format(len(ids)))
+    start_badewanne.short_description = "Start Badewanne"
+
+    def stop_badewanne(self, request, queryset):
+        """
+            Stop the badewanne of the selected items in a stage
+        :param request:
+        :param queryset:
+        :return: None
+        """
+        ids = transitions.stop_badewanne(queryset)
+        self.message_user(request, "Badewanne stopped for {} items.".format(len(ids)))
+    stop_badewanne.short_description = "Stop Badewanne"
@@ -0,0 +1,162 @@
+"""
+This module keeps the ebayitem table to the live listings. Every sync counts
+for each item in how many consecutive cycles it was missing from BIServer.
+Items missing for ARCHIVE_MISSING_CYCLES cycles are moved to the archive table
+in batches, items of the archive which reappear in BIServer are moved back
+under their old id before the sync writes their new values.
+"""
+
+import datetime
+import logging
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import get_current_timezone
+
+from . import catalog
+from .models import ArchivedEbayItem, EbayItem, EbayItemFields
+
+LOGGER = logging.getLogger(__name__)
+
+# Item fields copied between the live and the archive table
+ARCHIVED_FIELDS = [field.name for field in EbayItemFields._meta.concrete_fields]
+
+
+def get_missing_cycles() -> int:
+    """
+    Consecutive syncs an item is missing before it is archived
+    :return: cycles, archiving is off when 0
+    """
+    return getattr(settings, 'ARCHIVE_MISSING_CYCLES', 3)
+
+
+def get_batch_size() -> int:
+    """
+    Items moved per transaction
+    :return: int
+    """
+    return getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+
+
+def get_max_missing_share() -> float:
+    """
+    Share of the live items which may be missing in one sync. More missing
+    items point to an incomplete BIServer result, nothing is counted then.
+    :return: share between 0 and 1
+    """
+    return getattr(settings, 'ARCHIVE_MAX_MISSING_SHARE', 0.5)
+
+
+def batches(ids: np.ndarray):
+    """
+    Split ids into lists of at most the batch size
+    :param ids: array of ids
+    :return: iterator of lists
+    """
+    size = get_batch_size()
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size].tolist()
+
+
+def count_missing(live_ids: np.ndarray, seen_ids: np.ndarray) -> np.ndarray:
+    """
+    Count a missing cycle for the live items not seen in the sync and reset
+    the count of the seen ones
+    :param live_ids: ids of the items the sync covered
+    :param seen_ids: ids of the items present in BIServer
+    :return: ids of the missing items
+    """
+    missing = np.setdiff1d(live_ids, seen_ids)
+    if len(missing) > get_max_missing_share() * len(live_ids):
+        LOGGER.warning("%s of %s items missing from BIServer, the result looks incomplete "
+                       "and is not counted", len(missing), len(live_ids))
+        return np.array([], dtype=np.int64)
+    counted = np.array(EbayItem.objects.filter(missing_cycles__gt=0)
+                       .values_list('id', flat=True), dtype=np.int64)
+    returned = np.setdiff1d(np.intersect1d(counted, live_ids), missing)
+    for batch in batches(returned):
+        EbayItem.objects.filter(id__in=batch).update(missing_cycles=0)
+    for batch in batches(missing):
+        EbayItem.objects.filter(id__in=batch).update(missing_cycles=F('missing_cycles') + 1)
+    return missing
+
+
+def archive_items(ids: np.ndarray) -> int:
+    """
+    Move the items among ids missing long enough to the archive, stamped
+    with the catalog version of their removal
+    :param ids: ids of missing items
+    :return: number of archived items
+    """
+    now = datetime.datetime.now(tz=get_current_timezone())
+    archived = 0
+    for batch in batches(ids):
+        with transaction.atomic():
+            rows = list(EbayItem.objects.select_for_update().filter(
+                id__in=batch, missing_cycles__gte=get_missing_cycles()
+            ).values('id', *ARCHIVED_FIELDS))
+            if not rows:
+                continue
+            version = catalog.next_version()
+            ArchivedEbayItem.objects.bulk_create(
+                [ArchivedEbayItem(archived_at=now, catalog_version=version, **row)
+                 for row in rows]
+            )
+            EbayItem.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        archived += len(rows)
+    if archived:
+        LOGGER.info("Archived %s items missing from BIServer", archived)
+    return archived
+
+
+def archive_missing_items(live_ids: np.ndarray, seen_ids: np.ndarray) -> int:
+    """
+    Count the missing cycles after a sync and archive the items missing
+    for ARCHIVE_MISSING_CYCLES cycles
+    :param live_ids: ids of the items the sync covered
+    :param seen_ids: ids of the items present in BIServer
+    :return: number of archived items
+    """
+    if not get_missing_cycles() or not len(seen_ids):
+        return 0
+    return archive_items(count_missing(np.asarray(live_ids, dtype=np.int64),
+                                       np.asarray(seen_ids, dtype=np.int64)))
+
+
+def restore_items(keys: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Move the archived items with the keys of new BIServer rows back to the
+    live table under their old ids
+    :param keys: ItemNo and AuctionID of the rows which are not live
+    :return: positions in keys of the restored rows and their ids
+    """
+    if keys.empty or not ArchivedEbayItem.objects.exists():
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    positions = dict(zip(zip(keys['ItemNo'].tolist(), keys['AuctionID'].tolist()),
+                         range(len(keys))))
+    found = {}
+    item_nos = np.unique(keys['ItemNo'].values)
+    for batch in batches(item_nos):
+        for item in ArchivedEbayItem.objects.filter(item_no__in=batch).order_by('id'):
+            position = positions.get((item.item_no, item.auction_id))
+            if position is not None:
+                found.setdefault(position, item)
+    if not found:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    items = list(found.values())
+    for start in range(0, len(items), get_batch_size()):
+        batch = items[start:start + get_batch_size()]
+        with transaction.atomic():
+            EbayItem.objects.bulk_create([
+                EbayItem(id=item.id, **{name: getattr(item, name) for name in ARCHIVED_FIELDS})
+                for item in batch
+            ])
+            ArchivedEbayItem.objects.filter(id__in=[item.id for item in batch]).delete()
+    LOGGER.info("Restored %s archived items which reappeared in BIServer", len(items))
+    order = np.argsort(list(found))
+    return (np.array(list(found), dtype=np.int64)[order],
+            np.array([item.id for item in items], dtype=np.int64)[order])
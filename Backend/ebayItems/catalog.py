@@ -0,0 +1,81 @@
+"""
+This module keeps a version number of the item catalog in the CatalogVersion
+row of the database, so that all web and worker nodes share it. Every write
+to EbayItem increments it inside its transaction, cached renderings of the
+items are keyed by the version and never have to be deleted one by one. The
+written rows are stamped with the version, so that feeds can deliver the rows
+changed since a version.
+"""
+
+import hashlib
+import time
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+
+CATALOG_VERSION_ID = 1
+
+
+def new_version() -> int:
+    """
+    Start value of the version, a timestamp so that a recreated counter row
+    never repeats an earlier version
+    :return: version
+    """
+    return int(time.time() * 1000)
+
+
+def get_catalog_version() -> int:
+    """
+    Current version of the catalog, read from the database the item reads
+    are routed to, so that it matches the rows read with it. Reading never
+    writes, without the counter row, which migration 0011 creates, it is a
+    fresh start value below the one the next write creates the row with.
+    :return: version
+    """
+    model = apps.get_model('ebayItems', 'CatalogVersion')
+    version = model.objects.filter(pk=CATALOG_VERSION_ID).values_list('version', flat=True).first()
+    return new_version() if version is None else version
+
+
+def next_version(using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Increment the version. The counter row stays locked until the surrounding
+    transaction ends, so concurrent writers get increasing versions in the
+    order they commit.
+    :param using: database alias of the write
+    :return: the new version
+    """
+    model = apps.get_model('ebayItems', 'CatalogVersion')
+    counter = model.objects.using(using).filter(pk=CATALOG_VERSION_ID)
+    with transaction.atomic(using=using, savepoint=False):
+        if not counter.update(version=F('version') + 1):
+            model.objects.using(using).get_or_create(
+                pk=CATALOG_VERSION_ID, defaults={'version': new_version()}
+            )
+            counter.update(version=F('version') + 1)
+        return counter.values_list('version', flat=True).get()
+
+
+def catalog_changed(using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Bump the version of a write without stamped rows, inside its transaction
+    so that the new version becomes visible with the write at the commit
+    :param using: database alias of the write
+    :return: None
+    """
+    next_version(using)
+
+
+def cache_key(prefix: str, params: dict) -> str:
+    """
+    Cache key of a rendering for the current version
+    :param prefix: name of the rendering
+    :param params: parameters the rendering depends on, empty values are dropped
+    :return: cache key
+    """
+    normalized = '&'.join('{}={}'.format(name, value) for name, value in sorted(params.items())
+                          if value not in (None, ''))
+    return '{}:{}:{}'.format(prefix, get_catalog_version(),
+                             hashlib.md5(normalized.encode('utf-8')).hexdigest())
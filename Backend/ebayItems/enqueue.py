@@ -0,0 +1,215 @@
+"""
+This module enqueues the background tasks without importing them. The task
+functions live in ebayItems.tasks together with pandas, numpy, pymssql and
+requests, which only the worker processes need. Web processes write the task
+rows through this module, the worker started by `manage.py run_worker` imports
+the tasks and runs them.
+
+Tasks run in two lanes. The tracking of items users moved goes to the
+interactive lane, served by its own worker, so that it never waits behind the
+periodic pipeline of the background lane. Both lanes have a named queue, a
+worker of one lane never runs the tasks of the other. A tracking request merges its ids
+into the pending tracking task, so that a burst of clicks is evaluated once.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+from typing import Dict, List
+
+from background_task.models import Task
+from background_task.models_completed import CompletedTask
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Min, query
+from django.utils import timezone
+
+LOGGER = logging.getLogger(__name__)
+
+PIPELINE_TASK = 'ebayItems.tasks.ebay_badewanne_update'
+TRACKING_TASK = 'ebayItems.tasks.badewanne_process_tracking'
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BACKGROUND = 'background'
+LANES = [LANE_INTERACTIVE, LANE_BACKGROUND]
+
+
+def get_background_queue() -> str:
+    """
+    Queue of the background lane without leases
+    :return: queue name
+    """
+    return getattr(settings, 'BACKGROUND_QUEUE', 'background')
+
+
+def get_pipeline_queue() -> str:
+    """
+    Queue of the pipeline task, the node queue when leases are on. Without a
+    node name the worker would process every queue, it refuses to start.
+    :return: queue name
+    :raises ImproperlyConfigured: when leases are on without PIPELINE_NODE_NAME
+    """
+    if not getattr(settings, 'PIPELINE_LEASES', False):
+        return get_background_queue()
+    node = getattr(settings, 'PIPELINE_NODE_NAME', None)
+    if not node:
+        raise ImproperlyConfigured('PIPELINE_LEASES needs PIPELINE_NODE_NAME, '
+                                   'the queue of the pipeline on this node')
+    return node
+
+
+def get_interactive_queue() -> str:
+    """
+    Queue of the interactive lane
+    :return: queue name
+    """
+    return getattr(settings, 'INTERACTIVE_QUEUE', 'interactive')
+
+
+def get_lane_queue(lane: str):
+    """
+    Queue a worker of the lane processes
+    :param lane: LANE_INTERACTIVE or LANE_BACKGROUND
+    :return: queue name
+    :raises ValueError: on unknown lanes
+    """
+    if lane == LANE_INTERACTIVE:
+        return get_interactive_queue()
+    if lane == LANE_BACKGROUND:
+        return get_pipeline_queue()
+    raise ValueError('Unknown task lane: {}'.format(lane))
+
+
+def lane_tasks(tasks: query.QuerySet, lane: str) -> query.QuerySet:
+    """
+    Tasks of a lane
+    :param tasks: queryset of Task or CompletedTask
+    :param lane: LANE_INTERACTIVE or LANE_BACKGROUND
+    :return: queryset
+    """
+    return tasks.filter(queue=get_lane_queue(lane))
+
+
+def schedule(task_name: str, args: list = None, kwargs: dict = None, delay: float = 0,
+             queue: str = None, repeat: int = None) -> Task:
+    """
+    Create the row of a task like calling the task function of background_task
+    :param task_name: module path of the task function
+    :param args: positional arguments of the task
+    :param kwargs: keyword arguments of the task
+    :param delay: seconds until the task runs
+    :param queue: queue name or None
+    :param repeat: seconds between repetitions or None
+    :return: Task
+    """
+    task = Task.objects.new_task(
+        task_name, args, kwargs, run_at=timezone.now() + datetime.timedelta(seconds=delay),
+        queue=queue, repeat=repeat
+    )
+    task.save()
+    return task
+
+
+def badewanne_process_tracking(ids: List[int], delay: float = 0) -> Task:
+    """
+    Enqueue the tracking of the items in the interactive lane. The ids are
+    merged into a tracking task no worker has started yet, which keeps its
+    run_at, otherwise a new task is added.
+    :param ids: item ids
+    :param delay: seconds until the tracking runs
+    :return: Task
+    """
+    queue = get_interactive_queue()
+    with transaction.atomic(using=Task.objects.db):
+        pending = Task.objects.unlocked(timezone.now()).select_for_update().filter(
+            task_name=TRACKING_TASK, queue=queue, failed_at=None
+        ).order_by('run_at')
+        for task in pending:
+            args, kwargs = json.loads(task.task_params)
+            if kwargs or len(args) != 1 or not isinstance(args[0], list):
+                continue
+            merged = sorted(set(args[0]) | set(ids))
+            if len(merged) > len(args[0]):
+                set_params(task, [merged], {})
+                task.save(update_fields=['task_params', 'task_hash'])
+            LOGGER.info("Merged %s items into pending tracking task %s", len(ids), task.pk)
+            return task
+        return schedule(TRACKING_TASK, [ids], delay=delay, queue=queue)
+
+
+def set_params(task: Task, args: list, kwargs: dict) -> None:
+    """
+    Replace the arguments of a task and its hash like new_task computes them
+    :param task: Task
+    :param args: positional arguments
+    :param kwargs: keyword arguments
+    :return: None
+    """
+    task.task_params = json.dumps((args, kwargs), sort_keys=True)
+    task.task_hash = hashlib.sha1(
+        '{}{}'.format(task.task_name, task.task_params).encode('utf-8')
+    ).hexdigest()
+
+
+def adopt_unqueued_tasks() -> int:
+    """
+    Move the tasks without a queue, enqueued before the lanes had named
+    queues, to the pipeline queue. A worker only processes its named queue.
+    :return: number of moved tasks
+    """
+    moved = Task.objects.unlocked(timezone.now()).filter(queue=None).update(
+        queue=get_pipeline_queue()
+    )
+    if moved:
+        LOGGER.info("Moved %s tasks without a queue to %s", moved, get_pipeline_queue())
+    return moved
+
+
+def schedule_pipeline() -> bool:
+    """
+    Enqueue the repeating pipeline unless it is scheduled on its queue already
+    :return: whether it was enqueued
+    """
+    queue = get_pipeline_queue()
+    if Task.objects.filter(task_name=PIPELINE_TASK, queue=queue).exists():
+        return False
+    schedule(PIPELINE_TASK, queue=queue, repeat=settings.PIPELINE_CYCLE_SECONDS)
+    LOGGER.info("Pipeline scheduled every %s seconds on queue %s",
+                settings.PIPELINE_CYCLE_SECONDS, queue)
+    return True
+
+
+def lane_stats(now: datetime.datetime = None) -> Dict[str, dict]:
+    """
+    Queue depth and wait time of every lane. A task waits from its run_at
+    until a worker locks it, the completed tasks of the last
+    TASK_LANE_STATS_SECONDS give the recent waits.
+    :param now: point of time, defaults to now
+    :return: dict of lane to its figures
+    """
+    now = now or timezone.now()
+    expired = now - datetime.timedelta(seconds=getattr(settings, 'MAX_RUN_TIME', 3600))
+    since = now - datetime.timedelta(seconds=getattr(settings, 'TASK_LANE_STATS_SECONDS', 3600))
+    stats = {}
+    for lane in LANES:
+        tasks = lane_tasks(Task.objects.filter(failed_at=None), lane)
+        pending = tasks.filter(run_at__lte=now).exclude(locked_at__gt=expired)
+        oldest = pending.aggregate(oldest=Min('run_at'))['oldest']
+        waits = [
+            (locked_at - run_at).total_seconds() for run_at, locked_at in
+            lane_tasks(CompletedTask.objects, lane)
+            .filter(locked_at__gte=since).values_list('run_at', 'locked_at')
+        ]
+        stats[lane] = {
+            'queue': get_lane_queue(lane),
+            'pending': pending.count(),
+            'scheduled': tasks.filter(run_at__gt=now).count(),
+            'running': tasks.filter(locked_at__gt=expired).count(),
+            'oldest_wait_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+            'completed': len(waits),
+            'mean_wait_seconds': sum(waits) / len(waits) if waits else 0.0,
+            'max_wait_seconds': max(waits, default=0.0),
+        }
+    return stats
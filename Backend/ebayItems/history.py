@@ -0,0 +1,127 @@
+"""
+This module keeps the price history of the items. Every application of a
+badewanne stage appends one row per successfully repriced item in bulk, the
+history of many items is read back with one query over the (item, ts) index.
+"""
+
+import datetime
+import logging
+from typing import Dict, Iterator, List
+
+from django.db import connections, router
+from django.db.models import F, Window, query
+from django.db.models.functions import RowNumber
+from django.utils.timezone import get_current_timezone
+
+from .models import EbayItem, EbayItemPriceHistory, BWStageEnum
+
+LOGGER = logging.getLogger(__name__)
+
+HISTORY_FIELDS = ['item', 'ts', 'old_price', 'new_price', 'stage', 'reason']
+# Fields of the changes read back
+CHANGE_FIELDS = ['item_id', 'ts', 'old_price', 'new_price', 'stage', 'reason']
+
+
+def record_price_changes(items: List[EbayItem], old_prices: Dict[int, float],
+                         stage: BWStageEnum, reason: str,
+                         now: datetime.datetime = None) -> None:
+    """
+    Append the price changes of the items to the history
+    :param items: repriced items, new_price holds the price set
+    :param old_prices: item id to the price before the change
+    :param stage: stage the items are forwarded to
+    :param reason: reason of the price change
+    :param now: point of time of the change, defaults to now
+    :return: None
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    if not items:
+        return
+    # plain executemany, which the MySQL driver turns into multi row inserts,
+    # keeps the overhead on the pricing path low
+    db_connection = connections[router.db_for_write(EbayItemPriceHistory)]
+    quote_name = db_connection.ops.quote_name
+    columns = [EbayItemPriceHistory._meta.get_field(field).column for field in HISTORY_FIELDS]
+    ts = db_connection.ops.adapt_datetimefield_value(now)
+    with db_connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+                quote_name(EbayItemPriceHistory._meta.db_table),
+                ', '.join(quote_name(column) for column in columns),
+                ', '.join(['%s'] * len(columns))
+            ),
+            [(item.id, ts, old_prices[item.id], item.new_price, stage.value, reason)
+             for item in items]
+        )
+
+
+def get_price_history(item_ids: List[int], last: int = 10) -> Dict[int, List[dict]]:
+    """
+    The last changes of many items with one query, newest first. Only the
+    last changes of every item are read, numbered per item by ROW_NUMBER()
+    over the (item, ts) index, or each taken with its own LIMIT in a UNION on
+    backends without window functions.
+    :param item_ids: list of item id
+    :param last: number of changes per item
+    :return: item id to list of changes
+    """
+    history = {item_id: [] for item_id in item_ids}
+    if not item_ids or last < 1:
+        return history
+    changes = EbayItemPriceHistory.objects.filter(item_id__in=item_ids)
+    if connections[changes.db].features.supports_over_clause:
+        rows = ranked_changes(changes, last)
+    else:
+        rows = limited_changes(changes, item_ids, last)
+    for row in rows:
+        history[row[0]].append(dict(zip(CHANGE_FIELDS, row)))
+    return history
+
+
+def ranked_changes(changes: query.QuerySet, last: int) -> Iterator[tuple]:
+    """
+    Rows of the last changes of every item by their row number
+    :param changes: queryset of EbayItemPriceHistory
+    :param last: number of changes per item
+    :return: iterator of CHANGE_FIELDS tuples, by item and newest first
+    """
+    changes = changes.annotate(position=Window(
+        RowNumber(), partition_by=[F('item_id')], order_by=[F('ts').desc(), F('id').desc()]
+    )).values_list(*CHANGE_FIELDS, 'position')
+    compiler = changes.query.get_compiler(using=changes.db)
+    sql, params = compiler.as_sql()
+    quote_name = compiler.connection.ops.quote_name
+    with compiler.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT * FROM ({}) {} WHERE {position} <= %s ORDER BY {}, {position}'.format(
+                sql, quote_name('ranked'), quote_name('item_id'), position=quote_name('position')
+            ), params + (last,)
+        )
+        yield from compiler.results_iter(results=[cursor.fetchall()])
+
+
+def limited_changes(changes: query.QuerySet, item_ids: List[int],
+                    last: int) -> Iterator[tuple]:
+    """
+    Rows of the last changes of every item, one LIMIT per item in a UNION ALL
+    :param changes: queryset of EbayItemPriceHistory
+    :param item_ids: list of item id
+    :param last: number of changes per item
+    :return: iterator of CHANGE_FIELDS tuples, newest first
+    """
+    parts, params = [], []
+    for item_id in sorted(set(item_ids)):
+        compiler = changes.filter(item_id=item_id).order_by('-ts', '-id').values_list(
+            *CHANGE_FIELDS, 'id'
+        )[:last].query.get_compiler(using=changes.db)
+        sql, part_params = compiler.as_sql()
+        # a derived table, the members of a UNION can not have a LIMIT of their own
+        parts.append('SELECT * FROM ({}) {}'.format(
+            sql, compiler.connection.ops.quote_name('part{}'.format(len(parts)))
+        ))
+        params.extend(part_params)
+    with compiler.connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(parts), params)
+        rows = list(compiler.results_iter(results=[cursor.fetchall()]))
+    # a derived table does not keep its order through the union
+    return iter(sorted(rows, key=lambda row: (row[1], row[-1]), reverse=True))
@@ -0,0 +1,252 @@
+"""
+This module lets several worker nodes share the periodic pipeline. The
+catalog is split into item_no hash partitions and every node owns the
+partitions it holds a time limited lease on. A node renews its leases while
+it works; when it dies the leases expire and other nodes pick them up.
+Every partition is processed at most once per pipeline cycle, no matter
+how often its lease changes hands.
+"""
+
+import datetime
+import logging
+import math
+import os
+import socket
+import time
+from typing import List
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils.timezone import get_current_timezone
+
+from .models import ITEM_BUCKETS, EbayItem, PartitionLease, PipelineNode
+from .parallel import get_hash_partitions
+
+LOGGER = logging.getLogger(__name__)
+
+
+def leases_enabled() -> bool:
+    """
+    Whether the pipeline runs in lease mode
+    :return: bool
+    """
+    return bool(getattr(settings, 'PIPELINE_LEASES', False))
+
+
+def get_lease_duration() -> datetime.timedelta:
+    """
+    How long a lease is valid without being renewed
+    :return: lease duration
+    """
+    return datetime.timedelta(seconds=getattr(settings, 'PIPELINE_LEASE_SECONDS', 300))
+
+
+def get_node_name() -> str:
+    """
+    Name of this worker node as lease owner
+    :return: node name
+    """
+    return getattr(settings, 'PIPELINE_NODE_NAME', None) or '{}:{}'.format(
+        socket.gethostname(), os.getpid()
+    )
+
+
+def current_cycle(now: datetime.datetime = None) -> int:
+    """
+    Number of the pipeline cycle the point of time falls into
+    :param now: point of time, defaults to now
+    :return: cycle number
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    return int(now.timestamp() // getattr(settings, 'PIPELINE_CYCLE_SECONDS', 900))
+
+
+def ensure_partitions() -> None:
+    """
+    Create the lease rows of all partitions which do not exist yet
+    :return: None
+    """
+    num_partitions = get_hash_partitions()
+    existing = set(PartitionLease.objects.values_list('partition', flat=True))
+    PartitionLease.objects.bulk_create(
+        [PartitionLease(partition=partition) for partition in range(num_partitions)
+         if partition not in existing],
+        ignore_conflicts=True
+    )
+
+
+def claim_partitions(owner: str, now: datetime.datetime = None) -> List[int]:
+    """
+    Renew the leases and the heartbeat of the owner and claim expired
+    partitions up to a fair share of all partitions among the live nodes.
+    Partitions above the fair share are released so that newly started
+    nodes get their part.
+    :param owner: node name
+    :param now: point of time, defaults to now
+    :return: sorted list of partitions owned by owner
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    expires_at = now + get_lease_duration()
+    num_partitions = get_hash_partitions()
+    ensure_partitions()
+
+    PipelineNode.objects.update_or_create(name=owner, defaults={'expires_at': expires_at})
+    live_nodes = PipelineNode.objects.filter(expires_at__gt=now).count()
+    fair_share = int(math.ceil(num_partitions / max(1, live_nodes)))
+
+    owned = list(PartitionLease.objects.filter(
+        partition__lt=num_partitions, owner=owner, expires_at__gt=now
+    ).order_by('partition').values_list('partition', flat=True))
+    if len(owned) > fair_share:
+        release_partitions(owner, owned[fair_share:])
+        owned = owned[:fair_share]
+    PartitionLease.objects.filter(
+        owner=owner, partition__in=owned
+    ).update(expires_at=expires_at)
+
+    free = PartitionLease.objects.filter(
+        Q(expires_at__lte=now) | Q(owner=''),
+        partition__lt=num_partitions
+    ).order_by('partition').values_list('partition', flat=True)
+    for partition in free:
+        if len(owned) >= fair_share:
+            break
+        # compare and set, only one node wins a free partition
+        claimed = PartitionLease.objects.filter(
+            Q(expires_at__lte=now) | Q(owner=''),
+            partition=partition
+        ).update(owner=owner, expires_at=expires_at)
+        if claimed:
+            owned.append(partition)
+    LOGGER.info("Node %s owns partitions %s", owner, sorted(owned))
+    return sorted(owned)
+
+
+def renew_partitions(owner: str, partitions: List[int]) -> List[int]:
+    """
+    Extend the leases the owner still holds
+    :param owner: node name
+    :param partitions: partitions to renew
+    :return: sorted list of partitions which are still owned
+    """
+    now = datetime.datetime.now(tz=get_current_timezone())
+    leases = PartitionLease.objects.filter(
+        owner=owner, partition__in=partitions, expires_at__gt=now
+    )
+    still_owned = sorted(leases.values_list('partition', flat=True))
+    leases.update(expires_at=now + get_lease_duration())
+    PipelineNode.objects.filter(name=owner).update(expires_at=now + get_lease_duration())
+    return still_owned
+
+
+def release_partitions(owner: str, partitions: List[int]) -> None:
+    """
+    Give up the leases of the owner
+    :param owner: node name
+    :param partitions: partitions to release
+    :return: None
+    """
+    PartitionLease.objects.filter(owner=owner, partition__in=partitions).update(
+        owner='', expires_at=datetime.datetime.now(tz=get_current_timezone())
+    )
+
+
+def claim_all_partitions(owner: str, now: datetime.datetime = None) -> List[int]:
+    """
+    Claim every partition for a run over the whole catalog outside the
+    leased cycles, such as the sync_ebay_items command. The owner is not a
+    node and is left out of the fair share. Partitions leased by a node are
+    not taken over, all or nothing is claimed.
+    :param owner: name of the run
+    :param now: point of time, defaults to now
+    :return: sorted list of the partitions other owners hold, empty when
+    owner holds all partitions
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    ensure_partitions()
+    claimed = []
+    for partition in range(get_hash_partitions()):
+        # compare and set like claim_partitions, a lease held by a node is kept
+        if PartitionLease.objects.filter(
+                Q(expires_at__lte=now) | Q(owner='') | Q(owner=owner),
+                partition=partition
+        ).update(owner=owner, expires_at=now + get_lease_duration()):
+            claimed.append(partition)
+    held = sorted(set(range(get_hash_partitions())) - set(claimed))
+    if held:
+        release_partitions(owner, claimed)
+    return held
+
+
+def start_cycle(owner: str, partitions: List[int], cycle: int) -> List[int]:
+    """
+    Mark the owned partitions as processed in the cycle. A partition is only
+    returned once per cycle, so a partition taken over from a dead node is
+    not priced a second time in the same cycle.
+    :param owner: node name
+    :param partitions: partitions owned by owner
+    :param cycle: cycle number
+    :return: sorted list of partitions owner has to process in this cycle
+    """
+    started = []
+    for partition in partitions:
+        if PartitionLease.objects.filter(
+                partition=partition, owner=owner, last_cycle__lt=cycle
+        ).update(last_cycle=cycle):
+            started.append(partition)
+    return sorted(started)
+
+
+def partition_items(partitions: List[int]):
+    """
+    Items which belong to the partitions. A partition is the set of item
+    buckets with its remainder, so the filter uses the index of item_bucket
+    when the partition count divides ITEM_BUCKETS.
+    :param partitions: list of partitions
+    :return: queryset of EbayItem
+    """
+    num_partitions = get_hash_partitions()
+    if ITEM_BUCKETS % num_partitions:
+        return EbayItem.objects.annotate(
+            partition=Mod('item_no', num_partitions)
+        ).filter(partition__in=partitions)
+    partitions = set(partitions)
+    return EbayItem.objects.filter(item_bucket__in=[
+        bucket for bucket in range(ITEM_BUCKETS) if bucket % num_partitions in partitions
+    ])
+
+
+class LeaseRenewal:
+    """
+    Renewal of the leases of a node during its cycle, also from the progress
+    callback of a long phase, at most every third of the lease duration
+    """
+
+    def __init__(self, owner: str, partitions: List[int]):
+        self.owner = owner
+        self.partitions = partitions
+        self.renewed = time.monotonic()
+
+    def renew(self, stats=None) -> List[int]:  # pylint: disable=unused-argument
+        """
+        Renew the leases still held once a third of the lease duration passed
+        :param stats: PhaseStats when called as progress callback
+        :return: sorted list of partitions which are still owned
+        """
+        if time.monotonic() - self.renewed >= get_lease_duration().total_seconds() / 3:
+            self.renew_now()
+        return self.partitions
+
+    def renew_now(self) -> List[int]:
+        """
+        Renew the leases still held
+        :return: sorted list of partitions which are still owned
+        """
+        self.renewed = time.monotonic()
+        owned = renew_partitions(self.owner, self.partitions)
+        if owned != sorted(self.partitions):
+            LOGGER.warning("Node %s lost the leases of partitions %s", self.owner,
+                           sorted(set(self.partitions) - set(owned)))
+        self.partitions = owned
+        return owned
@@ -0,0 +1,70 @@
+"""
+    Partition the item table by country on MySQL or merge its partitions
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from ebayItems import partitioning
+from ebayItems.models import EbayItem
+
+
+class Command(BaseCommand):
+    """
+    Lay the ebayitem table out in partitions by country. Partitioning
+    rewrites the table, it is run once per database on purpose instead of by
+    a migration, so that migrating never depends on the settings of the host.
+    """
+    help = 'Partition the ebayitem table by country on MySQL or merge its partitions again'
+
+    def add_arguments(self, parser):
+        """
+            Partitioning to apply
+        :param parser:
+        :return: None
+        """
+        parser.add_argument('--by', choices=[partitioning.PARTITION_BY_KEY,
+                                             partitioning.PARTITION_BY_LIST],
+                            default=None, help='KEY or LIST COLUMNS partitioning, '
+                                               'ITEM_PARTITIONING by default')
+        parser.add_argument('--count', type=int, default=None,
+                            help='Number of KEY partitions, ITEM_PARTITION_COUNT by default')
+        parser.add_argument('--merge', action='store_true',
+                            help='Merge the partitions into a plain table again')
+        parser.add_argument('--database', default=None,
+                            help='Database alias, the write database of the items by default')
+
+    def handle(self, *args, **options):
+        """
+            Partition or merge the item table
+        :param args:
+        :param options:
+        :return: None
+        """
+        alias = options['database'] or router.db_for_write(EbayItem)
+        connection = connections[alias]
+        if connection.vendor != 'mysql':
+            raise CommandError('Partitioning needs MySQL, {} is {}'.format(alias,
+                                                                            connection.vendor))
+        if options['count'] is not None and options['count'] < 1:
+            raise CommandError('--count must be positive')
+        partitioned = partitioning.is_partitioned(alias, EbayItem._meta.db_table)
+        if options['merge']:
+            if not partitioned:
+                self.stdout.write('The item table is not partitioned')
+                return
+            with connection.schema_editor() as schema_editor:
+                partitioning.unpartition_table(schema_editor, EbayItem)
+            self.stdout.write('Item table partitions merged')
+            return
+        if partitioned:
+            raise CommandError('The item table is partitioned already, merge it first')
+        by = options['by'] or partitioning.get_partitioning()
+        if by is None:
+            raise CommandError('Choose --by key or list, or set ITEM_PARTITIONING')
+        try:
+            with connection.schema_editor() as schema_editor:
+                partitioning.partition_table(schema_editor, EbayItem, by, options['count'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write('Item table partitioned by {}'.format(by))
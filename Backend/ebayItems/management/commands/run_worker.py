@@ -0,0 +1,137 @@
+"""
+    Worker entry point: schedules the pipeline and processes the task queue
+"""
+
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ebayItems import enqueue
+
+LOGGER = logging.getLogger(__name__)
+
+LANE_ALL = 'all'
+
+
+class Command(BaseCommand):
+    """
+    Run the background tasks of the pipeline. The web processes only enqueue
+    tasks, this command imports ebayItems.tasks with its analytics libraries.
+    A worker serves the background lane, the interactive lane or both. With
+    both, every lane runs in a child process which is restarted when it dies.
+    A single lane runs in the foreground and is left to the process manager.
+    """
+    help = 'Schedule the repeating pipeline once and process the background tasks'
+
+    def add_arguments(self, parser):
+        """
+            Options passed on to process_tasks
+        :param parser:
+        :return: None
+        """
+        parser.add_argument('--lane', choices=enqueue.LANES + [LANE_ALL],
+                            default=enqueue.LANE_BACKGROUND,
+                            help='Lane to serve, all runs both lanes in supervised child '
+                                 'processes')
+        parser.add_argument('--duration', type=int, default=0,
+                            help='Seconds to run, 0 or less runs forever')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Seconds to wait when the queue is empty, with all lanes '
+                                 'also between two checks of the child processes')
+        parser.add_argument('--queue', default=None,
+                            help='Queue of the background lane, the pipeline queue by default')
+        parser.add_argument('--log-std', action='store_true', dest='log_std',
+                            help='Redirect stdout and stderr to the logging system')
+
+    def handle(self, *args, **options):
+        """
+            Import the tasks, schedule the pipeline and process the queue
+        :param args:
+        :param options:
+        :return: None
+        """
+        # registers the task functions with background_task
+        import ebayItems.tasks  # pylint: disable=import-outside-toplevel,unused-import
+        lane = options['lane']
+        if lane == enqueue.LANE_INTERACTIVE:
+            self.process(enqueue.get_interactive_queue(), options)
+            return
+        enqueue.adopt_unqueued_tasks()
+        if enqueue.schedule_pipeline():
+            self.stdout.write('Pipeline scheduled')
+        background = options['queue'] or enqueue.get_pipeline_queue()
+        if lane == LANE_ALL:
+            self.supervise([enqueue.get_interactive_queue(), background], options)
+            return
+        self.process(background, options)
+
+    def supervise(self, queues, options) -> None:
+        """
+            Process every queue in a child process, restarted when it exits,
+            until the duration is over or the worker is terminated
+        :param queues: queue names
+        :param options:
+        :return: None
+        """
+        # the children run until they are terminated
+        child_options = dict(options, duration=0)
+        started = time.monotonic()
+        children = {}
+        # stop the children when the worker is terminated
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                for queue in queues:
+                    child = children.get(queue)
+                    if child is not None and child.is_alive():
+                        continue
+                    if child is not None:
+                        LOGGER.warning("Worker of queue %s exited with %s, restarting it",
+                                       queue, child.exitcode)
+                    children[queue] = self.start_child(queue, child_options)
+                remaining = options['duration'] - (time.monotonic() - started)
+                if options['duration'] > 0 and remaining <= 0:
+                    return
+                time.sleep(options['sleep'] if options['duration'] <= 0
+                           else min(options['sleep'], remaining))
+        finally:
+            for child in children.values():
+                child.terminate()
+            for child in children.values():
+                child.join()
+            signal.signal(signal.SIGTERM, previous)
+
+    def start_child(self, queue, options):
+        """
+            Start a child process processing a queue
+        :param queue: queue name
+        :param options:
+        :return: the started process
+        """
+        # the child must not share the connections of the parent
+        connections.close_all()
+        # not daemonic, the process pool of a pipeline step forks from it,
+        # supervise terminates and joins the children when it ends
+        child = multiprocessing.get_context('fork').Process(
+            target=self.process, args=(queue, options), name='worker-{}'.format(queue),
+            daemon=False
+        )
+        child.start()
+        return child
+
+    @staticmethod
+    def process(queue, options) -> None:
+        """
+            Process the tasks of a queue
+        :param queue: queue name
+        :param options:
+        :return: None
+        """
+        call_command('process_tasks', duration=options['duration'], sleep=options['sleep'],
+                     queue=queue, log_std=options['log_std'])
@@ -0,0 +1,246 @@
+"""
+    Sync entry point for backfills, incident recovery and capacity tests
+"""
+
+import contextlib
+import os
+import socket
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from ebayItems import leases, parallel, progress, rules, simulator, snapshots, tasks, throughput
+from ebayItems.models import EbayItem
+
+PHASES = ['fetch', 'status', 'badewanne']
+# Seconds between two progress lines of a phase
+PROGRESS_INTERVAL = 1.0
+
+
+def read_source_file(path: str) -> pd.DataFrame:
+    """
+    BIServer rows stored in a file, CSV, Parquet or an Arrow snapshot
+    :param path: file path
+    :return: pandas dataframe coerced like the BIServer data
+    :raises CommandError: on unknown file types
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        frame = pd.read_csv(path)
+    elif extension == '.parquet':
+        frame = pd.read_parquet(path)
+    elif extension in ('.arrow', '.feather'):
+        frame = snapshots.read_snapshot(path)
+    else:
+        raise CommandError('Unknown source file type {}, use .csv, .parquet or .arrow'.format(
+            extension
+        ))
+    return tasks.coerce_biserver_frame(frame)
+
+
+class Command(BaseCommand):
+    """
+    Run the phases of the pipeline once in the foreground, printing and
+    publishing the progress of every phase and finally its throughput. In
+    lease mode the command holds the leases of all partitions while it
+    writes, it refuses to run while a worker node holds one.
+    """
+    help = 'Run the sync, status and Badewanne phases of the pipeline and report throughput'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_progress = 0.0
+        self.owner = None
+        self.last_renewal = 0.0
+
+    def add_arguments(self, parser):
+        """
+            Phases and how to run them
+        :param parser:
+        :return: None
+        """
+        parser.add_argument('--fetch', action='store_true',
+                            help='Fetch the BIServer rows and sync the item table')
+        parser.add_argument('--status', action='store_true',
+                            help='Maintain the item status lists')
+        parser.add_argument('--badewanne', action='store_true',
+                            help='Forward the Badewanne stages and change the prices')
+        parser.add_argument('--chunk-size', type=int, default=None, dest='chunk_size',
+                            help='Rows written per bulk statement of the sync, all at once '
+                                 'by default')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Pipeline worker processes, PIPELINE_WORKERS by default')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Report what the phases would change without writing or '
+                                 'calling the pricing api')
+        parser.add_argument('--country', action='append', dest='countries', default=None,
+                            help='Market of the status and Badewanne phases, repeat it for '
+                                 'several, all by default. The sync covers all markets')
+        parser.add_argument('--source', default='biserver',
+                            help="'biserver' or the path of a CSV, Parquet or Arrow file with "
+                                 "the BIServer rows")
+
+    def handle(self, *args, **options):
+        """
+            Run the chosen phases, all when none is chosen
+        :param args:
+        :param options:
+        :return: None
+        """
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+        phases = [name for name in PHASES if options[name]] or PHASES
+        publisher = progress.Publisher('sync_ebay_items', self.progress)
+        with self.leased(options), publisher.publishing() as meter:
+            for name in phases:
+                getattr(self, 'run_' + name)(options)
+                self.renew()
+                self.last_progress = 0.0
+        self.stdout.write(self.format_table(
+            ['phase', 'rows', 'seconds', 'rows/s', 'queries', 'api calls'], meter.table()
+        ))
+
+    @contextlib.contextmanager
+    def leased(self, options):
+        """
+            Hold the leases of all partitions while the phases write, so that
+            no leased cycle of a worker node syncs or prices meanwhile
+        :param options:
+        :return: context manager
+        :raises CommandError: when a worker node holds a partition
+        """
+        if not leases.leases_enabled() or options['dry_run']:
+            yield
+            return
+        owner = 'sync_ebay_items@{}:{}'.format(socket.gethostname(), os.getpid())
+        held = leases.claim_all_partitions(owner)
+        if held:
+            raise CommandError('Partitions {} are leased by the pipeline workers, stop them '
+                               'or wait until their leases expire'.format(held))
+        self.owner, self.last_renewal = owner, time.monotonic()
+        try:
+            yield
+        finally:
+            leases.release_partitions(owner, list(range(parallel.get_hash_partitions())))
+            self.owner = None
+
+    def renew(self) -> None:
+        """
+            Renew the leases of the command, at most every third of the lease
+            duration
+        :return: None
+        :raises CommandError: when the leases expired meanwhile
+        """
+        now = time.monotonic()
+        duration = leases.get_lease_duration().total_seconds()
+        if self.owner is None or now - self.last_renewal < duration / 3:
+            return
+        self.last_renewal = now
+        partitions = list(range(parallel.get_hash_partitions()))
+        if leases.renew_partitions(self.owner, partitions) != partitions:
+            raise CommandError('The partition leases expired, a worker node may have taken '
+                               'them over')
+
+    def run_fetch(self, options) -> None:
+        """
+            Fetch the source rows and sync the item table to them
+        :param options:
+        :return: None
+        """
+        with throughput.phase('fetch'):
+            if options['source'] == 'biserver':
+                frame = tasks.get_data_from_biserver()
+            else:
+                frame = read_source_file(options['source'])
+            throughput.advance(len(frame))
+        with throughput.phase('sync'):
+            if not options['dry_run']:
+                tasks.sync_biserver_frame(frame, chunk_size=options['chunk_size'],
+                                          workers=options['workers'])
+                return
+            throughput.expect(len(frame))
+            insert_positions, update_positions, _ = tasks.diff_ebay_items(
+                frame, tasks.get_all_django_exist_items(), options['workers']
+            )
+            throughput.advance(len(frame))
+        self.stdout.write('Dry run: {} rows to insert, {} rows to update'.format(
+            len(insert_positions), len(update_positions)
+        ))
+
+    def run_status(self, options) -> None:
+        """
+            Maintain the item status lists
+        :param options:
+        :return: None
+        """
+        with throughput.phase('status'):
+            if not options['dry_run']:
+                tasks.sync_items_status(workers=options['workers'],
+                                        countries=options['countries'])
+                return
+            changes = tasks.items_status_changes(workers=options['workers'],
+                                                 countries=options['countries'])
+            throughput.advance(len(changes))
+        for item_status, count in changes['item_status'].value_counts().sort_index().items():
+            self.stdout.write('Dry run: {} items to {}'.format(count, item_status))
+
+    def run_badewanne(self, options) -> None:
+        """
+            Forward the Badewanne stages, simulated without writes on a dry run
+        :param options:
+        :return: None
+        """
+        with throughput.phase('badewanne'):
+            if not options['dry_run']:
+                tasks.badewanne_process_tracking.now(workers=options['workers'],
+                                                     countries=options['countries'])
+                return
+            items = EbayItem.objects.all()
+            if options['countries']:
+                items = items.filter(country__in=options['countries'])
+            catalog = simulator.load_catalog(items)
+            throughput.expect(len(catalog.ids))
+            summary = simulator.summarize(catalog, rules.DEFAULT_THRESHOLDS,
+                                          simulator.simulate(catalog, rules.DEFAULT_THRESHOLDS))
+            throughput.advance(len(catalog.ids))
+        for rule in rules.BADEWANNE_RULES:
+            self.stdout.write('Dry run: {} items to {}'.format(summary[rule.target.value],
+                                                               rule.target.value))
+
+    def progress(self, stats: throughput.PhaseStats) -> None:
+        """
+            Print the progress of a phase, at most every PROGRESS_INTERVAL
+        :param stats:
+        :return: None
+        """
+        self.renew()
+        now = time.monotonic()
+        done = stats.total is not None and stats.rows >= stats.total
+        if not done and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        eta = stats.eta()
+        self.stdout.write('{}: {}{} rows, {:.0f} rows/s{}'.format(
+            stats.name, stats.rows, '' if stats.total is None else '/{}'.format(stats.total),
+            stats.rows_per_second, '' if eta is None else ', {:.0f}s left'.format(eta)
+        ))
+        self.stdout.flush()
+
+    @staticmethod
+    def format_table(header: list, rows: list) -> str:
+        """
+            Plain text table with right aligned numbers
+        :param header:
+        :param rows:
+        :return: table text
+        """
+        cells = [[str(cell) for cell in row] for row in [header] + rows]
+        widths = [max(len(row[column]) for row in cells) for column in range(len(header))]
+        lines = ['  '.join(cell.ljust(width) if column == 0 else cell.rjust(width)
+                           for column, (cell, width) in enumerate(zip(row, widths)))
+                 for row in cells]
+        lines.insert(1, '  '.join('-' * width for width in widths))
+        return '\n'.join(lines)
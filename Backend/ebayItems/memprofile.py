@@ -0,0 +1,263 @@
+"""
+This module profiles the memory of the background pipeline runs. When
+PIPELINE_MEMORY_PROFILE_DIR is set, every profiled run traces its allocations
+with tracemalloc and records per phase the memory at start and end, the
+retained and the peak memory. A snapshot of the traces costs time and memory
+in the size of the heap, so only the run and its top-level phases take one
+to report the allocation sites which grew most. Nested phases, which run
+once per chunk, read the traced memory only and a repeated one is reported
+once with its number of calls. The report of a run is written as JSON into
+the directory. When it is unset, phases are a shared null context and
+nothing is traced.
+"""
+
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+# Frames stored per allocation, one is enough to group by line
+TRACE_FRAMES = 1
+TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+# tracemalloc.reset_peak exists since Python 3.9, before the peak of a phase
+# is only known when it exceeds the peak of everything before
+RESET_PEAK = getattr(tracemalloc, 'reset_peak', None)
+# Phases up to this depth take snapshots, the run is at depth 0
+SNAPSHOT_DEPTH = 1
+
+_NULL_PHASE = contextlib.nullcontext()
+_ACTIVE = []
+
+
+def get_profile_dir():
+    """
+    Directory of the memory reports, profiling is off when None
+    :return: path or None
+    """
+    return getattr(settings, 'PIPELINE_MEMORY_PROFILE_DIR', None)
+
+
+def get_top_sites() -> int:
+    """
+    Number of allocation sites reported per phase
+    :return: int
+    """
+    return getattr(settings, 'PIPELINE_MEMORY_PROFILE_TOP', 10)
+
+
+class Phase:
+    """
+    Memory of one phase of a profiled run
+    """
+
+    def __init__(self, name: str, snapshot: bool = True, report: dict = None):
+        self.name = name
+        self.started = time.perf_counter()
+        self.snapshot = (tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+                         if snapshot else None)
+        self.start_bytes, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = self.start_bytes
+        # peak of the run before this phase, to tell whether the peak grew
+        self.prior_peak = peak
+        # report of the earlier calls of a repeated phase
+        self.report = report if report is not None else {'phase': name}
+
+    def child_started(self) -> None:
+        """
+        Account the peak up to the start of a nested phase
+        :return: None
+        """
+        self.peak_bytes = max(self.peak_bytes, self.traced_peak())
+        if RESET_PEAK is not None:
+            RESET_PEAK()
+
+    def child_finished(self, child: 'Phase') -> None:
+        """
+        Account the peak of a finished nested phase
+        :param child: Phase
+        :return: None
+        """
+        self.peak_bytes = max(self.peak_bytes, child.peak_bytes)
+
+    def traced_peak(self) -> int:
+        """
+        Peak since the last reset, without reset_peak the peak of the whole
+        run counts only when it grew during this phase
+        :return: bytes
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if RESET_PEAK is None and peak <= self.prior_peak:
+            return max(self.start_bytes, current)
+        return peak
+
+    def finish(self) -> dict:
+        """
+        Measure the end of the phase, a repeated phase adds up its time and
+        retained memory and keeps the highest peak
+        :return: phase report
+        """
+        end_bytes = tracemalloc.get_traced_memory()[0]
+        self.peak_bytes = max(self.peak_bytes, self.traced_peak(), end_bytes)
+        if RESET_PEAK is not None:
+            RESET_PEAK()
+        seconds = time.perf_counter() - self.started
+        if 'calls' in self.report:
+            self.report.update({
+                'calls': self.report['calls'] + 1,
+                'seconds': round(self.report['seconds'] + seconds, 3),
+                'end_bytes': end_bytes,
+                'retained_bytes': self.report['retained_bytes'] + end_bytes - self.start_bytes,
+                'peak_bytes': max(self.report['peak_bytes'], self.peak_bytes),
+            })
+            return self.report
+        self.report.update({
+            'calls': 1,
+            'seconds': round(seconds, 3),
+            'start_bytes': self.start_bytes,
+            'end_bytes': end_bytes,
+            'retained_bytes': end_bytes - self.start_bytes,
+            'peak_bytes': self.peak_bytes,
+        })
+        if self.snapshot is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+            top = snapshot.compare_to(self.snapshot, 'lineno')[:get_top_sites()]
+            self.snapshot = None
+            self.report['top_sites'] = [{
+                'site': '{}:{}'.format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size': stat.size,
+            } for stat in top]
+        return self.report
+
+
+class RunProfile:
+    """
+    Phases of one profiled run
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.datetime.now()
+        self.phases = []
+        self.stack = []
+        # reports of the nested phases by name, the calls of a chunk phase
+        # share one
+        self.nested = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Measure the block as phase name, nested in the current phase
+        :param name: phase name
+        """
+        if self.stack:
+            self.stack[-1].child_started()
+        name = self.stack[-1].name + '/' + name if self.stack else name
+        if len(self.stack) <= SNAPSHOT_DEPTH:
+            current = Phase(name)
+        else:
+            current = Phase(name, snapshot=False, report=self.nested.get(name))
+            self.nested[name] = current.report
+        # reports are listed in the order the phases first start
+        if 'calls' not in current.report:
+            self.phases.append(current.report)
+        self.stack.append(current)
+        try:
+            yield current
+        finally:
+            self.stack.pop()
+            current.finish()
+            if self.stack:
+                self.stack[-1].child_finished(current)
+
+    def write_report(self, directory: str) -> str:
+        """
+        Write the report of the run as JSON
+        :param directory: target directory
+        :return: path of the report
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}-{}.json'.format(
+            self.name, self.started_at.strftime('%Y%m%dT%H%M%S'), os.getpid()
+        ))
+        with open(path, 'w') as report:
+            json.dump({
+                'run': self.name,
+                'started_at': self.started_at.isoformat(),
+                'pid': os.getpid(),
+                'python': sys.version.split()[0],
+                'peak_exact': RESET_PEAK is not None,
+                'phases': self.phases,
+            }, report, indent=2)
+        return path
+
+
+def phase(name: str):
+    """
+    Context manager measuring a phase of the active run, a shared null
+    context when no run is profiled
+    :param name: phase name
+    :return: context manager
+    """
+    if not _ACTIVE:
+        return _NULL_PHASE
+    return _ACTIVE[-1].phase(name)
+
+
+@contextlib.contextmanager
+def profiled_run(name: str):
+    """
+    Profile the block as run name and write its report. Inside another
+    profiled run the block is a phase of it.
+    :param name: run name
+    """
+    if _ACTIVE:
+        with _ACTIVE[-1].phase(name):
+            yield
+        return
+    directory = get_profile_dir()
+    if not directory:
+        yield
+        return
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACE_FRAMES)
+    run = RunProfile(name)
+    _ACTIVE.append(run)
+    try:
+        with run.phase(name):
+            yield
+    finally:
+        _ACTIVE.pop()
+        if started_tracing:
+            tracemalloc.stop()
+        LOGGER.info("Memory profile of %s written to %s", name, run.write_report(directory))
+
+
+def profiled(name: str):
+    """
+    Decorator profiling every call of the function as run name
+    :param name: run name
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiled_run(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.4 on 2026-10-19 14:04
+
+import datetime
+from django.db import migrations, models
+from django.utils.timezone import utc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartitionLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.PositiveIntegerField(unique=True, verbose_name='Partition')),
+                ('owner', models.CharField(blank=True, default='', max_length=200, verbose_name='Owner')),
+                ('expires_at', models.DateTimeField(default=datetime.datetime(1969, 12, 31, 23, 7, tzinfo=utc), verbose_name='ExpiresAt')),
+                ('last_cycle', models.BigIntegerField(default=-1, verbose_name='LastCycle')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PipelineNode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Name')),
+                ('expires_at', models.DateTimeField(verbose_name='ExpiresAt')),
+            ],
+        ),
+    ]
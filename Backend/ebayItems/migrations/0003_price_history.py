@@ -0,0 +1,31 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import ebayItems.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0002_partition_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EbayItemPriceHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.DateTimeField(verbose_name='Timestamp')),
+                ('old_price', models.FloatField(verbose_name='OldPrice')),
+                ('new_price', models.FloatField(verbose_name='NewPrice')),
+                ('stage', models.CharField(choices=[(ebayItems.models.BWStageEnum('BW_STAGE0'), 'BW_STAGE0'), (ebayItems.models.BWStageEnum('BW_STAGE1_30D'), 'BW_STAGE1_30D'), (ebayItems.models.BWStageEnum('BW_STAGE2_20D'), 'BW_STAGE2_20D'), (ebayItems.models.BWStageEnum('BW_STAGE3_10D'), 'BW_STAGE3_10D'), (ebayItems.models.BWStageEnum('BW_STAGE4_0D'), 'BW_STAGE4_0D'), (ebayItems.models.BWStageEnum('BW_STAGE5_5I'), 'BW_STAGE5_5I'), (ebayItems.models.BWStageEnum('BW_STAGE6_10I'), 'BW_STAGE6_10I'), (ebayItems.models.BWStageEnum('BW_BLOCKED'), 'BW_BLOCKED'), (ebayItems.models.BWStageEnum('BW_TOBLOCK'), 'BW_TOBLOCK'), (ebayItems.models.BWStageEnum('BW_READY'), 'BW_READY'), (ebayItems.models.BWStageEnum('NORMAL'), 'NORMAL'), (ebayItems.models.BWStageEnum('LRW_LIST'), 'LRW_LIST')], max_length=15, verbose_name='Stage')),
+                ('reason', models.CharField(max_length=100, verbose_name='Reason')),
+                ('item', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='price_history', to='ebayItems.EbayItem', verbose_name='Item')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ebayitempricehistory',
+            index=models.Index(fields=['item', 'ts'], name='pricehistory_item_ts'),
+        ),
+    ]
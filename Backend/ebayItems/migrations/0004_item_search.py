@@ -0,0 +1,37 @@
+# Generated by Django 2.2.4 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    model = apps.get_model('ebayItems', 'EbayItem')
+    schema_editor.execute('CREATE FULLTEXT INDEX ebayitem_description_ft ON {} ({})'.format(
+        schema_editor.quote_name(model._meta.db_table),
+        schema_editor.quote_name(model._meta.get_field('item_description').column)
+    ))
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    model = apps.get_model('ebayItems', 'EbayItem')
+    schema_editor.execute('DROP INDEX ebayitem_description_ft ON {}'.format(
+        schema_editor.quote_name(model._meta.db_table)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0003_price_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ebayitem',
+            index=models.Index(fields=['sku'], name='ebayitem_sku'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
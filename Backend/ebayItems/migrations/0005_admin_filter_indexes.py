@@ -0,0 +1,21 @@
+# Generated by Django 2.2.4 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0004_item_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ebayitem',
+            index=models.Index(fields=['item_status', 'id'], name='ebayitem_status_id'),
+        ),
+        migrations.AddIndex(
+            model_name='ebayitem',
+            index=models.Index(fields=['country', 'id'], name='ebayitem_country_id'),
+        ),
+    ]
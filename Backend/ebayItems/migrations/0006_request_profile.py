@@ -0,0 +1,33 @@
+# Generated by Django 2.2.4 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0005_admin_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='StartedAt')),
+                ('method', models.CharField(max_length=10, verbose_name='Method')),
+                ('path', models.CharField(max_length=500, verbose_name='Path')),
+                ('query_string', models.TextField(blank=True, default='', verbose_name='QueryString')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='StatusCode')),
+                ('duration_ms', models.FloatField(verbose_name='DurationMs')),
+                ('sql_count', models.PositiveIntegerField(verbose_name='SQLCount')),
+                ('sql_ms', models.FloatField(verbose_name='SQLMs')),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile stats'), ('stacks', 'Collapsed stacks')], max_length=10, verbose_name='Mode')),
+                ('profile', models.TextField(verbose_name='Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['started_at'], name='requestprofile_started'),
+        ),
+    ]
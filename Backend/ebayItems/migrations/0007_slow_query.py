@@ -0,0 +1,31 @@
+# Generated by Django 2.2.4 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0006_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True, verbose_name='Fingerprint')),
+                ('statement', models.TextField(verbose_name='Statement')),
+                ('example', models.TextField(verbose_name='Example')),
+                ('call_sites', models.TextField(verbose_name='CallSites')),
+                ('last_call_site', models.CharField(max_length=300, verbose_name='LastCallSite')),
+                ('calls', models.PositiveIntegerField(verbose_name='Calls')),
+                ('total_ms', models.FloatField(verbose_name='TotalMs')),
+                ('max_ms', models.FloatField(verbose_name='MaxMs')),
+                ('max_ms_rows', models.BigIntegerField(blank=True, null=True, verbose_name='MaxMsRows')),
+                ('explain', models.TextField(blank=True, default='', verbose_name='Explain')),
+                ('first_seen', models.DateTimeField(verbose_name='FirstSeen')),
+                ('last_seen', models.DateTimeField(verbose_name='LastSeen')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.4 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0007_slow_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ebayitem',
+            name='catalog_version',
+            field=models.BigIntegerField(db_column='CatalogVersion', default=0, verbose_name='CatalogVersion'),
+        ),
+        migrations.AddIndex(
+            model_name='ebayitem',
+            index=models.Index(fields=['catalog_version'], name='ebayitem_catalog_version'),
+        ),
+    ]
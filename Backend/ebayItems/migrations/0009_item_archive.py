@@ -0,0 +1,57 @@
+# Generated by Django 2.2.4 on 2026-10-19 12:40
+
+import datetime
+from django.db import migrations, models
+from django.utils.timezone import utc
+import ebayItems.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0008_item_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedEbayItem',
+            fields=[
+                ('item_no', models.BigIntegerField(db_column='ItemNo', verbose_name='ItemNo')),
+                ('item_id', models.CharField(db_column='ItemID', max_length=50, verbose_name='EbayItemID')),
+                ('auction_id', models.CharField(db_column='AuctionID', max_length=50, verbose_name='AuctionID')),
+                ('sku', models.CharField(db_column='SKU', max_length=250, verbose_name='SKU')),
+                ('item_description', models.CharField(db_column='ItemDescription', max_length=1000, verbose_name='Description')),
+                ('sales_goal_reached_in_last14days', models.FloatField(db_column='SalesGoalReachedInLast14Days', max_length=10, verbose_name='SalesL14')),
+                ('sales_goal_reached_in_last7days', models.FloatField(db_column='SalesGoalReachedInLast7Days', max_length=10, verbose_name='SalesL7')),
+                ('sales_goal_reached_mtd', models.FloatField(db_column='SalesGoalReachedMTD', max_length=10, verbose_name='SalesMTD')),
+                ('cogs_24h_vs_7d', models.FloatField(db_column='COGS24HVS7D', max_length=10, verbose_name='COGS24HVS7D')),
+                ('channel', models.CharField(db_column='Channel', max_length=200, verbose_name='Channel')),
+                ('country', models.CharField(db_column='Country', max_length=200, verbose_name='Country')),
+                ('stock', models.IntegerField(db_column='Stock', verbose_name='Stock')),
+                ('lrw', models.IntegerField(db_column='LRW', verbose_name='LRW')),
+                ('fc', models.IntegerField(db_column='FC', verbose_name='FC')),
+                ('item_ranking_today', models.IntegerField(db_column='ItemRankingToday', verbose_name='Rank')),
+                ('item_status', models.CharField(choices=[(ebayItems.models.BWStageEnum('BW_STAGE0'), 'BW_STAGE0'), (ebayItems.models.BWStageEnum('BW_STAGE1_30D'), 'BW_STAGE1_30D'), (ebayItems.models.BWStageEnum('BW_STAGE2_20D'), 'BW_STAGE2_20D'), (ebayItems.models.BWStageEnum('BW_STAGE3_10D'), 'BW_STAGE3_10D'), (ebayItems.models.BWStageEnum('BW_STAGE4_0D'), 'BW_STAGE4_0D'), (ebayItems.models.BWStageEnum('BW_STAGE5_5I'), 'BW_STAGE5_5I'), (ebayItems.models.BWStageEnum('BW_STAGE6_10I'), 'BW_STAGE6_10I'), (ebayItems.models.BWStageEnum('BW_BLOCKED'), 'BW_BLOCKED'), (ebayItems.models.BWStageEnum('BW_TOBLOCK'), 'BW_TOBLOCK'), (ebayItems.models.BWStageEnum('BW_READY'), 'BW_READY'), (ebayItems.models.BWStageEnum('NORMAL'), 'NORMAL'), (ebayItems.models.BWStageEnum('LRW_LIST'), 'LRW_LIST')], db_column='ItemStatus', default='NORMAL', max_length=15, verbose_name='Status')),
+                ('our_purchase_price', models.FloatField(db_column='OurPurchasePrice', max_length=10, verbose_name='PPrice')),
+                ('current_sale_price', models.FloatField(db_column='CurrentSalePrice', max_length=10, verbose_name='CPrice')),
+                ('suggested_sale_price', models.FloatField(db_column='SuggestedSalePrice', max_length=10, verbose_name='SPrice')),
+                ('last_humansetprice_before_badewanne', models.FloatField(db_column='LastHumanSetPriceBeforeBadewanne', max_length=10, verbose_name='LHSPrice')),
+                ('new_price', models.FloatField(db_column='NewPrice', max_length=10, verbose_name='NewPrice')),
+                ('dio1', models.IntegerField(db_column='DIO1', verbose_name='DIO1')),
+                ('dio2', models.IntegerField(db_column='DIO2', verbose_name='DIO2')),
+                ('last_bw_start_date', models.DateTimeField(db_column='LastBWStartDate', default=datetime.datetime(1969, 12, 31, 23, 7, tzinfo=utc), verbose_name='LBWSDate')),
+                ('last_bw_end_date', models.DateTimeField(db_column='LastBWEndDate', default=datetime.datetime(1969, 12, 31, 23, 7, tzinfo=utc), verbose_name='LBWEDate')),
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_at', models.DateTimeField(verbose_name='ArchivedAt')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ebayitem',
+            name='missing_cycles',
+            field=models.PositiveSmallIntegerField(db_column='MissingCycles', default=0, verbose_name='MissingCycles'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedebayitem',
+            index=models.Index(fields=['item_no'], name='archiveditem_item_no'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.4 on 2026-10-20 09:12
+
+from django.db import migrations, models
+from django.db.models import Max
+
+from ebayItems import catalog
+
+
+def create_counter(apps, schema_editor):
+    # continue above the versions the rows were stamped with by the cache counter
+    alias = schema_editor.connection.alias
+    stamped = apps.get_model('ebayItems', 'EbayItem').objects.using(alias).aggregate(
+        version=Max('catalog_version')
+    )['version'] or 0
+    apps.get_model('ebayItems', 'CatalogVersion').objects.using(alias).create(
+        pk=catalog.CATALOG_VERSION_ID, version=max(stamped + 1, catalog.new_version())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0009_item_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Version')),
+            ],
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
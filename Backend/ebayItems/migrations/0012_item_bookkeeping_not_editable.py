@@ -0,0 +1,23 @@
+# Generated by Django 2.2.4 on 2026-10-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0011_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ebayitem',
+            name='catalog_version',
+            field=models.BigIntegerField(db_column='CatalogVersion', default=0, editable=False, verbose_name='CatalogVersion'),
+        ),
+        migrations.AlterField(
+            model_name='ebayitem',
+            name='missing_cycles',
+            field=models.PositiveSmallIntegerField(db_column='MissingCycles', default=0, editable=False, verbose_name='MissingCycles'),
+        ),
+    ]
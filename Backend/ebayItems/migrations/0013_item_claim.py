@@ -0,0 +1,24 @@
+# Generated by Django 2.2.4 on 2026-10-20 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0012_item_bookkeeping_not_editable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemClaim',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_status', models.CharField(max_length=15, verbose_name='Status')),
+                ('catalog_version', models.BigIntegerField(verbose_name='CatalogVersion')),
+                ('claimed_at', models.DateTimeField(db_index=True, verbose_name='ClaimedAt')),
+                ('item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='ebayItems.EbayItem', verbose_name='Item')),
+            ],
+        ),
+    ]
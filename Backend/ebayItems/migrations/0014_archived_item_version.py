@@ -0,0 +1,22 @@
+# Generated by Django 2.2.4 on 2026-10-20 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0013_item_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedebayitem',
+            name='catalog_version',
+            field=models.BigIntegerField(db_column='CatalogVersion', default=0, editable=False, verbose_name='CatalogVersion'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedebayitem',
+            index=models.Index(fields=['catalog_version'], name='archiveditem_version'),
+        ),
+    ]
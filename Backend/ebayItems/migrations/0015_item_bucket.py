@@ -0,0 +1,34 @@
+# Generated by Django 2.2.4 on 2026-10-20 12:15
+
+from django.db import migrations, models
+from django.db.models.functions import Mod
+
+# ITEM_BUCKETS of ebayItems.models
+ITEM_BUCKETS = 256
+
+
+def fill_buckets(apps, schema_editor):
+    # one statement, the rows are not stamped with a new catalog version
+    apps.get_model('ebayItems', 'EbayItem').objects.using(
+        schema_editor.connection.alias
+    ).update(item_bucket=Mod('item_no', ITEM_BUCKETS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebayItems', '0014_archived_item_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ebayitem',
+            name='item_bucket',
+            field=models.PositiveSmallIntegerField(db_column='ItemBucket', default=0, editable=False, verbose_name='ItemBucket'),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ebayitem',
+            index=models.Index(fields=['item_bucket'], name='ebayitem_item_bucket'),
+        ),
+    ]
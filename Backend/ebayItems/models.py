@@ -5,12 +5,21 @@ This Module defines the table to store ebay item data.
 import datetime
 from enum import Enum
 
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import Mod
 from django.utils.timezone import get_current_timezone
 import django_filters
 from django_filters import rest_framework as filters
 from django_filters.filters import forms
 
+from .catalog import catalog_changed, next_version
+from .search import search_items
+
+
+# Buckets of item_no stored with every item, a hash partition of the pipeline
+# is the set of buckets with the same remainder, see leases.partition_items
+ITEM_BUCKETS = 256
+
 
 class BWStageEnum(Enum):
     """
@@ -30,9 +39,64 @@ class BWStageEnum(Enum):
     LRW_LIST = 'LRW_LIST'
 
 
-class EbayItem(models.Model):
+class EbayItemQuerySet(models.QuerySet):
     """
-    Create table EbayItem to store the item infos
+    QuerySet which bumps the catalog version on every bulk write and stamps
+    the written rows with it. The version is bumped in the transaction of the
+    write, so both become visible together. bulk_update stamps its rows through
+    the update of every batch. Writes of item_no also write its bucket.
+    """
+
+    @property
+    def write_db(self) -> str:
+        """
+        Database the writes of the queryset go to, db is the read database
+        outside of a write
+        :return: database alias
+        """
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+    def update(self, **kwargs):
+        """
+        Update the rows and bump the catalog version
+        :param kwargs: field values
+        :return: number of rows
+        """
+        if 'item_no' in kwargs:
+            kwargs.setdefault('item_bucket', Mod(kwargs['item_no'], ITEM_BUCKETS))
+        with transaction.atomic(using=self.write_db, savepoint=False):
+            kwargs.setdefault('catalog_version', next_version(self.write_db))
+            return super().update(**kwargs)
+
+    def delete(self):
+        """
+        Delete the rows and bump the catalog version
+        :return: number of deleted objects and a dict of them per model
+        """
+        with transaction.atomic(using=self.write_db, savepoint=False):
+            catalog_changed(self.write_db)
+            return super().delete()
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        """
+        Insert the objects and bump the catalog version
+        :param objs: EbayItem objects
+        :param batch_size:
+        :param ignore_conflicts:
+        :return: inserted objects
+        """
+        with transaction.atomic(using=self.write_db, savepoint=False):
+            version = next_version(self.write_db)
+            for obj in objs:
+                obj.catalog_version = version
+                obj.item_bucket = obj.item_no % ITEM_BUCKETS
+            return super().bulk_create(objs, batch_size=batch_size,
+                                       ignore_conflicts=ignore_conflicts)
+
+
+class EbayItemFields(models.Model):
+    """
+    Columns of an item, shared by the live and the archived items
     """
     item_no = models.BigIntegerField(
         null=False, verbose_name='ItemNo', db_column='ItemNo'
@@ -113,8 +177,239 @@ class EbayItem(models.Model):
         verbose_name='LBWEDate',
         db_column='LastBWEndDate'
     )
+
+    class Meta: # pylint: disable=too-few-public-methods
+        """
+        Meta
+        """
+        abstract = True
+
+
+class EbayItem(EbayItemFields):
+    """
+    Create table EbayItem to store the item infos
+    """
+    # catalog version of the last write, see catalog.py
+    catalog_version = models.BigIntegerField(
+        default=0, editable=False, verbose_name='CatalogVersion', db_column='CatalogVersion'
+    )
+    # consecutive syncs the listing was missing from BIServer, see archive.py
+    missing_cycles = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name='MissingCycles', db_column='MissingCycles'
+    )
+    # item_no modulo ITEM_BUCKETS, indexed for the partition filter of the pipeline
+    item_bucket = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name='ItemBucket', db_column='ItemBucket'
+    )
+    objects = EbayItemQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Save the item stamped with a new catalog version and the bucket of its
+        item_no
+        :param args:
+        :param kwargs:
+        :return: None
+        """
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self.catalog_version = next_version(using)
+            self.item_bucket = self.item_no % ITEM_BUCKETS
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'catalog_version'}
+                if 'item_no' in kwargs['update_fields']:
+                    kwargs['update_fields'].add('item_bucket')
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        """
+        Delete the item and bump the catalog version
+        :param using:
+        :param keep_parents:
+        :return: number of deleted objects and a dict of them per model
+        """
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            catalog_changed(using)
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    class Meta: # pylint: disable=too-few-public-methods
+        """
+        Meta
+        """
+        # the FULLTEXT index of ItemDescription is created by migration 0004
+        # on MySQL only, the partition_item_table command drops it again when
+        # it partitions the table by country
+        indexes = [
+            models.Index(fields=['sku'], name='ebayitem_sku'),
+            # filters of the admin, id keeps the order of the changelist on the index
+            models.Index(fields=['item_status', 'id'], name='ebayitem_status_id'),
+            models.Index(fields=['country', 'id'], name='ebayitem_country_id'),
+            models.Index(fields=['catalog_version'], name='ebayitem_catalog_version'),
+            models.Index(fields=['item_bucket'], name='ebayitem_item_bucket'),
+        ]
+
+
+class CatalogVersion(models.Model):
+    """
+    Counter of the writes to the item catalog, a single row, see catalog.py
+    """
+    version = models.BigIntegerField(verbose_name='Version')
+    objects = models.Manager()
+
+
+class ArchivedEbayItem(EbayItemFields):
+    """
+    Item which disappeared from BIServer, kept with the id it had as EbayItem
+    so that it is restored under it when it reappears
+    """
+    id = models.IntegerField(primary_key=True, verbose_name='ID')
+    archived_at = models.DateTimeField(verbose_name='ArchivedAt')
+    # catalog version of the archiving, the feed reports the item as deleted
+    # to pulls since an earlier version
+    catalog_version = models.BigIntegerField(
+        default=0, editable=False, verbose_name='CatalogVersion', db_column='CatalogVersion'
+    )
     objects = models.Manager()
 
+    class Meta: # pylint: disable=too-few-public-methods
+        """
+        Meta
+        """
+        indexes = [
+            models.Index(fields=['item_no'], name='archiveditem_item_no'),
+            models.Index(fields=['catalog_version'], name='archiveditem_version'),
+        ]
+
+
+class EbayItemPriceHistory(models.Model):
+    """
+    Append only record of every price and status change the badewanne makes,
+    one narrow row per item and change. The (item, ts) index also serves the
+    lookups by item alone.
+    """
+    item = models.ForeignKey(
+        EbayItem, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name='price_history', verbose_name='Item'
+    )
+    ts = models.DateTimeField(verbose_name='Timestamp')
+    old_price = models.FloatField(verbose_name='OldPrice')
+    new_price = models.FloatField(verbose_name='NewPrice')
+    stage = models.CharField(
+        max_length=15,
+        choices=[(tag, tag.value) for tag in BWStageEnum],
+        verbose_name='Stage'
+    )
+    reason = models.CharField(max_length=100, verbose_name='Reason')
+    objects = models.Manager()
+
+    class Meta: # pylint: disable=too-few-public-methods
+        """
+        Meta
+        """
+        indexes = [
+            models.Index(fields=['item', 'ts'], name='pricehistory_item_ts'),
+        ]
+
+
+class ItemClaim(models.Model):
+    """
+    Item a tracking run moved to its target stage and did not price yet. The
+    claim keeps the status the item was claimed from and the catalog version
+    the claim stamped, see tasks.claim_items.
+    """
+    item = models.ForeignKey(
+        EbayItem, on_delete=models.DO_NOTHING, db_constraint=False, verbose_name='Item'
+    )
+    item_status = models.CharField(max_length=15, verbose_name='Status')
+    catalog_version = models.BigIntegerField(verbose_name='CatalogVersion')
+    claimed_at = models.DateTimeField(db_index=True, verbose_name='ClaimedAt')
+    objects = models.Manager()
+
+
+class PartitionLease(models.Model):
+    """
+    Time limited ownership of one catalog partition by a worker node, so that
+    several nodes can share the periodic pipeline
+    """
+    partition = models.PositiveIntegerField(unique=True, verbose_name='Partition')
+    owner = models.CharField(max_length=200, blank=True, default='', verbose_name='Owner')
+    expires_at = models.DateTimeField(
+        default=datetime.datetime(1970, 1, 1, 0, 0, 0, 0, tzinfo=get_current_timezone()),
+        verbose_name='ExpiresAt'
+    )
+    last_cycle = models.BigIntegerField(default=-1, verbose_name='LastCycle')
+    objects = models.Manager()
+
+
+class PipelineNode(models.Model):
+    """
+    Heartbeat of a worker node taking part in the leased pipeline, also when
+    it does not own any partition yet
+    """
+    name = models.CharField(max_length=200, unique=True, verbose_name='Name')
+    expires_at = models.DateTimeField(verbose_name='ExpiresAt')
+    objects = models.Manager()
+
+
+class RequestProfile(models.Model):
+    """
+    Profile of a sampled or slow web request, kept for the staff page
+    """
+    MODE_CPROFILE = 'cprofile'
+    MODE_STACKS = 'stacks'
+
+    started_at = models.DateTimeField(verbose_name='StartedAt')
+    method = models.CharField(max_length=10, verbose_name='Method')
+    path = models.CharField(max_length=500, verbose_name='Path')
+    query_string = models.TextField(blank=True, default='', verbose_name='QueryString')
+    status_code = models.PositiveSmallIntegerField(verbose_name='StatusCode')
+    duration_ms = models.FloatField(verbose_name='DurationMs')
+    sql_count = models.PositiveIntegerField(verbose_name='SQLCount')
+    sql_ms = models.FloatField(verbose_name='SQLMs')
+    mode = models.CharField(
+        max_length=10, verbose_name='Mode',
+        choices=[(MODE_CPROFILE, 'cProfile stats'), (MODE_STACKS, 'Collapsed stacks')]
+    )
+    profile = models.TextField(verbose_name='Profile')
+    objects = models.Manager()
+
+    class Meta: # pylint: disable=too-few-public-methods
+        """
+        Meta
+        """
+        indexes = [
+            models.Index(fields=['started_at'], name='requestprofile_started'),
+        ]
+
+
+class SlowQuery(models.Model):
+    """
+    Slow SQL statement of the requests and background tasks, aggregated over
+    all executions of its normalized form
+    """
+    fingerprint = models.CharField(max_length=40, unique=True, verbose_name='Fingerprint')
+    statement = models.TextField(verbose_name='Statement')
+    example = models.TextField(verbose_name='Example')
+    call_sites = models.TextField(verbose_name='CallSites')
+    last_call_site = models.CharField(max_length=300, verbose_name='LastCallSite')
+    calls = models.PositiveIntegerField(verbose_name='Calls')
+    total_ms = models.FloatField(verbose_name='TotalMs')
+    max_ms = models.FloatField(verbose_name='MaxMs')
+    max_ms_rows = models.BigIntegerField(null=True, blank=True, verbose_name='MaxMsRows')
+    explain = models.TextField(blank=True, default='', verbose_name='Explain')
+    first_seen = models.DateTimeField(verbose_name='FirstSeen')
+    last_seen = models.DateTimeField(verbose_name='LastSeen')
+    objects = models.Manager()
+
+    @property
+    def mean_ms(self) -> float:
+        """
+        Mean duration of the slow executions
+        :return: milliseconds
+        """
+        return self.total_ms / self.calls if self.calls else 0.0
+
 
 class EbayItemsFilter(filters.FilterSet):
     """
@@ -133,6 +428,8 @@ class EbayItemsFilter(filters.FilterSet):
             'country': ['exact']
         }
 
+    search = django_filters.CharFilter(method='filter_search', label='Search')
+
     item_status = django_filters.LookupChoiceFilter(
         field_class=forms.CharField,
         field_name='item_status',
@@ -198,3 +495,13 @@ class EbayItemsFilter(filters.FilterSet):
             ('lt', 'Less than'),
         ]
     )
+
+    def filter_search(self, queryset, name, value):  # pylint: disable=unused-argument
+        """
+        Words of the description or SKU prefix
+        :param queryset:
+        :param name:
+        :param value:
+        :return: filtered queryset
+        """
+        return search_items(queryset, value)
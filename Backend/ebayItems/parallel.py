@@ -0,0 +1,117 @@
+"""
+This module splits the catalog into partitions and runs the partitionable
+parts of the periodic pipeline (diff, status transitions and pricing
+preparation) in a worker process pool. The worker functions themselves live
+next to their serial counterparts in the task module, this module only knows
+how to cut a frame into partitions and how to fan them out.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+PARTITION_BY_COUNTRY_CHANNEL = 'country_channel'
+PARTITION_BY_HASH = 'hash'
+
+
+def get_pipeline_workers() -> int:
+    """
+    Degree of parallelism of the pipeline, 1 means the serial path is used
+    :return: number of worker processes
+    """
+    return max(1, int(getattr(settings, 'PIPELINE_WORKERS', 1)))
+
+
+def get_partition_by() -> str:
+    """
+    How the catalog is partitioned for status transitions and pricing
+    :return: PARTITION_BY_COUNTRY_CHANNEL or PARTITION_BY_HASH
+    """
+    return getattr(settings, 'PIPELINE_PARTITION_BY', PARTITION_BY_COUNTRY_CHANNEL)
+
+
+def get_hash_partitions() -> int:
+    """
+    Number of item_no hash partitions
+    :return: number of partitions
+    """
+    return max(1, int(getattr(settings, 'PIPELINE_HASH_PARTITIONS', 16)))
+
+
+def get_parallel_min_items() -> int:
+    """
+    Below this number of rows the process pool costs more than it saves and
+    the serial path is used
+    :return: minimum number of rows
+    """
+    return int(getattr(settings, 'PIPELINE_PARALLEL_MIN_ITEMS', 10000))
+
+
+def hash_partition_labels(item_nos: Sequence, num_partitions: int) -> np.ndarray:
+    """
+    Hash partition of every item, the same item_no always lands in the same
+    partition so that both sides of a key are in one partition.
+    :param item_nos: item numbers
+    :param num_partitions: number of partitions
+    :return: partition label per item
+    """
+    return np.asarray(item_nos, dtype=np.int64) % num_partitions
+
+
+def partition_labels(frame: pd.DataFrame, partition_by: str, item_no_col: str,
+                     country_col: str, channel_col: str) -> np.ndarray:
+    """
+    Partition label of every row of the frame
+    :param frame: pandas dataframe to be partitioned
+    :param partition_by: PARTITION_BY_COUNTRY_CHANNEL or PARTITION_BY_HASH
+    :param item_no_col: name of the item number column
+    :param country_col: name of the country column
+    :param channel_col: name of the channel column
+    :return: partition label per row
+    """
+    if partition_by == PARTITION_BY_HASH:
+        return hash_partition_labels(frame[item_no_col].values, get_hash_partitions())
+    if partition_by == PARTITION_BY_COUNTRY_CHANNEL:
+        codes, _ = pd.MultiIndex.from_arrays(
+            [frame[country_col].astype(str), frame[channel_col].astype(str)]
+        ).factorize()
+        return codes
+    raise ValueError('Unknown pipeline partitioning: {}'.format(partition_by))
+
+
+def split_positions(labels: np.ndarray) -> List[np.ndarray]:
+    """
+    Group row positions by partition label, positions keep their original
+    order inside every partition.
+    :param labels: partition label per row
+    :return: list of row position arrays, one per partition
+    """
+    if len(labels) == 0:
+        return []
+    order = np.argsort(labels, kind='stable')
+    _, starts = np.unique(labels[order], return_index=True)
+    return np.split(order, starts[1:])
+
+
+def run_partitioned(func: Callable, partitions: List[tuple], workers: int = None) -> list:
+    """
+    Run func once per partition, in a process pool when more than one worker
+    is configured. Results are returned in the order of the partitions.
+    :param func: module level function, called as func(*partition)
+    :param partitions: list of argument tuples
+    :param workers: degree of parallelism, defaults to the setting
+    :return: list of results
+    """
+    workers = workers or get_pipeline_workers()
+    if workers <= 1 or len(partitions) <= 1:
+        return [func(*args) for args in partitions]
+    LOGGER.info("Running %s on %s partitions with %s workers",
+                func.__name__, len(partitions), workers)
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as executor:
+        return list(executor.map(func, *zip(*partitions)))
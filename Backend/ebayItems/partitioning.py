@@ -0,0 +1,161 @@
+"""
+This module lays the ebayitem table out in partitions by country on MySQL.
+The partition_item_table command partitions the table by KEY or LIST
+COLUMNS on Country, so that the queries of one country, the
+country filter, per-market Badewanne runs and exports, only read the
+partition of that country. MySQL requires the partitioning column in every
+unique key, the primary key becomes (id, Country), id stays unique through
+its AUTO_INCREMENT. Partitioned InnoDB tables support no FULLTEXT index, the
+description search falls back to LIKE then. Other databases keep the plain
+table.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import query
+
+LOGGER = logging.getLogger(__name__)
+
+PARTITION_BY_KEY = 'key'
+PARTITION_BY_LIST = 'list'
+FULLTEXT_INDEX = 'ebayitem_description_ft'
+
+_PARTITIONED = {}
+
+
+def get_partitioning() -> Optional[str]:
+    """
+    How the item table is partitioned by default
+    :return: PARTITION_BY_KEY, PARTITION_BY_LIST or None when not
+    """
+    return getattr(settings, 'ITEM_PARTITIONING', None) or None
+
+
+def get_partition_count() -> int:
+    """
+    Number of KEY partitions
+    :return: int
+    """
+    return max(1, int(getattr(settings, 'ITEM_PARTITION_COUNT', 16)))
+
+
+def get_partition_countries() -> Dict[str, List[str]]:
+    """
+    Countries of every LIST partition by partition name, must cover all
+    countries of BIServer, MySQL rejects rows of other countries
+    :return: dict
+    """
+    return getattr(settings, 'ITEM_PARTITION_COUNTRIES', {})
+
+
+def partition_clause(column: str, partitioning: str = None, count: int = None) -> str:
+    """
+    PARTITION BY clause of a partitioning
+    :param column: quoted country column
+    :param partitioning: PARTITION_BY_KEY or PARTITION_BY_LIST, the setting when None
+    :param count: number of KEY partitions, the setting when None
+    :return: sql
+    :raises ValueError: on unknown partitioning or LIST without countries
+    """
+    partitioning = partitioning or get_partitioning()
+    if partitioning == PARTITION_BY_KEY:
+        return 'PARTITION BY KEY ({}) PARTITIONS {}'.format(column,
+                                                            count or get_partition_count())
+    if partitioning == PARTITION_BY_LIST:
+        countries = get_partition_countries()
+        if not countries:
+            raise ValueError('ITEM_PARTITION_COUNTRIES is empty')
+        return 'PARTITION BY LIST COLUMNS ({}) ({})'.format(column, ', '.join(
+            'PARTITION {} VALUES IN ({})'.format(
+                name, ', '.join("'{}'".format(country.replace("'", "''")) for country in values)
+            ) for name, values in countries.items()
+        ))
+    raise ValueError('Unknown item partitioning: {}'.format(partitioning))
+
+
+def is_partitioned(alias: str, table: str) -> bool:
+    """
+    Whether a table of the database is partitioned, looked up once per process
+    :param alias: database alias
+    :param table: table name
+    :return: bool
+    """
+    if (alias, table) not in _PARTITIONED:
+        db_connection = connections[alias]
+        partitioned = False
+        if db_connection.vendor == 'mysql':
+            with db_connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COUNT(*) FROM information_schema.PARTITIONS '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s '
+                    'AND PARTITION_NAME IS NOT NULL', [table]
+                )
+                partitioned = cursor.fetchone()[0] > 0
+        _PARTITIONED[(alias, table)] = partitioned
+    return _PARTITIONED[(alias, table)]
+
+
+def explain_partitions(items: query.QuerySet) -> Optional[List[str]]:
+    """
+    Partitions of the item table MySQL reads for the queryset
+    :param items: queryset of EbayItem
+    :return: partition names or None when the database has no partitions
+    """
+    db_connection = connections[items.db]
+    if db_connection.vendor != 'mysql':
+        return None
+    prefix = 'EXPLAIN PARTITIONS ' if db_connection.mysql_version < (5, 7) else 'EXPLAIN '
+    sql, params = items.query.sql_with_params()
+    with db_connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    table = items.model._meta.db_table
+    return sorted({name for row in rows if row['table'] == table and row['partitions']
+                   for name in row['partitions'].split(',')})
+
+
+def partition_table(schema_editor, model, partitioning: str = None, count: int = None) -> None:
+    """
+    Partition the item table by country, the FULLTEXT index is dropped and
+    Country joins the primary key
+    :param schema_editor: schema editor of the database
+    :param model: EbayItem
+    :param partitioning: PARTITION_BY_KEY or PARTITION_BY_LIST, the setting when None
+    :param count: number of KEY partitions, the setting when None
+    :return: None
+    """
+    clause = partition_clause(schema_editor.quote_name(model._meta.get_field('country').column),
+                              partitioning, count)
+    table = schema_editor.quote_name(model._meta.db_table)
+    country = schema_editor.quote_name(model._meta.get_field('country').column)
+    schema_editor.execute('DROP INDEX {} ON {}'.format(FULLTEXT_INDEX, table))
+    schema_editor.execute('ALTER TABLE {} DROP PRIMARY KEY, ADD PRIMARY KEY ({}, {})'.format(
+        table, schema_editor.quote_name(model._meta.pk.column), country
+    ))
+    schema_editor.execute('ALTER TABLE {} {}'.format(table, clause))
+    _PARTITIONED.pop((schema_editor.connection.alias, model._meta.db_table), None)
+    LOGGER.info("Item table partitioned: %s", clause)
+
+
+def unpartition_table(schema_editor, model) -> None:
+    """
+    Merge the partitions of the item table, restoring its primary key and
+    FULLTEXT index
+    :param schema_editor: schema editor of the database
+    :param model: EbayItem
+    :return: None
+    """
+    table = schema_editor.quote_name(model._meta.db_table)
+    schema_editor.execute('ALTER TABLE {} REMOVE PARTITIONING'.format(table))
+    schema_editor.execute('ALTER TABLE {} DROP PRIMARY KEY, ADD PRIMARY KEY ({})'.format(
+        table, schema_editor.quote_name(model._meta.pk.column)
+    ))
+    description = schema_editor.quote_name(model._meta.get_field('item_description').column)
+    schema_editor.execute('CREATE FULLTEXT INDEX {} ON {} ({})'.format(
+        FULLTEXT_INDEX, table, description
+    ))
+    _PARTITIONED.pop((schema_editor.connection.alias, model._meta.db_table), None)
@@ -0,0 +1,253 @@
+"""
+This module profiles web requests. A fraction REQUEST_PROFILE_SAMPLE_RATE of
+the requests runs under cProfile. Requests slower than REQUEST_PROFILE_SLOW_MS
+are profiled by a sampling thread, which records the stack of the request
+thread every REQUEST_PROFILE_INTERVAL seconds as collapsed stacks for flame
+graphs. It starts sampling a request after half the threshold, so fast
+requests are never sampled. The profiles are stored as RequestProfile with
+the SQL count and timings. When both are off the middleware removes itself at
+startup.
+"""
+
+import collections
+import contextlib
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.timezone import get_current_timezone
+
+from .models import RequestProfile
+
+LOGGER = logging.getLogger(__name__)
+
+# Functions listed in the cProfile stats of a request
+STATS_LIMIT = 60
+
+
+def get_sample_rate() -> float:
+    """
+    Fraction of the requests profiled with cProfile
+    :return: rate between 0 and 1
+    """
+    return float(getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0))
+
+
+def get_slow_ms():
+    """
+    Duration from which on a request keeps its sampled stacks
+    :return: milliseconds or None when off
+    """
+    return getattr(settings, 'REQUEST_PROFILE_SLOW_MS', None)
+
+
+def get_keep() -> int:
+    """
+    Number of stored profiles, older ones are deleted
+    :return: int
+    """
+    return getattr(settings, 'REQUEST_PROFILE_KEEP', 500)
+
+
+def collapse_stack(frame) -> str:
+    """
+    Collapsed form of a stack, outermost frame first
+    :param frame: innermost frame
+    :return: frames separated by semicolons
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """
+    Daemon thread recording the stacks of the watched request threads. A
+    request is sampled only once it ran for the delay given to watch, so the
+    thread sleeps while all watched requests are younger.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name='request-stack-sampler', daemon=True)
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.watched = {}
+
+    def watch(self, thread_id: int, delay: float) -> None:
+        """
+        Start recording the stacks of a thread after delay
+        :param thread_id: thread identifier
+        :param delay: seconds
+        :return: None
+        """
+        with self.condition:
+            self.watched[thread_id] = (time.monotonic() + delay, collections.Counter())
+            self.condition.notify()
+
+    def release(self, thread_id: int) -> collections.Counter:
+        """
+        Stop recording the stacks of a thread
+        :param thread_id: thread identifier
+        :return: counter of collapsed stacks
+        """
+        with self.condition:
+            return self.watched.pop(thread_id)[1]
+
+    def run(self) -> None:
+        """
+        Record the stacks of the watched threads which are due
+        :return: None
+        """
+        with self.condition:
+            while True:
+                if not self.watched:
+                    self.condition.wait()
+                    continue
+                wait = min(due for due, _ in self.watched.values()) - time.monotonic()
+                self.condition.wait(max(wait, self.interval))
+                frames = sys._current_frames()  # pylint: disable=protected-access
+                now = time.monotonic()
+                for thread_id, (due, stacks) in self.watched.items():
+                    frame = frames.get(thread_id)
+                    if due <= now and frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+
+class SQLTimer:
+    """
+    Execute wrapper counting the queries and their time on all databases
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+    @contextlib.contextmanager
+    def timing(self):
+        """
+        Time the queries of the block
+        """
+        with contextlib.ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    @contextlib.contextmanager
+    def excluded(self):
+        """
+        Leave the queries of the block out of the counts
+        """
+        count, seconds = self.count, self.seconds
+        try:
+            yield
+        finally:
+            self.count, self.seconds = count, seconds
+
+
+class RequestProfilerMiddleware:
+    """
+    Middleware storing profiles of sampled and of slow requests
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = get_sample_rate()
+        self.slow_ms = get_slow_ms()
+        if not self.sample_rate and self.slow_ms is None:
+            raise MiddlewareNotUsed()
+        self.sampler = None
+        if self.slow_ms is not None:
+            self.sampler = StackSampler(getattr(settings, 'REQUEST_PROFILE_INTERVAL', 0.005))
+            self.sampler.start()
+
+    def __call__(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.profile_request(request)
+        if self.sampler is not None:
+            return self.sample_request(request)
+        return self.get_response(request)
+
+    def profile_request(self, request):
+        """
+            Run the request under cProfile and store the stats
+        :param request:
+        :return: response
+        """
+        profiler = cProfile.Profile()
+        started_at = datetime.datetime.now(tz=get_current_timezone())
+        with SQLTimer().timing() as sql:
+            started = time.perf_counter()
+            response = profiler.runcall(self.get_response, request)
+            duration = time.perf_counter() - started
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(STATS_LIMIT)
+        self.store(request, response, started_at, duration, sql,
+                   RequestProfile.MODE_CPROFILE, stats.getvalue())
+        return response
+
+    def sample_request(self, request):
+        """
+            Record the stacks of the request and store them when it was slow
+        :param request:
+        :return: response
+        """
+        thread_id = threading.get_ident()
+        started_at = datetime.datetime.now(tz=get_current_timezone())
+        self.sampler.watch(thread_id, self.slow_ms / 2000)
+        try:
+            with SQLTimer().timing() as sql:
+                started = time.perf_counter()
+                response = self.get_response(request)
+                duration = time.perf_counter() - started
+        finally:
+            stacks = self.sampler.release(thread_id)
+        if duration * 1000 >= self.slow_ms:
+            self.store(request, response, started_at, duration, sql, RequestProfile.MODE_STACKS,
+                       '\n'.join('{} {}'.format(stack, count)
+                                 for stack, count in stacks.most_common()))
+        return response
+
+    @staticmethod
+    def store(request, response, started_at, duration, sql, mode, profile) -> None:
+        """
+            Store a profile and delete the ones beyond REQUEST_PROFILE_KEEP
+        :param request:
+        :param response:
+        :param started_at: start of the request
+        :param duration: seconds
+        :param sql: SQLTimer of the request
+        :param mode: RequestProfile mode
+        :param profile: stats or collapsed stacks
+        :return: None
+        """
+        try:
+            stored = RequestProfile.objects.create(
+                started_at=started_at, method=request.method, path=request.path[:500],
+                query_string=request.META.get('QUERY_STRING', ''),
+                status_code=response.status_code, duration_ms=duration * 1000,
+                sql_count=sql.count, sql_ms=sql.seconds * 1000, mode=mode, profile=profile
+            )
+            RequestProfile.objects.filter(id__lte=stored.id - get_keep()).delete()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Profile of %s could not be stored", request.path)
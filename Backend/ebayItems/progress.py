@@ -0,0 +1,232 @@
+"""
+This module publishes the progress of the long running pipeline jobs. A
+published job runs metered by the throughput module and writes its state
+into the cache, which the web and the worker processes of all nodes share
+through the database: the running phase with its rows done out of total, the
+pricing api batches sent, the rate and the ETA. The item page polls it from
+the web processes instead of being reloaded until the job is done, or
+streams it when PROGRESS_STREAM is on.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import throughput
+
+LOGGER = logging.getLogger(__name__)
+
+# Jobs which publish their progress
+JOBS = ['ebay_badewanne_update', 'badewanne_process_tracking', 'sync_ebay_items']
+CACHE_KEY = 'pipeline_progress:{}'
+STATE_RUNNING = 'running'
+STATE_FINISHED = 'finished'
+STATE_FAILED = 'failed'
+# Seconds between two comments keeping an idle event stream open
+KEEPALIVE_SECONDS = 15
+
+
+def get_publish_interval() -> float:
+    """
+    Seconds between two writes of the progress of a running phase
+    :return: float
+    """
+    return getattr(settings, 'PROGRESS_PUBLISH_SECONDS', 1.0)
+
+
+def get_ttl() -> int:
+    """
+    Seconds the progress of a job is kept after its last write
+    :return: int
+    """
+    return getattr(settings, 'PROGRESS_TTL', 86400)
+
+
+def get_poll_interval() -> float:
+    """
+    Seconds between two polls of the progress by the item page
+    :return: float
+    """
+    return getattr(settings, 'PROGRESS_POLL_SECONDS', 5)
+
+
+def stream_enabled() -> bool:
+    """
+    Whether the progress is offered as Server-Sent Events, every open stream
+    holds a web worker
+    :return: bool
+    """
+    return getattr(settings, 'PROGRESS_STREAM', False)
+
+
+def phase_progress(stats: throughput.PhaseStats) -> dict:
+    """
+    Progress of a phase
+    :param stats: PhaseStats
+    :return: dict
+    """
+    eta = stats.eta()
+    return {
+        'phase': stats.name,
+        'rows': stats.rows,
+        'total': stats.total,
+        'percent': (round(100.0 * stats.rows / stats.total, 1)
+                    if stats.total else None),
+        'rows_per_second': round(stats.rows_per_second, 1),
+        'api_batches': stats.api_calls,
+        'eta_seconds': None if eta is None else round(eta, 1),
+    }
+
+
+class Publisher:
+    """
+    Writes the progress of a metered job, on_progress is called with the
+    PhaseStats after every write of rows
+    """
+
+    def __init__(self, job: str, on_progress: Callable[[throughput.PhaseStats], None] = None):
+        self.job = job
+        self.on_progress = on_progress
+        self.meter = None
+        self.started_at = None
+        self.written = 0.0
+
+    @contextlib.contextmanager
+    def publishing(self, phase: str = None):
+        """
+        Meter the block and publish its progress, in phase when given
+        :param phase: phase name or None
+        """
+        with throughput.metered(self.progress, self.phase_changed) as meter:
+            self.meter = meter
+            self.started_at = timezone.now()
+            self.write(STATE_RUNNING)
+            try:
+                with meter.phase(phase) if phase else contextlib.nullcontext():
+                    yield meter
+            except Exception:
+                self.write(STATE_FAILED)
+                raise
+            self.write(STATE_FINISHED)
+
+    def progress(self, stats: throughput.PhaseStats) -> None:
+        """
+        Publish processed rows at most every PROGRESS_PUBLISH_SECONDS
+        :param stats: PhaseStats
+        :return: None
+        """
+        if time.monotonic() - self.written >= get_publish_interval():
+            self.write(STATE_RUNNING)
+        if self.on_progress is not None:
+            self.on_progress(stats)
+
+    def phase_changed(self, stats: throughput.PhaseStats) -> None:  # pylint: disable=unused-argument
+        """
+        Publish the start and the end of a phase
+        :param stats: PhaseStats
+        :return: None
+        """
+        self.write(STATE_RUNNING)
+
+    def state(self, state: str) -> dict:
+        """
+        Progress of the job
+        :param state: STATE_RUNNING, STATE_FINISHED or STATE_FAILED
+        :return: dict
+        """
+        now = timezone.now()
+        current = self.meter.current
+        if current is None and state == STATE_FAILED and self.meter.phases:
+            # the phases have ended when the failure reaches the publisher
+            current = self.meter.phases[-1]
+        progress = {
+            'job': self.job,
+            'state': state,
+            'started_at': self.started_at.isoformat(),
+            'updated_at': now.isoformat(),
+            'finished_at': None if state == STATE_RUNNING else now.isoformat(),
+            'phases': [dict(phase_progress(stats), seconds=round(stats.seconds, 2))
+                       for stats in self.meter.phases],
+        }
+        progress.update(phase_progress(current) if current is not None else {
+            'phase': None, 'rows': None, 'total': None, 'percent': None,
+            'rows_per_second': None, 'api_batches': None, 'eta_seconds': None,
+        })
+        return progress
+
+    def write(self, state: str) -> None:
+        """
+        Write the progress to the cache, failures only cost the progress
+        :param state: STATE_RUNNING, STATE_FINISHED or STATE_FAILED
+        :return: None
+        """
+        self.written = time.monotonic()
+        try:
+            # the cache statements are not part of the metered phases
+            with self.meter.timer.excluded():
+                cache.set(CACHE_KEY.format(self.job), self.state(state), get_ttl())
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.warning("Progress of %s could not be published", self.job, exc_info=True)
+
+
+def published(job: str, phase: str = None):
+    """
+    Decorator publishing the progress of every call of the function. Inside
+    a metered run, a pipeline cycle calling the tracking, the call counts to
+    the outer run.
+    :param job: job name, one of JOBS
+    :param phase: phase the call runs in, None when the function opens phases
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if throughput.active():
+                return function(*args, **kwargs)
+            with Publisher(job).publishing(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_progress() -> Dict[str, Optional[dict]]:
+    """
+    Published progress of all jobs
+    :return: dict of job to its progress, None when it has not run recently
+    """
+    found = cache.get_many([CACHE_KEY.format(job) for job in JOBS])
+    return {job: found.get(CACHE_KEY.format(job)) for job in JOBS}
+
+
+def event_stream(seconds: float, interval: float) -> Iterator[str]:
+    """
+    Server-Sent Events of the progress, an event whenever it changed and a
+    comment when it did not for KEEPALIVE_SECONDS. The stream ends after
+    seconds, the EventSource of the browser reconnects then.
+    :param seconds: duration of the stream
+    :param interval: seconds between two reads of the progress
+    :return: iterator of event text
+    """
+    ends = time.monotonic() + seconds
+    last = None
+    sent = time.monotonic()
+    yield 'retry: {}\n\n'.format(int(interval * 2000))
+    while True:
+        data = json.dumps({'jobs': read_progress()}, sort_keys=True)
+        if data != last:
+            last, sent = data, time.monotonic()
+            yield 'event: progress\ndata: {}\n\n'.format(data)
+        elif time.monotonic() - sent >= KEEPALIVE_SECONDS:
+            sent = time.monotonic()
+            yield ': keepalive\n\n'
+        if time.monotonic() + interval > ends:
+            return
+        time.sleep(interval)
+
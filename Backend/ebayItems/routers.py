@@ -0,0 +1,155 @@
+"""
+This module routes the reads of the item pages, the REST list and the exports
+to a read replica, so that they do not stall behind the write locks of the
+periodic sync. Writes and everything outside of a replica read block stay on
+the primary database. A client which just wrote reads from the primary for a
+while, so it sees its own changes despite the replication lag.
+"""
+
+import contextlib
+import contextvars
+import logging
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+LOGGER = logging.getLogger(__name__)
+
+PIN_SESSION_KEY = 'replica_pinned_until'
+# Seconds a measured replication lag is reused
+LAG_CHECK_INTERVAL = 5
+
+_READ_ALIAS = contextvars.ContextVar('read_alias', default=None)
+_LAG_CHECKS = {}
+
+
+def get_replica_alias() -> Optional[str]:
+    """
+    Alias of the read replica when one is configured
+    :return: database alias or None
+    """
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def get_pin_seconds() -> float:
+    """
+    How long the reads of a client stay on the primary after it wrote
+    :return: seconds
+    """
+    return float(getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def get_max_lag() -> Optional[float]:
+    """
+    Largest replication lag the replica is read with, None to not check it
+    :return: seconds or None
+    """
+    return getattr(settings, 'REPLICA_MAX_LAG', None)
+
+
+def pin_primary(request) -> None:
+    """
+    Let the following reads of the client go to the primary
+    :param request: http request of the writing client
+    :return: None
+    """
+    if hasattr(request, 'session'):
+        request.session[PIN_SESSION_KEY] = time.time() + get_pin_seconds()
+
+
+def is_pinned(request) -> bool:
+    """
+    Whether the reads of the client have to go to the primary
+    :param request: http request
+    :return: bool
+    """
+    return getattr(request, 'session', {}).get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def replica_lag(alias: str) -> Optional[float]:
+    """
+    Replication lag of a MySQL replica, measured at most every
+    LAG_CHECK_INTERVAL seconds
+    :param alias: database alias of the replica
+    :return: seconds or None when unknown
+    """
+    checked_at, lag = _LAG_CHECKS.get(alias, (0, None))
+    if time.time() - checked_at < LAG_CHECK_INTERVAL:
+        return lag
+    lag = None
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SHOW SLAVE STATUS')
+            row = cursor.fetchone()
+            if row is not None:
+                columns = [column[0] for column in cursor.description]
+                lag = row[columns.index('Seconds_Behind_Master')]
+    except DatabaseError:
+        LOGGER.exception("Replication lag of %s is unknown", alias)
+    _LAG_CHECKS[alias] = (time.time(), lag)
+    return lag
+
+
+def read_alias_for(request) -> str:
+    """
+    Database the reads of a request go to
+    :param request: http request
+    :return: database alias
+    """
+    alias = get_replica_alias()
+    if alias is None or is_pinned(request):
+        return DEFAULT_DB_ALIAS
+    max_lag = get_max_lag()
+    if max_lag is not None:
+        lag = replica_lag(alias)
+        if lag is None or lag > max_lag:
+            return DEFAULT_DB_ALIAS
+    return alias
+
+
+@contextlib.contextmanager
+def read_from(alias: str):
+    """
+    Route the reads of the item models inside the block to alias
+    :param alias: database alias
+    """
+    token = _READ_ALIAS.set(alias)
+    try:
+        yield
+    finally:
+        _READ_ALIAS.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Database router which sends the reads of the ebayItems models inside a
+    read_from block to its alias and all writes to the primary
+    """
+
+    def db_for_read(self, model, **hints):  # pylint: disable=unused-argument
+        """
+        Database of a read
+        :param model: model class
+        :return: alias or None for the default
+        """
+        if model._meta.app_label != 'ebayItems':
+            return None
+        return _READ_ALIAS.get()
+
+    def db_for_write(self, model, **hints):  # pylint: disable=unused-argument
+        """
+        Database of a write
+        :param model: model class
+        :return: alias of the primary
+        """
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):  # pylint: disable=unused-argument
+        """
+        Primary and replica hold the same data
+        :return: True
+        """
+        return True
@@ -0,0 +1,321 @@
+"""
+This module defines the rules of the item status maintenance and of the
+badewanne stages once, as data. A rule moves items of a set of statuses which
+fulfill a condition into a target status. Rules are compiled either into
+django Q objects to select items in the database or into NumPy masks to
+evaluate items which are loaded already, both give the same result.
+"""
+
+import collections
+import datetime
+import functools
+import operator
+from typing import List, Mapping
+
+import numpy as np
+import pandas as pd
+from django.db.models import Q
+from django.utils.timezone import get_current_timezone
+
+from .models import BWStageEnum
+
+BadewanneThresholds = collections.namedtuple('BadewanneThresholds', [
+    'first_threshold',
+    'second_threshold',
+    'last_threshold',
+    'increase_10percent',
+    'increase_5percent',
+    'stage4_rank',
+    'stage3_rank',
+    'stage2_rank',
+    'stage4_cogs',
+    'stage3_cogs',
+    'stage2_cogs',
+])
+
+# Thresholds the badewanne process tracking runs with
+DEFAULT_THRESHOLDS = BadewanneThresholds(
+    first_threshold=90.0,
+    second_threshold=100.0,
+    last_threshold=90.0,
+    increase_10percent=120.0,
+    increase_5percent=110.0,
+    stage4_rank=10,
+    stage3_rank=20,
+    stage2_rank=50,
+    stage4_cogs=50.0,
+    stage3_cogs=40.0,
+    stage2_cogs=30.0,
+)
+
+# field lookup value, e.g. Condition('lrw', 'lt', 50)
+Condition = collections.namedtuple('Condition', ['field', 'lookup', 'value'])
+AllOf = collections.namedtuple('AllOf', ['conditions'])
+AnyOf = collections.namedtuple('AnyOf', ['conditions'])
+Not = collections.namedtuple('Not', ['condition'])
+# values resolved when the rule is compiled
+Threshold = collections.namedtuple('Threshold', ['name'])
+DaysAgo = collections.namedtuple('DaysAgo', ['days'])
+# items of one of the statuses which fulfill the condition, None is always
+Branch = collections.namedtuple('Branch', ['statuses', 'condition'])
+# items matching any branch move to target, discount of the last human set
+# price for badewanne stages
+Rule = collections.namedtuple('Rule', ['name', 'target', 'branches', 'discount'])
+
+LOOKUPS = {
+    'lt': operator.lt,
+    'gt': operator.gt,
+}
+
+IN_BADEWANNE = [stage for stage in BWStageEnum if stage.value.startswith('BW_STAGE')]
+
+BW_READY_CONDITION = AllOf([
+    Condition('sales_goal_reached_in_last7days', 'lt', 100),
+    Condition('sales_goal_reached_in_last14days', 'lt', 100),
+    Condition('sales_goal_reached_mtd', 'lt', 100),
+    Condition('lrw', 'gt', 50),
+    Condition('stock', 'gt', 150),
+    Condition('fc', 'gt', 15),
+    Condition('item_ranking_today', 'gt', 50),
+])
+
+LRW_LIST_RULE = Rule('lrw_list', BWStageEnum.LRW_LIST, [
+    Branch([BWStageEnum.NORMAL], Condition('lrw', 'lt', 50)),
+], None)
+
+BLOCKED_LIST_RULE = Rule('blocked_list', BWStageEnum.BW_BLOCKED, [
+    # badewanne lasts for more than 30 days
+    Branch(IN_BADEWANNE, Condition('last_bw_start_date', 'lt', DaysAgo(30))),
+    Branch([BWStageEnum.BW_TOBLOCK], None),
+], None)
+
+NORMAL_LIST_RULE = Rule('normal_list', BWStageEnum.NORMAL, [
+    # items not fulfill bw_ready any more
+    Branch([BWStageEnum.BW_READY], Not(BW_READY_CONDITION)),
+    # items in blocked list more than 30 days
+    Branch([BWStageEnum.BW_BLOCKED], Condition('last_bw_end_date', 'lt', DaysAgo(30))),
+    # items in lrw_list more than 50 lrw
+    Branch([BWStageEnum.LRW_LIST], Condition('lrw', 'gt', 50)),
+], None)
+
+BWREADY_LIST_RULE = Rule('bwready_list', BWStageEnum.BW_READY, [
+    Branch([BWStageEnum.NORMAL], BW_READY_CONDITION),
+], None)
+
+# Rules of sync_items_status in the order they are applied
+STATUS_RULES = [LRW_LIST_RULE, BLOCKED_LIST_RULE, NORMAL_LIST_RULE, BWREADY_LIST_RULE]
+
+BLOCK_RULE = Rule('block', BWStageEnum.BW_BLOCKED, [
+    Branch([BWStageEnum.BW_TOBLOCK], None),
+], 0.0)
+
+# too great performance
+INCREASE_10PERCENT_RULE = Rule('increase_10percent', BWStageEnum.BW_STAGE6_10I, [
+    Branch([stage for stage in IN_BADEWANNE if stage is not BWStageEnum.BW_STAGE6_10I],
+           Condition('sales_goal_reached_in_last7days', 'gt', Threshold('increase_10percent'))),
+], -0.1)
+
+# too good performance
+INCREASE_5PERCENT_RULE = Rule('increase_5percent', BWStageEnum.BW_STAGE5_5I, [
+    Branch([stage for stage in IN_BADEWANNE
+            if stage not in (BWStageEnum.BW_STAGE6_10I, BWStageEnum.BW_STAGE5_5I)],
+           Condition('sales_goal_reached_in_last7days', 'gt', Threshold('increase_5percent'))),
+], -0.05)
+
+DECREASE_0PERCENT_RULE = Rule('decrease_0percent', BWStageEnum.BW_STAGE4_0D, [
+    Branch([BWStageEnum.BW_STAGE3_10D, BWStageEnum.BW_STAGE2_20D,
+            BWStageEnum.BW_STAGE1_30D, BWStageEnum.BW_STAGE0], AnyOf([
+                Condition('item_ranking_today', 'lt', Threshold('stage4_rank')),
+                Condition('sales_goal_reached_in_last14days', 'gt', Threshold('last_threshold')),
+                Condition('cogs_24h_vs_7d', 'gt', Threshold('stage4_cogs')),
+            ])),
+], 0.0)
+
+DECREASE_10PERCENT_RULE = Rule('decrease_10percent', BWStageEnum.BW_STAGE3_10D, [
+    Branch([BWStageEnum.BW_STAGE2_20D, BWStageEnum.BW_STAGE1_30D, BWStageEnum.BW_STAGE0], AnyOf([
+        Condition('cogs_24h_vs_7d', 'gt', Threshold('stage3_cogs')),
+        Condition('item_ranking_today', 'lt', Threshold('stage3_rank')),
+        Condition('sales_goal_reached_in_last7days', 'gt', Threshold('second_threshold')),
+    ])),
+], 0.1)
+
+DECREASE_20PERCENT_RULE = Rule('decrease_20percent', BWStageEnum.BW_STAGE2_20D, [
+    Branch([BWStageEnum.BW_STAGE1_30D, BWStageEnum.BW_STAGE0], AnyOf([
+        Condition('cogs_24h_vs_7d', 'gt', Threshold('stage2_cogs')),
+        Condition('item_ranking_today', 'lt', Threshold('stage2_rank')),
+        Condition('sales_goal_reached_in_last7days', 'gt', Threshold('first_threshold')),
+    ])),
+], 0.2)
+
+DECREASE_30PERCENT_RULE = Rule('decrease_30percent', BWStageEnum.BW_STAGE1_30D, [
+    Branch([BWStageEnum.BW_STAGE0], None),
+], 0.3)
+
+# Stages of badewanne_process_tracking in the order they are applied. No
+# stage selects the status an earlier stage moves to, so every item moves
+# at most once per run.
+BADEWANNE_RULES = [
+    BLOCK_RULE,
+    INCREASE_10PERCENT_RULE,
+    INCREASE_5PERCENT_RULE,
+    DECREASE_0PERCENT_RULE,
+    DECREASE_10PERCENT_RULE,
+    DECREASE_20PERCENT_RULE,
+    DECREASE_30PERCENT_RULE,
+]
+
+
+def resolve(value, thresholds: BadewanneThresholds, now: datetime.datetime):
+    """
+    Value of a condition for the thresholds and point of time
+    :param value: literal, Threshold or DaysAgo
+    :param thresholds: BadewanneThresholds
+    :param now: point of time
+    :return: literal value
+    """
+    if isinstance(value, Threshold):
+        return getattr(thresholds, value.name)
+    if isinstance(value, DaysAgo):
+        return now - datetime.timedelta(days=value.days)
+    return value
+
+
+def condition_fields(condition) -> List[str]:
+    """
+    Fields a condition reads
+    :param condition: Condition, AllOf, AnyOf, Not or None
+    :return: list of field names
+    """
+    if condition is None:
+        return []
+    if isinstance(condition, Condition):
+        return [condition.field]
+    if isinstance(condition, Not):
+        return condition_fields(condition.condition)
+    return [field for part in condition.conditions for field in condition_fields(part)]
+
+
+def rule_fields(rules: List[Rule]) -> List[str]:
+    """
+    Fields needed to evaluate the rules in memory
+    :param rules: list of Rule
+    :return: sorted list of field names, including item_status
+    """
+    return sorted({'item_status'} | {
+        field for rule in rules for branch in rule.branches
+        for field in condition_fields(branch.condition)
+    })
+
+
+def condition_q(condition, thresholds: BadewanneThresholds, now: datetime.datetime) -> Q:
+    """
+    Compile a condition into a Q object
+    :param condition: Condition, AllOf, AnyOf, Not or None
+    :param thresholds: BadewanneThresholds
+    :param now: point of time
+    :return: Q
+    """
+    if condition is None:
+        return Q()
+    if isinstance(condition, Condition):
+        return Q(**{'{}__{}'.format(condition.field, condition.lookup):
+                    resolve(condition.value, thresholds, now)})
+    if isinstance(condition, Not):
+        return ~condition_q(condition.condition, thresholds, now)
+    parts = [condition_q(part, thresholds, now) for part in condition.conditions]
+    return functools.reduce(operator.and_ if isinstance(condition, AllOf) else operator.or_,
+                            parts)
+
+
+def compile_q(rule: Rule, thresholds: BadewanneThresholds = DEFAULT_THRESHOLDS,
+              now: datetime.datetime = None) -> Q:
+    """
+    Compile a rule into a Q object selecting the items it moves
+    :param rule: Rule
+    :param thresholds: BadewanneThresholds
+    :param now: point of time, defaults to now
+    :return: Q
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    return functools.reduce(operator.or_, [
+        Q(item_status__in=[stage.value for stage in branch.statuses]) &
+        condition_q(branch.condition, thresholds, now)
+        for branch in rule.branches
+    ])
+
+
+def status_mask(statuses: List[BWStageEnum], status: np.ndarray) -> np.ndarray:
+    """
+    Whether the items have one of the statuses
+    :param statuses: list of BWStageEnum
+    :param status: item status per item
+    :return: boolean array
+    """
+    return pd.Series(status).isin([stage.value for stage in statuses]).values
+
+
+def condition_mask(condition, items: Mapping, thresholds: BadewanneThresholds,
+                   now: datetime.datetime):
+    """
+    Compile a condition into a NumPy mask over the loaded items
+    :param condition: Condition, AllOf, AnyOf, Not or None
+    :param items: field name to values, e.g. a pandas dataframe
+    :param thresholds: BadewanneThresholds
+    :param now: point of time
+    :return: boolean array, True when condition is None
+    """
+    if condition is None:
+        return True
+    if isinstance(condition, Condition):
+        return np.asarray(LOOKUPS[condition.lookup](
+            items[condition.field], resolve(condition.value, thresholds, now)
+        ))
+    if isinstance(condition, Not):
+        return ~condition_mask(condition.condition, items, thresholds, now)
+    parts = [condition_mask(part, items, thresholds, now) for part in condition.conditions]
+    return functools.reduce(np.logical_and if isinstance(condition, AllOf) else np.logical_or,
+                            parts)
+
+
+def compile_mask(rule: Rule, status: np.ndarray, items: Mapping,
+                 thresholds: BadewanneThresholds = DEFAULT_THRESHOLDS,
+                 now: datetime.datetime = None) -> np.ndarray:
+    """
+    Compile a rule into a NumPy mask of the items it moves
+    :param rule: Rule
+    :param status: item status per item
+    :param items: field name to values, e.g. a pandas dataframe
+    :param thresholds: BadewanneThresholds
+    :param now: point of time, defaults to now
+    :return: boolean array
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    mask = np.zeros(len(status), dtype=bool)
+    for branch in rule.branches:
+        mask |= status_mask(branch.statuses, status) & condition_mask(
+            branch.condition, items, thresholds, now
+        )
+    return mask
+
+
+def evaluate(rules: List[Rule], items: Mapping,
+             thresholds: BadewanneThresholds = DEFAULT_THRESHOLDS,
+             now: datetime.datetime = None):
+    """
+    Apply the rules in order in one pass over the loaded items, every rule
+    sees the status changes of the previous ones
+    :param rules: list of Rule
+    :param items: field name to values including item_status
+    :param thresholds: BadewanneThresholds
+    :param now: point of time, defaults to now
+    :return: new item status per item and the index of the rule which moved
+    it last, -1 for items which stay
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    status = np.array(items['item_status'], dtype=object)
+    matched = np.full(len(status), -1, dtype=np.int8)
+    for index, rule in enumerate(rules):
+        mask = compile_mask(rule, status, items, thresholds, now)
+        status[mask] = rule.target.value
+        matched[mask] = index
+    return status, matched
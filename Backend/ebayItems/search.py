@@ -0,0 +1,106 @@
+"""
+This module implements the item search over the description and the SKU.
+On MySQL the description is matched through its FULLTEXT index and the SKU
+prefix through its b-tree index, other databases and a table partitioned by
+country, which has no FULLTEXT index, fall back to LIKE on every search word,
+which is good enough for the tests and small databases.
+
+Both match words of the description which start with the search words. The
+FULLTEXT index leaves out the InnoDB stopwords, English ones like "the" by
+default, innodb_ft_server_stopword_table sets others, and words shorter than
+innodb_ft_min_token_size, 3 by default. Such a description word is not
+found on MySQL, a search word "ab" still finds "abc" but not "ab" itself,
+while the LIKE fallback finds it. The fallback only knows the space as word
+separator, "Einkoch" does not find "Topf-Einkoch" there.
+"""
+
+import re
+
+from django.db import connections, models
+from django.db.models import query
+from django.db.models.expressions import RawSQL
+
+from .partitioning import is_partitioned
+
+SEARCH_WORD = re.compile(r'\w+')
+
+
+def search_words(value: str) -> list:
+    """
+    Split the user input into words, the operators of the MySQL boolean mode
+    are dropped
+    :param value: search input
+    :return: list of words
+    """
+    return SEARCH_WORD.findall(value)
+
+
+@models.CharField.register_lookup
+class FullTextSearch(models.Lookup):
+    """
+    Lookup field__search which matches rows containing a word starting with
+    every word of the value, see the module docstring for the limits
+    """
+    lookup_name = 'search'
+
+    def as_mysql(self, compiler, connection):
+        """
+            MATCH AGAINST in boolean mode, needs a FULLTEXT index on the column,
+            LIKE on a partitioned table
+        :param compiler:
+        :param connection:
+        :return: sql and params
+        """
+        if is_partitioned(connection.alias, self.lhs.target.model._meta.db_table):
+            return self.as_sql(compiler, connection)
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        against = ' '.join('+{}*'.format(word) for word in search_words(self.rhs))
+        return 'MATCH ({}) AGAINST (%s IN BOOLEAN MODE)'.format(lhs), lhs_params + [against]
+
+    def as_sql(self, compiler, connection):
+        """
+            Case insensitive LIKE of every word for the other databases, at the
+            start of the value or after a space like the word prefixes of MATCH
+        :param compiler:
+        :param connection:
+        :return: sql and params
+        """
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        internal_type = self.lhs.output_field.get_internal_type()
+        lhs = connection.ops.lookup_cast('istartswith', internal_type) % lhs
+        words = search_words(self.rhs)
+        if not words:
+            return '1 = 1', []
+        pattern = '{} {}'.format(lhs, connection.operators['istartswith'] % '%s')
+        params = []
+        for word in words:
+            word = connection.ops.prep_for_like_query(word)
+            params += lhs_params + ['{}%'.format(word)] + lhs_params + ['% {}%'.format(word)]
+        return '({})'.format(' AND '.join(
+            ['({0} OR {0})'.format(pattern)] * len(words)
+        )), params
+
+
+def search_items(items: query.QuerySet, value: str) -> query.QuerySet:
+    """
+    Items whose description contains all words of value or whose SKU starts
+    with value. Both conditions are answered by their own index and the union
+    of the matching ids is materialized once on MySQL, so the search combines
+    with the other filters without a full table scan.
+    :param items: queryset to search in
+    :param value: search input
+    :return: filtered queryset
+    """
+    value = value.strip()
+    if not value:
+        return items
+    manager = items.model._default_manager
+    matches = manager.filter(sku__istartswith=value).values('id')
+    if search_words(value):
+        matches = matches.union(manager.filter(item_description__search=value).values('id'))
+    if connections[items.db].vendor == 'mysql':
+        # MySQL runs a UNION in IN as dependent subquery for every row,
+        # a derived table is run once
+        sql, params = matches.query.sql_with_params()
+        matches = RawSQL('SELECT id FROM ({}) AS matches'.format(sql), params)
+    return items.filter(id__in=matches)
@@ -3,16 +3,81 @@
     which is necessary for creating REST API Json response
 """
 
+from typing import List
+
 from rest_framework import serializers
 from .models import EbayItem, BWStageEnum
 
+# Serialized fields when the request does not choose them
+DEFAULT_FIELDS = [
+    'id',
+    'item_no',
+    'auction_id',
+    'sales_l14',
+    'sales_l7',
+    'fc',
+    'item_status'
+]
+# Fields serialized under another name than their model field
+FIELD_SOURCES = {
+    'sales_l14': 'sales_goal_reached_in_last14days',
+    'sales_l7': 'sales_goal_reached_in_last7days',
+}
+
+
+def item_fields() -> List[str]:
+    """
+    All fields a request may choose, the renamed ones under their new name.
+    The non editable bookkeeping fields of the pipeline are not serialized.
+    :return: field names
+    """
+    renamed = set(FIELD_SOURCES.values())
+    return [field.name for field in EbayItem._meta.concrete_fields
+            if field.editable and field.name not in renamed] + list(FIELD_SOURCES)
+
+
+def parse_fieldset(query_params) -> List[str]:
+    """
+    Fields chosen by ?fields= and ?exclude=, comma separated. exclude
+    applies to the chosen or else the default fields.
+    :param query_params: request query parameters
+    :return: field names in serialized order
+    :raises serializers.ValidationError: on unknown fields or none left
+    """
+    known = item_fields()
+    chosen = {}
+    for param in ('fields', 'exclude'):
+        names = [name.strip() for value in query_params.getlist(param)
+                 for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise serializers.ValidationError({param: [
+                'Unknown fields: {}. Choose from: {}.'.format(', '.join(unknown), ', '.join(known))
+            ]})
+        chosen[param] = names
+    fields = list(dict.fromkeys(chosen['fields'])) or DEFAULT_FIELDS
+    fields = [name for name in fields if name not in chosen['exclude']]
+    if not fields:
+        raise serializers.ValidationError({'exclude': ['No fields left to serialize.']})
+    return fields
+
+
+def field_columns(fields: List[str]) -> List[str]:
+    """
+    Model fields to load for the serialized fields
+    :param fields: serialized field names
+    :return: model field names
+    """
+    return [FIELD_SOURCES.get(name, name) for name in fields]
+
 
 class EbayItemsSerializer(serializers.ModelSerializer):
     """
-        Serializers of model EbayItem
+        Serializers of model EbayItem, the serialized fields can be chosen
+        with the fields argument among item_fields()
     """
-    sales_l14 = serializers.FloatField(source='sales_goal_reached_in_last14days')
-    sales_l7 = serializers.FloatField(source='sales_goal_reached_in_last7days')
+    sales_l14 = serializers.FloatField(source=FIELD_SOURCES['sales_l14'])
+    sales_l7 = serializers.FloatField(source=FIELD_SOURCES['sales_l7'])
     item_status = serializers.ChoiceField(choices=[(tag.value, tag.value) for tag in BWStageEnum])
 
     class Meta: # pylint: disable=too-few-public-methods
@@ -20,12 +85,19 @@ class EbayItemsSerializer(serializers.ModelSerializer):
             Defines model and which fields to be serialized
         """
         model = EbayItem
-        fields = [
-            'id',
-            'item_no',
-            'auction_id',
-            'sales_l14',
-            'sales_l7',
-            'fc',
-            'item_status'
-        ]
+        fields = DEFAULT_FIELDS
+
+    def __init__(self, *args, fields: List[str] = None, **kwargs):
+        self.chosen_fields = fields
+        super().__init__(*args, **kwargs)
+
+    def get_field_names(self, declared_fields, info):
+        """
+            Only the chosen fields are built
+        :param declared_fields:
+        :param info:
+        :return: field names
+        """
+        if self.chosen_fields is not None:
+            return self.chosen_fields
+        return super().get_field_names(declared_fields, info)
@@ -0,0 +1,172 @@
+"""
+This module is a dry run of the badewanne process tracking. The catalog is
+loaded once into arrays and the BADEWANNE_RULES are evaluated in memory for
+any number of threshold combinations. Neither the database nor the pricing
+api is touched, so thresholds can be tuned without waiting for real cycles.
+"""
+
+import collections
+import datetime
+import itertools
+import logging
+from typing import List
+
+import numpy as np
+import pandas as pd
+from django.db.models import query
+from django.utils.timezone import get_current_timezone
+
+from .models import EbayItem, BWStageEnum
+from . import rules
+from .rules import BADEWANNE_RULES, DEFAULT_THRESHOLDS, BadewanneThresholds
+
+LOGGER = logging.getLogger(__name__)
+
+CATALOG_COLUMNS = [
+    'id', 'our_purchase_price', 'current_sale_price', 'last_humansetprice_before_badewanne'
+] + rules.rule_fields(BADEWANNE_RULES)
+
+Catalog = collections.namedtuple('Catalog', [
+    'ids', 'status', 'fields', 'current_prices', 'branch_statuses', 'stage_prices',
+    'stage_deltas'
+])
+
+
+def load_catalog(items: query.QuerySet = None) -> Catalog:
+    """
+    Load the items once into arrays and price them for every stage
+    :param items: queryset to simulate, all items when None
+    :return: Catalog
+    """
+    if items is None:
+        items = EbayItem.objects.all()
+    frame = pd.DataFrame.from_records(
+        list(items.values_list(*CATALOG_COLUMNS)), columns=CATALOG_COLUMNS
+    )
+    LOGGER.info("Loaded %s items for the badewanne simulation", len(frame))
+    return catalog_from_frame(frame)
+
+
+def catalog_from_frame(frame: pd.DataFrame) -> Catalog:
+    """
+    Build the simulation arrays from a frame of the CATALOG_COLUMNS
+    :param frame: pandas dataframe
+    :return: Catalog
+    """
+    status = frame['item_status'].values.astype(object)
+    current_prices = frame['current_sale_price'].values.astype(np.float64)
+    purchase_prices = frame['our_purchase_price'].values.astype(np.float64)
+    # stage 0 items start the badewanne from their current price
+    base_prices = np.where(
+        status == BWStageEnum.BW_STAGE0.value,
+        current_prices,
+        frame['last_humansetprice_before_badewanne'].values.astype(np.float64)
+    )
+    stage_prices = np.vstack([smart_prices(base_prices, purchase_prices, rule.discount)
+                              for rule in BADEWANNE_RULES])
+    return Catalog(
+        ids=frame['id'].values.astype(np.int64),
+        status=status,
+        fields={field: frame[field].values for field in rules.rule_fields(BADEWANNE_RULES)
+                if field != 'item_status'},
+        current_prices=current_prices,
+        branch_statuses=[[rules.status_mask(branch.statuses, status) for branch in rule.branches]
+                         for rule in BADEWANNE_RULES],
+        stage_prices=stage_prices,
+        stage_deltas=stage_prices - current_prices
+    )
+
+
+def smart_prices(base_prices: np.ndarray, purchase_prices: np.ndarray,
+                 discount: float) -> np.ndarray:
+    """
+    Vectorized get_smart_price_number, the result equals the scalar version
+    :param base_prices: base prices for badewanne process
+    :param purchase_prices: prices we pay for manufacture
+    :param discount: discount value
+    :return: smarter prices
+    """
+    discount_prices = np.maximum(np.asarray(base_prices, dtype=np.float64) * (1 - discount),
+                                 np.asarray(purchase_prices, dtype=np.float64) * 1.15)
+    integers = np.floor(discount_prices)
+    decimals = np.where(
+        (integers > 20) | ((integers < 20) & (discount_prices - integers > 0.5)), 0.99, 0.49
+    )
+    return np.where(integers % 10 == 0, integers - 0.01, integers + decimals)
+
+
+def simulate(catalog: Catalog, thresholds: BadewanneThresholds) -> np.ndarray:
+    """
+    Apply the BADEWANNE_RULES in order as if all price changes succeed. No
+    rule selects the status an earlier rule moves to, so every item moves to
+    the first stage it qualifies for by its original status.
+    :param catalog: Catalog
+    :param thresholds: BadewanneThresholds
+    :return: index into BADEWANNE_RULES of the stage every item moves to,
+    -1 for items which stay
+    """
+    now = datetime.datetime.now(tz=get_current_timezone())
+    target = np.full(len(catalog.ids), -1, dtype=np.int8)
+    unmoved = np.ones(len(catalog.ids), dtype=bool)
+    for index, rule in enumerate(BADEWANNE_RULES):
+        selected = np.zeros(len(catalog.ids), dtype=bool)
+        for branch, statuses in zip(rule.branches, catalog.branch_statuses[index]):
+            selected |= statuses & rules.condition_mask(branch.condition, catalog.fields,
+                                                        thresholds, now)
+        selected &= unmoved
+        unmoved &= ~selected
+        target[selected] = index
+    return target
+
+
+def summarize(catalog: Catalog, thresholds: BadewanneThresholds,
+              target: np.ndarray) -> collections.OrderedDict:
+    """
+    Item counts per stage and price deltas of one simulation. The catalog has
+    no unit sales, so the revenue delta is the change of revenue if every
+    moved item sells one unit.
+    :param catalog: Catalog
+    :param thresholds: BadewanneThresholds
+    :param target: result of simulate
+    :return: ordered dict of the thresholds and the results
+    """
+    summary = collections.OrderedDict(thresholds._asdict())
+    moved = revenue_delta = increases = decreases = 0
+    for index, rule in enumerate(BADEWANNE_RULES):
+        selected = target == index
+        count = int(np.count_nonzero(selected))
+        summary[rule.target.value] = count
+        moved += count
+        if count:
+            deltas = catalog.stage_deltas[index]
+            revenue_delta += float(np.dot(deltas, selected))
+            increases += int(np.count_nonzero(selected & (deltas > 0)))
+            decreases += int(np.count_nonzero(selected & (deltas < 0)))
+    summary['moved'] = moved
+    summary['revenue_delta'] = revenue_delta
+    summary['price_increases'] = increases
+    summary['price_decreases'] = decreases
+    return summary
+
+
+def threshold_grid(**values) -> List[BadewanneThresholds]:
+    """
+    All combinations of the given threshold values, thresholds which are not
+    given keep their default
+    :param values: threshold name to list of values
+    :return: list of BadewanneThresholds
+    """
+    names = list(values)
+    return [DEFAULT_THRESHOLDS._replace(**dict(zip(names, combination)))
+            for combination in itertools.product(*[values[name] for name in names])]
+
+
+def sweep(catalog: Catalog, combinations: List[BadewanneThresholds]) -> pd.DataFrame:
+    """
+    Simulate every threshold combination on the catalog
+    :param catalog: Catalog
+    :param combinations: list of BadewanneThresholds
+    :return: pandas dataframe with one summary row per combination
+    """
+    return pd.DataFrame([summarize(catalog, thresholds, simulate(catalog, thresholds))
+                         for thresholds in combinations])
@@ -0,0 +1,336 @@
+"""
+This module records slow SQL of web requests and background tasks. When
+SLOW_SQL_MS is set, every statement slower than it is captured with its call
+site, the view or task function running it, its duration and row count. At
+the end of the request or task the captures are stored as SlowQuery, one row
+per normalized statement, and the EXPLAIN of a statement is taken the first
+time this process sees it. Nothing is wrapped when SLOW_SQL_MS is unset.
+"""
+
+import contextlib
+import contextvars
+import datetime
+import functools
+import hashlib
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+from django.utils.timezone import get_current_timezone
+
+from .models import SlowQuery
+
+LOGGER = logging.getLogger(__name__)
+
+# Stored characters of the example statement with its parameters
+EXAMPLE_LENGTH = 10000
+# Distinct call sites kept per statement
+CALL_SITES = 10
+# Prefix of the plan statement per database vendor
+EXPLAIN_PREFIX = {
+    'mysql': 'EXPLAIN ',
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT)\b', re.IGNORECASE)
+# Literals and placeholders become ?, lists of them collapse to one
+NORMALIZE = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN \(\?(?:\s*,\s*\?)*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'\bVALUES \([^()]*\)(?:\s*,\s*\([^()]*\))*', re.IGNORECASE), 'VALUES (...)'),
+    (re.compile(r'(?:\bWHEN \([^()]*\) THEN \?\s*)+', re.IGNORECASE), 'WHEN ... THEN ? '),
+    (re.compile(r'\s+'), ' '),
+]
+
+_RECORDER = contextvars.ContextVar('slow_sql_recorder', default=None)
+_EXPLAINED = set()
+
+
+def get_slow_ms():
+    """
+    Duration from which on a statement is recorded
+    :return: milliseconds or None when off
+    """
+    return getattr(settings, 'SLOW_SQL_MS', None)
+
+
+def get_capture_limit() -> int:
+    """
+    Statements captured per request or task at most
+    :return: int
+    """
+    return getattr(settings, 'SLOW_SQL_CAPTURE_LIMIT', 100)
+
+
+def normalize(sql: str) -> str:
+    """
+    Statement without its values, equal for all executions of a query
+    :param sql: statement
+    :return: normalized statement
+    """
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Key of a normalized statement
+    :param statement: normalized statement
+    :return: hex digest
+    """
+    return hashlib.sha1(statement.encode('utf-8')).hexdigest()
+
+
+def explain(alias: str, sql: str, params) -> str:
+    """
+    Plan of a statement as tab separated rows with a header
+    :param alias: database alias
+    :param sql: statement
+    :param params: parameters of the statement
+    :return: plan or an empty string when it cannot be explained
+    """
+    db_connection = connections[alias]
+    prefix = EXPLAIN_PREFIX.get(db_connection.vendor)
+    if prefix is None or not EXPLAINABLE.match(sql):
+        return ''
+    try:
+        with db_connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            header = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+    except DatabaseError:
+        LOGGER.warning("Slow statement could not be explained: %s", sql[:200], exc_info=True)
+        return ''
+    return '\n'.join('\t'.join(str(value) for value in row) for row in [header] + rows)
+
+
+class Capture:
+    """
+    Executions of one normalized statement within a request or task
+    """
+
+    def __init__(self, alias: str, statement: str):
+        self.alias = alias
+        self.statement = statement
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = None
+        self.sql = None
+        self.params = None
+
+    def add(self, sql: str, params, milliseconds: float, rows) -> None:
+        """
+        Account an execution, the slowest one is kept as example
+        :param sql: statement
+        :param params: parameters of the statement
+        :param milliseconds: duration
+        :param rows: row count or None when unknown
+        :return: None
+        """
+        self.calls += 1
+        self.total_ms += milliseconds
+        if milliseconds >= self.max_ms:
+            self.max_ms, self.rows, self.sql, self.params = milliseconds, rows, sql, params
+
+    @property
+    def example(self) -> str:
+        """
+        Slowest execution with its parameters
+        :return: str
+        """
+        return '{}\n-- params: {!r}'.format(self.sql, self.params)[:EXAMPLE_LENGTH]
+
+
+class SlowQueryRecorder:
+    """
+    Execute wrapper capturing the slow statements on all databases
+    """
+
+    def __init__(self, call_site: str, slow_ms: float):
+        self.call_site = call_site
+        self.slow_seconds = slow_ms / 1000
+        self.limit = get_capture_limit()
+        self.captures = {}
+        self.skipped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        seconds = time.perf_counter() - started
+        if seconds >= self.slow_seconds:
+            rowcount = getattr(context['cursor'], 'rowcount', -1)
+            self.capture(context['connection'].alias, sql, None if many else params,
+                         seconds * 1000, rowcount if rowcount >= 0 else None)
+        return result
+
+    def capture(self, alias: str, sql: str, params, milliseconds: float, rows) -> None:
+        """
+        Account a slow execution to its statement
+        :param alias: database alias
+        :param sql: statement
+        :param params: parameters, None for executemany
+        :param milliseconds: duration
+        :param rows: row count or None when unknown
+        :return: None
+        """
+        statement = normalize(sql)
+        key = fingerprint(statement)
+        if key not in self.captures:
+            if len(self.captures) >= self.limit:
+                self.skipped += 1
+                return
+            self.captures[key] = Capture(alias, statement)
+        self.captures[key].add(sql, params, milliseconds, rows)
+
+    @contextlib.contextmanager
+    def recording(self):
+        """
+        Capture the slow statements of the block
+        """
+        token = _RECORDER.set(self)
+        try:
+            with contextlib.ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(self))
+                yield self
+        finally:
+            _RECORDER.reset(token)
+
+    def store(self) -> None:
+        """
+        Store the captured statements, explaining the ones new to this process
+        :return: None
+        """
+        if self.skipped:
+            LOGGER.warning("%s slow statements of %s exceeded the capture limit",
+                           self.skipped, self.call_site)
+        now = datetime.datetime.now(tz=get_current_timezone())
+        for key, capture in self.captures.items():
+            try:
+                plan = ''
+                if key not in _EXPLAINED and capture.params is not None:
+                    plan = explain(capture.alias, capture.sql, capture.params)
+                store_capture(key, capture, self.call_site, plan, now)
+                if plan:
+                    _EXPLAINED.add(key)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Slow statement of %s could not be stored", self.call_site)
+
+
+def store_capture(key: str, capture: Capture, call_site: str, plan: str,
+                  now: datetime.datetime) -> None:
+    """
+    Add a capture to the SlowQuery of its statement
+    :param key: fingerprint of the statement
+    :param capture: Capture
+    :param call_site: view or task name
+    :param plan: EXPLAIN output, empty when not taken
+    :param now: time of the capture
+    :return: None
+    """
+    call_site = call_site[:300]
+    with transaction.atomic():
+        query, created = SlowQuery.objects.select_for_update().get_or_create(
+            fingerprint=key, defaults={
+                'statement': capture.statement, 'example': capture.example,
+                'call_sites': call_site, 'last_call_site': call_site, 'calls': capture.calls,
+                'total_ms': capture.total_ms, 'max_ms': capture.max_ms,
+                'max_ms_rows': capture.rows, 'explain': plan, 'first_seen': now, 'last_seen': now,
+            }
+        )
+        if created:
+            return
+        query.calls += capture.calls
+        query.total_ms += capture.total_ms
+        if capture.max_ms >= query.max_ms:
+            query.max_ms, query.max_ms_rows, query.example = (
+                capture.max_ms, capture.rows, capture.example
+            )
+        sites = query.call_sites.splitlines()
+        if call_site not in sites and len(sites) < CALL_SITES:
+            query.call_sites = '\n'.join(sites + [call_site])
+        query.last_call_site = call_site
+        query.last_seen = now
+        if plan:
+            query.explain = plan
+        query.save()
+
+
+@contextlib.contextmanager
+def recorded_block(call_site: str):
+    """
+    Record the slow statements of the block for call_site. Inside another
+    recorded block the statements count to the outer one under call_site.
+    :param call_site: view or task name
+    """
+    outer = _RECORDER.get()
+    if outer is not None:
+        previous, outer.call_site = outer.call_site, call_site
+        try:
+            yield outer
+        finally:
+            outer.call_site = previous
+        return
+    slow_ms = get_slow_ms()
+    if slow_ms is None:
+        yield None
+        return
+    recorder = SlowQueryRecorder(call_site, slow_ms)
+    try:
+        with recorder.recording():
+            yield recorder
+    finally:
+        recorder.store()
+
+
+def recorded(call_site: str):
+    """
+    Decorator recording the slow statements of every call of the function
+    :param call_site: task name
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with recorded_block(call_site):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SlowQueryMiddleware:
+    """
+    Middleware recording the slow statements of the requests under the name
+    of their view. Removes itself when SLOW_SQL_MS is unset.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if get_slow_ms() is None:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        with recorded_block(request.path):
+            return self.get_response(request)
+
+    @staticmethod
+    def process_view(request, view_func, view_args, view_kwargs):  # pylint: disable=unused-argument
+        """
+            Name the call site after the view
+        :param request:
+        :param view_func:
+        :param view_args:
+        :param view_kwargs:
+        :return: None
+        """
+        recorder = _RECORDER.get()
+        if recorder is not None:
+            recorder.call_site = '{}.{}'.format(
+                view_func.__module__, getattr(view_func, '__qualname__', view_func.__name__)
+            )
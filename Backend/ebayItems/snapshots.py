@@ -0,0 +1,231 @@
+"""
+This module keeps the BIServer data of every sync as a local snapshot in
+Arrow IPC file format. Snapshots are memory mapped when read, so the diff of
+the new BIServer data against the previous snapshot does not need to read
+the ebayitem table again. Every snapshot row carries the EbayItem id it was
+written to. Old snapshots are removed beyond the retention limit and the
+remaining ones can be replayed for debugging.
+
+A snapshot diff only sees the changes of BIServer. Items changed locally,
+prices set by the pipeline, edits in the admin and over the api, keep their
+local values while BIServer reports the same row again, and rows deleted
+locally keep their snapshot id. This drift is corrected by a full diff
+against the ebayitem table, which runs when no recent snapshot exists and
+at least every BISERVER_SNAPSHOT_FULL_DIFF_SECONDS.
+"""
+
+import datetime
+import glob
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.conf import settings
+from django.utils.timezone import get_current_timezone
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = 'biserver-'
+SNAPSHOT_SUFFIX = '.arrow'
+SNAPSHOT_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+# File in the snapshot directory holding the time of the last full diff
+FULL_DIFF_MARKER = 'full-diff'
+
+
+def get_snapshot_dir() -> Optional[str]:
+    """
+    Directory of the snapshots, snapshots are disabled when not set
+    :return: directory path or None
+    """
+    return getattr(settings, 'BISERVER_SNAPSHOT_DIR', None)
+
+
+def snapshots_enabled() -> bool:
+    """
+    Whether the sync diffs against local snapshots
+    :return: bool
+    """
+    return bool(get_snapshot_dir())
+
+
+def get_snapshot_retention() -> int:
+    """
+    Number of snapshots kept on disk
+    :return: number of snapshots
+    """
+    return max(1, int(getattr(settings, 'BISERVER_SNAPSHOT_RETENTION', 5)))
+
+
+def get_snapshot_max_age() -> datetime.timedelta:
+    """
+    Older snapshots are not diffed against, the sync then falls back to a
+    full diff against the ebayitem table which also corrects any drift
+    :return: maximum age of the previous snapshot
+    """
+    return datetime.timedelta(seconds=getattr(settings, 'BISERVER_SNAPSHOT_MAX_AGE', 86400))
+
+
+def get_full_diff_interval() -> datetime.timedelta:
+    """
+    Longest time between two full diffs against the ebayitem table
+    :return: timedelta
+    """
+    return datetime.timedelta(
+        seconds=getattr(settings, 'BISERVER_SNAPSHOT_FULL_DIFF_SECONDS', 21600)
+    )
+
+
+def full_diff_due(now: datetime.datetime = None) -> bool:
+    """
+    Whether the sync has to diff against the ebayitem table to correct the
+    drift of the local edits although a snapshot exists
+    :param now: point of time, defaults to now
+    :return: bool
+    """
+    path = os.path.join(get_snapshot_dir(), FULL_DIFF_MARKER)
+    if not os.path.exists(path):
+        return True
+    with open(path) as marker:
+        last = datetime.datetime.fromisoformat(marker.read().strip())
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    return now - last >= get_full_diff_interval()
+
+
+def mark_full_diff(now: datetime.datetime = None) -> None:
+    """
+    Record that the sync diffed against the ebayitem table
+    :param now: point of time of the diff, defaults to now
+    :return: None
+    """
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    os.makedirs(get_snapshot_dir(), exist_ok=True)
+    path = os.path.join(get_snapshot_dir(), FULL_DIFF_MARKER)
+    with open(path + '.tmp', 'w') as marker:
+        marker.write(now.isoformat())
+    os.replace(path + '.tmp', path)
+
+
+def snapshot_paths() -> List[str]:
+    """
+    Paths of all snapshots, oldest first
+    :return: list of file paths
+    """
+    return sorted(glob.glob(os.path.join(
+        get_snapshot_dir(), '{}*{}'.format(SNAPSHOT_PREFIX, SNAPSHOT_SUFFIX)
+    )))
+
+
+def snapshot_time(path: str) -> datetime.datetime:
+    """
+    Point of time the snapshot was taken at
+    :param path: snapshot file path
+    :return: datetime
+    """
+    name = os.path.basename(path)[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+    return datetime.datetime.strptime(name, SNAPSHOT_TIME_FORMAT).replace(
+        tzinfo=datetime.timezone.utc
+    )
+
+
+def write_snapshot(frame: pd.DataFrame, now: datetime.datetime = None) -> str:
+    """
+    Persist a frame as new snapshot and remove snapshots beyond the retention
+    :param frame: BIServer frame with the EbayItem id column
+    :param now: point of time of the snapshot, defaults to now
+    :return: path of the snapshot
+    """
+    now = (now or datetime.datetime.now(tz=get_current_timezone())).astimezone(
+        datetime.timezone.utc
+    )
+    os.makedirs(get_snapshot_dir(), exist_ok=True)
+    path = os.path.join(get_snapshot_dir(), '{}{}{}'.format(
+        SNAPSHOT_PREFIX, now.strftime(SNAPSHOT_TIME_FORMAT), SNAPSHOT_SUFFIX
+    ))
+    table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    os.replace(path + '.tmp', path)
+    for old_path in snapshot_paths()[:-get_snapshot_retention()]:
+        os.remove(old_path)
+    LOGGER.info("Wrote snapshot %s with %s rows", path, len(frame))
+    return path
+
+
+def read_snapshot(path: str) -> pd.DataFrame:
+    """
+    Read a snapshot through a memory map
+    :param path: snapshot file path
+    :return: pandas dataframe
+    """
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def read_latest_snapshot(now: datetime.datetime = None) -> Optional[pd.DataFrame]:
+    """
+    The most recent snapshot if it is not older than the maximum age
+    :param now: point of time, defaults to now
+    :return: pandas dataframe or None
+    """
+    paths = snapshot_paths()
+    if not paths:
+        return None
+    now = now or datetime.datetime.now(tz=get_current_timezone())
+    if now - snapshot_time(paths[-1]) > get_snapshot_max_age():
+        LOGGER.info("Latest snapshot %s is too old to diff against", paths[-1])
+        return None
+    return read_snapshot(paths[-1])
+
+
+def columns_differ(previous: pd.Series, current: pd.Series) -> np.ndarray:
+    """
+    Elementwise inequality of two aligned columns, independent of whether
+    they are stored as categoricals, float32 or float64
+    :param previous: column of the previous snapshot
+    :param current: column of the new data
+    :return: boolean array
+    """
+    if pd.api.types.is_numeric_dtype(previous) and pd.api.types.is_numeric_dtype(current):
+        return previous.values.astype(np.float64) != current.values.astype(np.float64)
+    return previous.astype(str).values != current.astype(str).values
+
+
+def diff_snapshots(previous: pd.DataFrame, current: pd.DataFrame, key_columns: List[str],
+                   compare_columns: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray,
+                                                        np.ndarray, np.ndarray]:
+    """
+    Diff the new BIServer data against the previous snapshot. When a key
+    exists more than once in the previous snapshot the first row wins.
+    :param previous: previous snapshot with the EbayItem id column
+    :param current: new BIServer data
+    :param key_columns: columns identifying an item
+    :param compare_columns: columns whose change makes an update
+    :return: row positions to insert, row positions to update, ids of the
+    rows to update, row positions which are unchanged and their ids
+    """
+    columns = key_columns + compare_columns
+    left = current[columns].reset_index(drop=True)
+    left['ItemNo'] = left['ItemNo'].astype(np.int64)
+    left['AuctionID'] = left['AuctionID'].astype(str)
+    left['position'] = np.arange(len(left))
+    right = previous[columns + ['id']].drop_duplicates(subset=key_columns, keep='first')
+    right = right.rename(columns={column: column + '_previous' for column in compare_columns})
+    right['ItemNo'] = right['ItemNo'].astype(np.int64)
+    right['AuctionID'] = right['AuctionID'].astype(str)
+    merged = left.merge(right, how='left', on=key_columns, sort=False)
+
+    found = merged['id'].notna().values
+    changed = np.zeros(len(merged), dtype=bool)
+    for column in compare_columns:
+        changed |= columns_differ(merged[column + '_previous'], merged[column])
+    positions = merged['position'].values.astype(np.int64)
+    ids = merged['id'].values
+    update = found & changed
+    unchanged = found & ~changed
+    return (positions[~found], positions[update], ids[update].astype(np.int64),
+            positions[unchanged], ids[unchanged].astype(np.int64))
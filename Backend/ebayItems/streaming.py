@@ -0,0 +1,116 @@
+"""
+This module streams query results from the database without holding them in
+memory. The item feed writes the filtered items as newline delimited JSON
+from a server side cursor, optionally gzip compressed, so that consumers can
+pull the whole catalog in one request.
+"""
+
+import contextlib
+from typing import Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import BooleanField, Value, query
+from django.utils.text import compress_sequence
+from rest_framework import renderers
+
+# Rows fetched from the cursor and lines written to the response at once
+FETCH_SIZE = 2000
+
+
+@contextlib.contextmanager
+def streaming_cursor(db_connection):
+    """
+    Cursor which fetches rows from the server while they are consumed instead
+    of buffering the whole result. MySQL needs an unbuffered cursor for this,
+    the cursors of the other backends stream already.
+    :param db_connection: django database connection
+    :return: DB-API cursor
+    """
+    if db_connection.vendor != 'mysql':
+        with db_connection.cursor() as cursor:
+            yield cursor
+        return
+    from MySQLdb.cursors import SSCursor  # pylint: disable=import-outside-toplevel
+    db_connection.ensure_connection()
+    cursor = db_connection.connection.cursor(SSCursor)
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def stream_values(items: query.QuerySet, columns: List[str]) -> Iterator[tuple]:
+    """
+    Values of the columns of the items, converted like values_list does
+    :param items: queryset, its database is fixed when the stream starts
+    :param columns: model field names
+    :return: iterator of tuples
+    """
+    compiler = items.values_list(*columns).query.get_compiler(using=items.db)
+    sql, params = compiler.as_sql()
+    with streaming_cursor(connections[items.db]) as cursor:
+        cursor.execute(sql, params)
+        chunks = iter(lambda: cursor.fetchmany(FETCH_SIZE), [])
+        yield from compiler.results_iter(results=chunks)
+
+
+def ndjson_lines(items: query.QuerySet, fields: List[str], columns: List[str]) -> Iterator[str]:
+    """
+    Items as JSON objects, one per line, in blocks of FETCH_SIZE lines
+    :param items: queryset
+    :param fields: names of the fields in the objects
+    :param columns: model fields of the fields
+    :return: iterator of text blocks
+    """
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    block = []
+    for row in stream_values(items, columns):
+        block.append(encoder.encode(dict(zip(fields, row))))
+        if len(block) >= FETCH_SIZE:
+            yield '\n'.join(block) + '\n'
+            block = []
+    if block:
+        yield '\n'.join(block) + '\n'
+
+
+def tombstone_lines(ids: query.QuerySet) -> Iterator[str]:
+    """
+    Removed items as JSON objects of their id and "deleted": true, one per
+    line, in blocks of FETCH_SIZE lines
+    :param ids: queryset of the removed items
+    :return: iterator of text blocks
+    """
+    return ndjson_lines(ids.annotate(deleted=Value(True, output_field=BooleanField())),
+                        ['id', 'deleted'], ['id', 'deleted'])
+
+
+def encoded(blocks: Iterator[str], gzip: bool) -> Iterator[bytes]:
+    """
+    Encode text blocks as UTF-8, gzip compressed when asked
+    :param blocks: iterator of text
+    :param gzip: whether to compress
+    :return: iterator of bytes
+    """
+    data = (block.encode('utf-8') for block in blocks)
+    return compress_sequence(data) if gzip else data
+
+
+
+class NDJSONRenderer(renderers.JSONRenderer):
+    """
+    Renderer of the responses of the feed which are not streamed, the error
+    responses, as a single JSON line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+            Render data as one line
+        :param data:
+        :param accepted_media_type:
+        :param renderer_context:
+        :return: bytes
+        """
+        return super().render(data, accepted_media_type, renderer_context) + b'\n'
@@ -2,10 +2,61 @@
     This module defines how the ebayitem is visualized in table
 """
 
+import collections
+
 import django_tables2 as tables
 
 from .models import EbayItem
 
+# Columns of the presets a user can choose on the table view, None shows all
+COLUMN_PRESETS = collections.OrderedDict([
+    ('all', None),
+    ('overview', [
+        'item_no', 'sku', 'country', 'item_status', 'stock', 'item_ranking_today',
+        'current_sale_price', 'sales_goal_reached_in_last7days'
+    ]),
+    ('pricing', [
+        'item_no', 'sku', 'item_status', 'our_purchase_price', 'current_sale_price',
+        'suggested_sale_price', 'last_humansetprice_before_badewanne', 'new_price'
+    ]),
+    ('badewanne', [
+        'item_no', 'sku', 'item_status', 'lrw', 'fc', 'cogs_24h_vs_7d', 'item_ranking_today',
+        'sales_goal_reached_mtd', 'last_bw_start_date', 'last_bw_end_date'
+    ]),
+])
+DEFAULT_PRESET = 'all'
+
+
+def item_columns() -> list:
+    """
+    Model fields the table can show, the non editable bookkeeping fields of
+    the pipeline, catalog version and missing cycles, are left out
+    :return: list of field names
+    """
+    return [field.name for field in EbayItem._meta.concrete_fields if field.editable]
+
+
+def preset_fields(preset: str) -> list:
+    """
+    Model fields shown by a column preset
+    :param preset: name in COLUMN_PRESETS
+    :return: list of field names
+    """
+    fields = COLUMN_PRESETS[preset]
+    if fields is None:
+        return item_columns()
+    return fields
+
+
+def preset_exclude(preset: str) -> list:
+    """
+    Model fields hidden by a column preset
+    :param preset: name in COLUMN_PRESETS
+    :return: list of field names
+    """
+    shown = set(preset_fields(preset))
+    return [field.name for field in EbayItem._meta.concrete_fields if field.name not in shown]
+
 
 class TableControlMixin(tables.Table):
     """
@@ -35,6 +86,7 @@ class EbayItemTable(TableControlMixin, tables.Table):
             which template to be used
         """
         model = EbayItem
+        exclude = [field.name for field in EbayItem._meta.concrete_fields if not field.editable]
         template_name = 'django_tables2/bootstrap4.html'
 
     def render_percent(self, value):
@@ -5,10 +5,13 @@ Background and periodically. The item price changing is also done in background
 and can be scheduled, which improve the front user experience and organize the
 task in more manageable way.
 """
+import collections
 import datetime
+import functools
 import json
 import logging
 import math
+import operator
 from typing import List, Tuple
 import requests
 import numpy as np
@@ -16,53 +19,236 @@ import pymssql
 import pandas as pd
 
 from background_task import background
+from django.conf import settings
 from django.db.models import Q, query
-from django.db import connection
+from django.db import connections, transaction
 from django.utils.timezone import get_current_timezone
 
-from .models import EbayItem, BWStageEnum
+from .models import EbayItem, BWStageEnum, ItemClaim
+from . import (
+    archive, catalog, history, leases, memprofile, parallel, progress, rules, slowsql,
+    snapshots, throughput
+)
+from .streaming import streaming_cursor
 
 LOGGER = logging.getLogger(__name__)
 
+KEY_COLUMNS = ['ItemNo', 'AuctionID']
+
+EXISTING_ITEM_FIELDS = ['id', 'item_no', 'auction_id', 'item_status']
+LOAD_CHUNK_SIZE = 10000
+
+# Columns of vFactEbayPrices the sync uses and their types, low cardinality
+# strings become categoricals
+BISERVER_SCHEMA = collections.OrderedDict([
+    ('ItemNo', 'integer'),
+    ('eBayItemID', 'string'),
+    ('AuctionID', 'string'),
+    ('SKU', 'string'),
+    ('ItemDescription', 'string'),
+    ('SalesGoalReachedInLast14Days', 'float'),
+    ('SalesGoalReachedInLast7Days', 'float'),
+    ('FC_Erf_MTD', 'float'),
+    ('COGS24HVS7D', 'float'),
+    ('Channel', 'category'),
+    ('Country', 'category'),
+    ('OurPurchasePrice', 'float'),
+    ('CurrentSalePrice', 'float'),
+    ('SuggestedSalePrice', 'float'),
+    ('DIO1', 'integer'),
+    ('DIO2', 'integer'),
+    ('Bestand_Gesamt', 'integer'),
+    ('LRW', 'integer'),
+    ('FC', 'integer'),
+    ('PositionCurrentDay', 'integer'),
+])
+
+# EbayItem fields refreshed from BIServer on every sync and their columns
+SYNC_UPDATE_FIELDS = collections.OrderedDict([
+    ('item_description', 'ItemDescription'),
+    ('sales_goal_reached_in_last14days', 'SalesGoalReachedInLast14Days'),
+    ('sales_goal_reached_in_last7days', 'SalesGoalReachedInLast7Days'),
+    ('sales_goal_reached_mtd', 'FC_Erf_MTD'),
+    ('channel', 'Channel'),
+    ('country', 'Country'),
+    ('our_purchase_price', 'OurPurchasePrice'),
+    ('current_sale_price', 'CurrentSalePrice'),
+    ('suggested_sale_price', 'SuggestedSalePrice'),
+    ('dio1', 'DIO1'),
+    ('dio2', 'DIO2'),
+    ('lrw', 'LRW'),
+    ('fc', 'FC'),
+    ('stock', 'Bestand_Gesamt'),
+    ('item_id', 'eBayItemID'),
+    ('cogs_24h_vs_7d', 'COGS24HVS7D'),
+    ('item_ranking_today', 'PositionCurrentDay'),
+])
+
+# Parameters per IN clause, stays below the SQLite variable limit
+QUERY_BATCH_SIZE = 900
+
+STATUS_COLUMNS = [
+    'id', 'item_no', 'country', 'channel', 'item_status', 'lrw', 'stock', 'fc',
+    'item_ranking_today', 'sales_goal_reached_in_last7days',
+    'sales_goal_reached_in_last14days', 'sales_goal_reached_mtd',
+    'last_bw_start_date', 'last_bw_end_date'
+]
+
 
 @background()
-def ebay_badewanne_update() -> None:
+@slowsql.recorded('ebayItems.tasks.ebay_badewanne_update')
+@progress.published('ebay_badewanne_update')
+@memprofile.profiled('ebay_badewanne_update')
+def ebay_badewanne_update(countries: List[str] = None) -> None:
     """
     Background task which scheduled in every certain point of time.
     First to sync the data from BIServer, then update all the items
     in Badewanne.
+    :param countries: markets of the status maintenance and Badewanne, all
+    when None, the sync always covers all of them
     :return:  None
     """
-    sync_eaby_item()
-    sync_items_status()
-    badewanne_process_tracking.now()
+    if leases.leases_enabled():
+        run_leased_cycle(countries)
+        return
+    with memprofile.phase('sync_eaby_item'), throughput.phase('sync'):
+        sync_eaby_item()
+    with memprofile.phase('sync_items_status'), throughput.phase('status'):
+        sync_items_status(countries=countries)
+    with throughput.phase('badewanne'):
+        badewanne_process_tracking.now(countries=countries)
+
+
+def run_leased_cycle(countries: List[str] = None) -> None:
+    """
+    Run sync, status maintenance and Badewanne only for the catalog
+    partitions this node holds a lease on and which have not been
+    processed in the current cycle yet.
+    :param countries: markets of the status maintenance and Badewanne, all
+    when None
+    :return: None
+    """
+    owner = leases.get_node_name()
+    owned = leases.claim_partitions(owner)
+    partitions = leases.start_cycle(owner, owned, leases.current_cycle())
+    if not partitions:
+        LOGGER.info("Node %s has no partitions left in this cycle", owner)
+        return
+    LOGGER.info("Node %s processes partitions %s", owner, partitions)
+    renewal = leases.LeaseRenewal(owner, owned)
+    # the leases are renewed while the phases process rows and between them
+    with throughput.observed(renewal.renew):
+        with memprofile.phase('sync_eaby_item'), throughput.phase('sync'):
+            sync_eaby_item(partitions)
+        renewal.renew_now()
+        # the partitions filter the queries, their item ids are never loaded
+        with memprofile.phase('sync_items_status'), throughput.phase('status'):
+            sync_items_status(partitions=partitions, countries=countries)
+        renewal.renew_now()
+        with throughput.phase('badewanne'):
+            badewanne_process_tracking.now(countries=countries, partitions=partitions)
 
 
-def sync_eaby_item() -> None:
+def sync_eaby_item(partitions: List[int] = None) -> None:
     """
     Sync ebayitem table to vFactEbayPrices from BIServer.
+    :param partitions: item_no hash partitions to sync, all when None
     :return: None
     """
-    ebay_price_daily = get_data_from_biserver()
-    ebay_price_old = get_all_django_exist_items()
-    update_or_create_ebay_items(ebay_price_daily, ebay_price_old)
+    with memprofile.phase('biserver_frame'):
+        ebay_price_daily = get_data_from_biserver(partitions)
+    sync_biserver_frame(ebay_price_daily, partitions)
 
 
-def get_all_django_exist_items() -> pd.DataFrame:
+def sync_biserver_frame(ebay_price_daily: pd.DataFrame, partitions: List[int] = None,
+                        chunk_size: int = None, workers: int = None) -> None:
     """
-    Get items exist in django web system database
-    :return: item data in pandas dataframe
+    Sync ebayitem table to a frame of BIServer data, against the previous
+    snapshot when snapshots are enabled
+    :param ebay_price_daily: pandas dataframe of vFactEbayPrices
+    :param partitions: item_no hash partitions the frame holds, all when None
+    :param chunk_size: rows written per bulk statement, all at once when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: None
     """
-    sql_query = str(EbayItem.objects.all().values(
-        'id', 'item_no', 'auction_id', 'item_status'
-    ).query)
-    ebay_price_old = pd.read_sql_query(sql_query, connection)
-    return ebay_price_old
+    if partitions is None and snapshots.snapshots_enabled():
+        sync_against_snapshot(ebay_price_daily, chunk_size, workers)
+        return
+    with memprofile.phase('existing_items'):
+        ebay_price_old = get_all_django_exist_items(
+            None if partitions is None else leases.partition_items(partitions)
+        )
+    update_or_create_ebay_items(ebay_price_daily, ebay_price_old, chunk_size, workers)
 
 
-def get_data_from_biserver() -> pd.DataFrame:
+def pipeline_items(partitions: List[int] = None) -> query.QuerySet:
+    """
+    Items the pipeline runs on
+    :param partitions: item_no hash partitions, all items when None
+    :return: queryset of EbayItem
+    """
+    if partitions is None:
+        return EbayItem.objects.all()
+    return leases.partition_items(partitions)
+
+
+def get_all_django_exist_items(items: query.QuerySet = None) -> pd.DataFrame:
+    """
+    Get items exist in django web system database. The rows are streamed from
+    the db cursor into preallocated arrays of fixed dtypes, the columns are
+    named after the db columns on every backend.
+    :param items: queryset to load, all items when None
+    :return: item data in pandas dataframe with the columns id, ItemNo,
+    AuctionID and ItemStatus
+    """
+    if items is None:
+        items = EbayItem.objects.all()
+    items = items.values_list(*EXISTING_ITEM_FIELDS)
+    sql, params = items.query.sql_with_params()
+    capacity = items.count()
+    ids = np.empty(capacity, dtype=np.int64)
+    item_nos = np.empty(capacity, dtype=np.int64)
+    auction_ids = np.empty(capacity, dtype=object)
+    status_codes = np.empty(capacity, dtype=np.int8)
+    status_values = [stage.value for stage in BWStageEnum]
+    status_index = {value: code for code, value in enumerate(status_values)}
+
+    loaded = 0
+    with streaming_cursor(connections[items.db]) as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+            if not rows:
+                break
+            if loaded + len(rows) > capacity:
+                # rows were inserted between count and select
+                capacity = loaded + len(rows)
+                ids, item_nos, auction_ids, status_codes = [
+                    np.resize(array, capacity)
+                    for array in (ids, item_nos, auction_ids, status_codes)
+                ]
+            chunk = slice(loaded, loaded + len(rows))
+            columns = list(zip(*rows))
+            ids[chunk] = columns[0]
+            item_nos[chunk] = columns[1]
+            auction_ids[chunk] = columns[2]
+            status_codes[chunk] = [status_index.get(status, -1) for status in columns[3]]
+            loaded += len(rows)
+
+    return pd.DataFrame({
+        'id': ids[:loaded],
+        EbayItem._meta.get_field('item_no').column: item_nos[:loaded],
+        EbayItem._meta.get_field('auction_id').column: auction_ids[:loaded],
+        EbayItem._meta.get_field('item_status').column: pd.Categorical.from_codes(
+            status_codes[:loaded], categories=status_values
+        ),
+    })
+
+
+def get_data_from_biserver(partitions: List[int] = None) -> pd.DataFrame:
     """
     Get the latest data from vFactEbayPrices in BIServer
+    :param partitions: item_no hash partitions to fetch, all when None
     :return: item data in pandas dataframe
     """
     LOGGER.info("Connecting to BIServer")
@@ -73,205 +259,657 @@ def get_data_from_biserver() -> pd.DataFrame:
         database='CT dwh 04 Analysis'
     )
 
+    sql = "SELECT [id], {} from vFactEbayPrices".format(
+        ', '.join('[{}]'.format(column) for column in BISERVER_SCHEMA)
+    )
+    if partitions is not None:
+        sql += " WHERE ItemNo % {} IN ({})".format(
+            parallel.get_hash_partitions(),
+            ', '.join(str(int(partition)) for partition in partitions)
+        )
     ebay_price_daily = pd.read_sql(
-        sql="SELECT * from vFactEbayPrices;",
+        sql=sql + ";",
         con=conn,
         index_col='id'
     )
-    ebay_price_daily.dropna(inplace=True)
-    LOGGER.info("Num of rows from BIServer: %s", ebay_price_daily.shape)
+    memory_before = frame_memory_usage(ebay_price_daily)
+    ebay_price_daily = coerce_biserver_frame(ebay_price_daily)
+    LOGGER.info("Num of rows from BIServer: %s, frame memory %s bytes (%s bytes before "
+                "type coercion)", ebay_price_daily.shape,
+                frame_memory_usage(ebay_price_daily), memory_before)
     return ebay_price_daily
 
 
-def update_or_create_ebay_items(items_new: pd.DataFrame, items_old: pd.DataFrame) -> None:
+def coerce_biserver_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Project a BIServer frame to the columns in BISERVER_SCHEMA, drop the rows
+    with missing values in those columns and convert every column to its
+    schema type. Integers are downcast to the smallest integer type, floats
+    to float32 only when no value changes by it.
+    :param frame: pandas dataframe of vFactEbayPrices
+    :return: coerced pandas dataframe
+    :raises ValueError: when a schema column is missing or a numeric column
+    holds non numeric values
+    """
+    missing = [column for column in BISERVER_SCHEMA if column not in frame.columns]
+    if missing:
+        raise ValueError('BIServer data misses the columns: {}'.format(', '.join(missing)))
+    frame = frame[list(BISERVER_SCHEMA)].dropna()
+    coerced = {}
+    for column, kind in BISERVER_SCHEMA.items():
+        values = frame[column]
+        if kind == 'integer':
+            coerced[column] = pd.to_numeric(values, downcast='integer')
+        elif kind == 'float':
+            values = pd.to_numeric(values).astype(np.float64)
+            downcast = values.astype(np.float32)
+            coerced[column] = downcast if np.array_equal(
+                downcast.values.astype(np.float64), values.values
+            ) else values
+        elif kind == 'category':
+            coerced[column] = values.astype(str).astype('category')
+        else:
+            coerced[column] = values.astype(str)
+    return pd.DataFrame(coerced, index=frame.index, columns=list(BISERVER_SCHEMA))
+
+
+def frame_memory_usage(frame: pd.DataFrame) -> int:
+    """
+    Memory footprint of a frame including the python objects it holds
+    :param frame: pandas dataframe
+    :return: bytes
+    """
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def update_or_create_ebay_items(items_new: pd.DataFrame, items_old: pd.DataFrame,
+                                chunk_size: int = None, workers: int = None) -> None:
     """
     Insert the new ebay item info into db, update ebay
     item info if already exist in db
     :param items_new: pandas dataframe of ebay item info from BIServer
     :param items_old: pandas dataframe of ebay item existed in django model table
+    :param chunk_size: rows written per bulk statement, all at once when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: None
+    """
+    LOGGER.info("Checking rows to be inserted or updated")
+    with memprofile.phase('diff'):
+        insert_positions, update_positions, update_ids = diff_ebay_items(items_new, items_old,
+                                                                         workers)
+    write_ebay_items(items_new, insert_positions, update_positions, update_ids, chunk_size)
+    with memprofile.phase('archive'):
+        archive.archive_missing_items(items_old['id'].values, update_ids)
+
+
+def write_ebay_items(items_new: pd.DataFrame, insert_positions: np.ndarray,
+                     update_positions: np.ndarray, update_ids: np.ndarray,
+                     chunk_size: int = None) -> None:
+    """
+    Bulk insert and update the diffed BIServer rows. Rows to insert which are
+    archived are restored and updated instead.
+    :param items_new: pandas dataframe of ebay item info from BIServer
+    :param insert_positions: row positions to insert
+    :param update_positions: row positions to update
+    :param update_ids: db ids of the rows to update
+    :param chunk_size: rows built and written per bulk statement, all at once
+    when None
     :return: None
     """
-    batch_insert = []
-    batch_update = []
+    with memprofile.phase('restore'):
+        restored, restored_ids = archive.restore_items(item_keys(items_new.iloc[insert_positions]))
+    if len(restored):
+        update_positions = np.concatenate([update_positions, insert_positions[restored]])
+        update_ids = np.concatenate([update_ids, restored_ids])
+        insert_positions = np.delete(insert_positions, restored)
     is_baygraph_rank_down = np.array_equal(
         items_new['PositionCurrentDay'].unique(),
         np.array([501])
     )
-    LOGGER.info("Checking rows to be inserted or updated")
-    for _, row in items_new.iterrows():
-        item = EbayItem(
-            item_no=row['ItemNo'],
-            item_id=row['eBayItemID'],
-            item_description=row['ItemDescription'],
-            sales_goal_reached_in_last14days=row['SalesGoalReachedInLast14Days'],
-            sales_goal_reached_in_last7days=row['SalesGoalReachedInLast7Days'],
-            sales_goal_reached_mtd=row['FC_Erf_MTD'],
-            cogs_24h_vs_7d=row['COGS24HVS7D'],
-            channel=row['Channel'],
-            country=row['Country'],
-            our_purchase_price=row['OurPurchasePrice'],
-            current_sale_price=row['CurrentSalePrice'],
-            suggested_sale_price=row['SuggestedSalePrice'],
-            last_humansetprice_before_badewanne=row['CurrentSalePrice'],
-            new_price=row['CurrentSalePrice'],
-            auction_id=row['AuctionID'],
-            sku=row['SKU'],
-            dio1=row['DIO1'],
-            dio2=row['DIO2'],
-            stock=row['Bestand_Gesamt'],
-            lrw=row['LRW'],
-            fc=row['FC'],
-            item_ranking_today=row['PositionCurrentDay']
-        )
-        # Check if the row from BIServer already exists in ebayitem table
-        search_item = items_old.loc[(items_old.ItemNo == item.item_no) &
-                                    (items_old.AuctionID == item.auction_id)]
-        if search_item.empty:
-            item.last_humansetprice_before_badewanne = row['CurrentSalePrice']
-            item.new_price = row['CurrentSalePrice']
-            batch_insert.append(item)
-        else:
-            item.id = search_item.iloc[0].id
-            batch_update.append(item)
-    LOGGER.info('Insert %s new rows to db and update %s rows', len(batch_insert), len(batch_update))
-    EbayItem.objects.bulk_create(batch_insert)
-    update_cols = [
-        'item_description', 'sales_goal_reached_in_last14days',
-        'sales_goal_reached_in_last7days', 'sales_goal_reached_mtd', 'channel',
-        'country', 'our_purchase_price', 'current_sale_price',
-        'suggested_sale_price', 'dio1', 'dio2',
-        'lrw', 'fc', 'stock', 'item_id', 'cogs_24h_vs_7d'
-    ]
+    LOGGER.info('Insert %s new rows to db and update %s rows',
+                len(insert_positions), len(update_positions))
+    throughput.expect(len(insert_positions) + len(update_positions))
+    update_cols = [field for field in SYNC_UPDATE_FIELDS if field != 'item_ranking_today']
     if not is_baygraph_rank_down:
         update_cols.append('item_ranking_today')
-    EbayItem.objects.bulk_update(batch_update, update_cols)
+    size = chunk_size or max(len(insert_positions), len(update_positions), 1)
+    for start in range(0, len(insert_positions), size):
+        positions = insert_positions[start:start + size]
+        with memprofile.phase('batch_instances'):
+            batch_insert = [
+                ebay_item_from_row(row)
+                for row in items_new.iloc[positions].to_dict('records')
+            ]
+        with memprofile.phase('bulk_create'):
+            EbayItem.objects.bulk_create(batch_insert)
+        throughput.advance(len(positions))
+    for start in range(0, len(update_positions), size):
+        positions = update_positions[start:start + size]
+        with memprofile.phase('batch_instances'):
+            batch_update = []
+            for item_id, row in zip(update_ids[start:start + size].tolist(),
+                                    items_new.iloc[positions].to_dict('records')):
+                item = ebay_item_from_row(row)
+                item.id = item_id
+                batch_update.append(item)
+        with memprofile.phase('bulk_update'):
+            EbayItem.objects.bulk_update(batch_update, update_cols)
+        throughput.advance(len(positions))
     LOGGER.info("Finish ebayitem db update")
 
 
-def sync_items_status() -> None:
+def sync_against_snapshot(items_new: pd.DataFrame, chunk_size: int = None,
+                          workers: int = None) -> None:
     """
-    Maintain the items status based on their performance
+    Sync ebayitem table by diffing the BIServer data against the previous
+    local snapshot. Only new and changed rows are written. Without a usable
+    previous snapshot, and when a full diff is due because local edits are
+    invisible to the snapshot diff, the diff runs against the ebayitem table.
+    The data is then stored as the next snapshot.
+    :param items_new: pandas dataframe of ebay item info from BIServer
+    :param chunk_size: rows written per bulk statement, all at once when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
     :return: None
     """
-    maintain_lrw_list()
-    maintain_blocked_list()
-    maintain_normal_list()
-    maintain_bwready_list()
+    with memprofile.phase('snapshot_diff'):
+        previous = None if snapshots.full_diff_due() else snapshots.read_latest_snapshot()
+        if previous is None:
+            LOGGER.info("Diffing against the ebayitem table")
+            insert_positions, update_positions, update_ids = diff_ebay_items(
+                items_new, get_all_django_exist_items(), workers
+            )
+            unchanged_positions = unchanged_ids = np.array([], dtype=np.int64)
+        else:
+            (insert_positions, update_positions, update_ids,
+             unchanged_positions, unchanged_ids) = snapshots.diff_snapshots(
+                 previous, items_new, KEY_COLUMNS, list(SYNC_UPDATE_FIELDS.values())
+             )
+            LOGGER.info("%s rows unchanged since the last snapshot", len(unchanged_positions))
+    write_ebay_items(items_new, insert_positions, update_positions, update_ids, chunk_size)
+    ids = np.zeros(len(items_new), dtype=np.int64)
+    ids[update_positions] = update_ids
+    ids[unchanged_positions] = unchanged_ids
+    ids[insert_positions] = get_inserted_ids(items_new.iloc[insert_positions])
+    snapshots.write_snapshot(items_new.assign(id=ids))
+    if previous is None:
+        snapshots.mark_full_diff()
+    with memprofile.phase('archive'):
+        archive.archive_missing_items(
+            np.fromiter(EbayItem.objects.values_list('id', flat=True).iterator(), dtype=np.int64),
+            ids
+        )
+
+
+def get_inserted_ids(items: pd.DataFrame) -> np.ndarray:
+    """
+    Look up the ids of just inserted BIServer rows, the newest row wins when
+    a key exists more than once
+    :param items: pandas dataframe of inserted ebay item info
+    :return: db id per row
+    """
+    if items.empty:
+        return np.array([], dtype=np.int64)
+    keys = item_keys(items)
+    item_nos = sorted(set(keys['ItemNo'].tolist()))
+    found = []
+    for start in range(0, len(item_nos), QUERY_BATCH_SIZE):
+        found.extend(EbayItem.objects.filter(
+            item_no__in=item_nos[start:start + QUERY_BATCH_SIZE]
+        ).values_list('id', 'item_no', 'auction_id'))
+    existing = pd.DataFrame(found, columns=['id', 'ItemNo', 'AuctionID']).sort_values('id')
+    existing = item_keys(existing).assign(id=existing['id'].values)
+    existing = existing.drop_duplicates(subset=KEY_COLUMNS, keep='last')
+    return keys.merge(existing, how='left', on=KEY_COLUMNS)['id'].values.astype(np.int64)
+
+
+def ebay_item_from_row(row: dict) -> EbayItem:
+    """
+    Build an (unsaved) EbayItem from a row of BIServer data
+    :param row: dict of one row of vFactEbayPrices
+    :return: EbayItem object
+    """
+    return EbayItem(
+        item_no=row['ItemNo'],
+        item_id=row['eBayItemID'],
+        item_description=row['ItemDescription'],
+        sales_goal_reached_in_last14days=row['SalesGoalReachedInLast14Days'],
+        sales_goal_reached_in_last7days=row['SalesGoalReachedInLast7Days'],
+        sales_goal_reached_mtd=row['FC_Erf_MTD'],
+        cogs_24h_vs_7d=row['COGS24HVS7D'],
+        channel=row['Channel'],
+        country=row['Country'],
+        our_purchase_price=row['OurPurchasePrice'],
+        current_sale_price=row['CurrentSalePrice'],
+        suggested_sale_price=row['SuggestedSalePrice'],
+        last_humansetprice_before_badewanne=row['CurrentSalePrice'],
+        new_price=row['CurrentSalePrice'],
+        auction_id=row['AuctionID'],
+        sku=row['SKU'],
+        dio1=row['DIO1'],
+        dio2=row['DIO2'],
+        stock=row['Bestand_Gesamt'],
+        lrw=row['LRW'],
+        fc=row['FC'],
+        item_ranking_today=row['PositionCurrentDay']
+    )
+
+
+def item_keys(items: pd.DataFrame) -> pd.DataFrame:
+    """
+    Key columns of a BIServer or django item frame with normalized dtypes,
+    so that both sides of the diff compare equal.
+    :param items: pandas dataframe with ItemNo and AuctionID columns
+    :return: pandas dataframe of ItemNo and AuctionID
+    """
+    return pd.DataFrame({
+        'ItemNo': items['ItemNo'].values.astype(np.int64),
+        'AuctionID': items['AuctionID'].astype(str).values
+    })
+
+
+def diff_ebay_items(items_new: pd.DataFrame, items_old: pd.DataFrame,
+                    workers: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find which BIServer rows are new and which already exist in db. With more
+    than one pipeline worker the keys are hash partitioned by item_no and the
+    partitions are diffed in a process pool.
+    :param items_new: pandas dataframe of ebay item info from BIServer
+    :param items_old: pandas dataframe of ebay item existed in django model table
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: row positions to insert, row positions to update and the db ids
+    of the rows to update
+    """
+    new_keys = item_keys(items_new)
+    new_keys['position'] = np.arange(len(new_keys))
+    old_keys = item_keys(items_old)
+    old_keys['id'] = items_old['id'].values.astype(np.int64)
+
+    workers = workers or parallel.get_pipeline_workers()
+    if workers <= 1 or len(new_keys) < parallel.get_parallel_min_items():
+        return diff_partition(new_keys, old_keys)
+
+    num_partitions = parallel.get_hash_partitions()
+    new_labels = parallel.hash_partition_labels(new_keys['ItemNo'].values, num_partitions)
+    old_labels = parallel.hash_partition_labels(old_keys['ItemNo'].values, num_partitions)
+    old_partitions = {
+        old_labels[positions[0]]: positions
+        for positions in parallel.split_positions(old_labels)
+    }
+    partitions = [
+        (new_keys.iloc[positions],
+         old_keys.iloc[old_partitions.get(new_labels[positions[0]], [])])
+        for positions in parallel.split_positions(new_labels)
+    ]
+    results = parallel.run_partitioned(diff_partition, partitions, workers)
+    insert_positions = np.concatenate([result[0] for result in results])
+    update_positions = np.concatenate([result[1] for result in results])
+    update_ids = np.concatenate([result[2] for result in results])
+    update_order = np.argsort(update_positions, kind='stable')
+    return (np.sort(insert_positions), update_positions[update_order],
+            update_ids[update_order])
+
+
+def diff_partition(new_keys: pd.DataFrame,
+                   old_keys: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Diff one partition of BIServer keys against the db keys. When a key
+    exists more than once in db the first row wins.
+    :param new_keys: ItemNo, AuctionID and row position of BIServer rows
+    :param old_keys: ItemNo, AuctionID and id of db rows
+    :return: row positions to insert, row positions to update and the db ids
+    of the rows to update
+    """
+    old_keys = old_keys.drop_duplicates(subset=KEY_COLUMNS, keep='first')
+    merged = new_keys.merge(old_keys, how='left', on=KEY_COLUMNS, sort=False)
+    found = merged['id'].notna().values
+    positions = merged['position'].values.astype(np.int64)
+    return (positions[~found], positions[found],
+            merged['id'].values[found].astype(np.int64))
+
+
+def sync_items_status(ids: List = None, partitions: List[int] = None,
+                      workers: int = None, countries: List[str] = None) -> None:
+    """
+    Maintain the items status based on their performance. The items are
+    loaded once, the STATUS_RULES are evaluated in one pass in memory and the
+    resulting status changes are written back with one update per target
+    status. The update only moves items still in their old status, an item a
+    user or the tracking moved since it was loaded keeps its status.
+    :param ids: list of item id, all items when None
+    :param partitions: item_no hash partitions, all items when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :param countries: markets to maintain, all when None, the query reads only
+    their partitions of a partitioned item table
+    :return: None
+    """
+    changes = items_status_changes(ids, partitions, workers, countries)
+    for item_status, group in changes.groupby('item_status'):
+        LOGGER.info("%s items to be forwarded %s.", len(group), item_status)
+        moved = 0
+        for start in range(0, len(group), QUERY_BATCH_SIZE):
+            chunk = group.iloc[start:start + QUERY_BATCH_SIZE]
+            # compare and set like claim_items, every item by its old status
+            moved += EbayItem.objects.filter(functools.reduce(operator.or_, [
+                Q(id__in=old['id'].tolist(), item_status=old_status)
+                for old_status, old in chunk.groupby('old_status')
+            ])).update(item_status=item_status)
+            throughput.advance(len(chunk))
+        if moved < len(group):
+            LOGGER.info("%s items were moved meanwhile and keep their status",
+                        len(group) - moved)
+
+
+def items_status_changes(ids: List = None, partitions: List[int] = None,
+                         workers: int = None, countries: List[str] = None) -> pd.DataFrame:
+    """
+    Load the items and evaluate their status transitions without writing
+    them, the unchanged items count as processed
+    :param ids: list of item id, all items when None
+    :param partitions: item_no hash partitions, all items when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :param countries: markets to maintain, all when None
+    :return: pandas dataframe of id, old_status and new item_status of changed
+    items
+    """
+    items = pipeline_items(partitions)
+    if ids:
+        items = items.filter(id__in=ids)
+    if countries:
+        items = items.filter(country__in=countries)
+    items = pd.DataFrame.from_records(
+        list(items.values_list(*STATUS_COLUMNS)),
+        columns=STATUS_COLUMNS
+    )
+    if items.empty:
+        return pd.DataFrame({'id': [], 'old_status': [], 'item_status': []})
+    throughput.expect(len(items))
+    changes = status_transitions(items, datetime.datetime.now(tz=get_current_timezone()),
+                                 workers)
+    throughput.advance(len(items) - len(changes))
+    return changes
+
+
+def status_transitions(items: pd.DataFrame, now: datetime.datetime,
+                       workers: int = None) -> pd.DataFrame:
+    """
+    Evaluate the status transitions of the items. With more than one pipeline
+    worker the items are partitioned and evaluated in the worker pool.
+    :param items: pandas dataframe with the STATUS_COLUMNS of the items
+    :param now: point of time the transitions are evaluated at
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: pandas dataframe of id, old_status and new item_status of changed
+    items
+    """
+    workers = workers or parallel.get_pipeline_workers()
+    if workers <= 1:
+        return status_partition(items, now)
+    labels = parallel.partition_labels(items, parallel.get_partition_by(),
+                                       'item_no', 'country', 'channel')
+    partitions = [(items.iloc[positions], now)
+                  for positions in parallel.split_positions(labels)]
+    return pd.concat(parallel.run_partitioned(status_partition, partitions, workers))
+
+
+def status_partition(items: pd.DataFrame, now: datetime.datetime) -> pd.DataFrame:
+    """
+    Apply the STATUS_RULES, in order, to one partition of items in memory.
+    :param items: pandas dataframe with the STATUS_COLUMNS of the items
+    :param now: point of time the transitions are evaluated at
+    :return: pandas dataframe of id, old_status and new item_status of changed
+    items
+    """
+    status, _ = rules.evaluate(rules.STATUS_RULES, items, now=now)
+    changed = status != items['item_status'].values
+    return pd.DataFrame({'id': items['id'].values[changed],
+                         'old_status': items['item_status'].values[changed],
+                         'item_status': status[changed]})
 
 
 @background()
-def badewanne_process_tracking(ids: List = None) -> None:
+@slowsql.recorded('ebayItems.tasks.badewanne_process_tracking')
+@progress.published('badewanne_process_tracking', 'badewanne')
+@memprofile.profiled('badewanne_process_tracking')
+def badewanne_process_tracking(ids: List = None, countries: List[str] = None,
+                               partitions: List[int] = None, workers: int = None) -> None:
     """
-    Update item status and change price according to rules
+    Update item status and change price according to rules. The candidates
+    of all BADEWANNE_RULES are loaded with one query and the stages are
+    applied in order. Items whose price change fails keep their status and
+    can still be forwarded by a later stage whose rule they fulfill.
     :param ids: List of item id, which are going to be
     forwarded various stage
+    :param countries: markets to run, all when None, the query reads only
+    their partitions of a partitioned item table
+    :param partitions: item_no hash partitions, all items when None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
     :return: None
     """
     LOGGER.info("Start badewanne process tracking.")
 
     # Threshold definition
-    first_threshold = 90.0
-    second_threshold = 100.0
-    last_threshold = 90.0
+    thresholds = rules.DEFAULT_THRESHOLDS
+    now = datetime.datetime.now(tz=get_current_timezone())
+    # the rules below pick the released items up again and price them
+    release_stale_claims(now)
 
-    # Put manually selected items to blocked list
-    items = items_to_blocked(ids)
-    if items:
-        LOGGER.info("%s BW_TOBLOCK items to be forwarded BW_BLOCKED.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_BLOCKED, 0.0)
-
-    # increase 10 percent price for items with too great performance
-    items = items_price_increase_10percent(ids)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 6, "
-                    "increase price 10%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE6_10I, -0.1)
-
-    # increase 5 percent price for items with too good performance
-    items = items_price_increase_5percent(ids)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 5, "
-                    "increase price 5%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE5_5I, -0.05)
-
-    # decrease 0 percent price for items with stage4 performance
-    items = items_price_decrease_0percent(last_threshold, ids)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 4, "
-                    "decrease price 0%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE4_0D, 0.0)
+    candidates = functools.reduce(operator.or_, [
+        rules.compile_q(rule, thresholds, now) for rule in rules.BADEWANNE_RULES
+    ])
+    if ids:
+        candidates &= Q(id__in=ids)
+    if countries:
+        candidates &= Q(country__in=countries)
+    with memprofile.phase('candidates'):
+        candidates = list(pipeline_items(partitions).filter(candidates).order_by('id'))
+    if not candidates:
+        return
+    throughput.expect(len(candidates))
+    with memprofile.phase('rules'):
+        frame = pd.DataFrame({
+            field: [getattr(item, field) for item in candidates]
+            for field in rules.rule_fields(rules.BADEWANNE_RULES)
+        })
+        status = frame['item_status'].values.astype(object)
+        masks = [rules.compile_mask(rule, status, frame, thresholds, now)
+                 for rule in rules.BADEWANNE_RULES]
 
-    # decrease 10 percent price for items with stage3 performance
-    items = items_price_decrease_10percent(second_threshold, ids)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 3, "
-                    "decrease price 10%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE3_10D, 0.1)
+    # items not forwarded yet, an item whose price change fails keeps its
+    # status and falls through to the later stages like a re-queried one
+    pending = np.ones(len(candidates), dtype=bool)
+    for rule, mask in zip(rules.BADEWANNE_RULES, masks):
+        positions = np.flatnonzero(mask & pending)
+        if not len(positions):
+            continue
+        items = [candidates[position] for position in positions]
+        LOGGER.info("%s items to be forwarded %s, change price %s%% wrt LastHumanSetPrice.",
+                    [item.id for item in items], rule.target.value,
+                    round(-rule.discount * 100))
+        with memprofile.phase(rule.target.value):
+            forwarded = set(forward_badewanne_stage(items, rule.target, rule.discount, workers))
+        pending[positions] = [item.id not in forwarded for item in items]
+        throughput.advance(len(forwarded))
+        reload_failed_items(candidates, positions[pending[positions]], pending)
+    throughput.advance(int(np.count_nonzero(pending)))
 
-    # decrease 20 percent price for items with stage2 performance
-    items = items_price_decrease_20percent(first_threshold, ids)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 2, "
-                    "decrease price 20%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE2_20D, 0.2)
 
-    # decrease 30 percent price for items with stage1 performance
-    items = EbayItem.objects.filter(item_status=BWStageEnum.BW_STAGE0.value)
-    if items:
-        LOGGER.info("%s items to be forwarded stage 1, "
-                    "decrease price 30%% wrt LastHumanSetPrice.",
-                    items.values_list('id', flat=True))
-        forward_badewanne_stage(list(items), BWStageEnum.BW_STAGE1_30D, 0.3)
+def reload_failed_items(candidates: List[EbayItem], positions: np.ndarray,
+                        pending: np.ndarray) -> None:
+    """
+    Reload the candidates whose price change failed, the failed attempt
+    changed their prices in memory. A candidate another run moved or deleted
+    meanwhile is not pending anymore.
+    :param candidates: list of EbayItem, replaced in place
+    :param positions: positions of the failed candidates
+    :param pending: pending flag per candidate, updated in place
+    :return: None
+    """
+    if not len(positions):
+        return
+    fresh = EbayItem.objects.in_bulk([candidates[position].id for position in positions])
+    for position in positions.tolist():
+        item = fresh.get(candidates[position].id)
+        if item is None or item.item_status != candidates[position].item_status:
+            pending[position] = False
+        else:
+            candidates[position] = item
 
 
 def forward_badewanne_stage(items: List[EbayItem], target_stage: BWStageEnum,
-                            discount: float) -> None:
+                            discount: float, workers: int = None) -> List[int]:
     """
     Forward the badewanne stage for items, change price wrt discount
-    of the last human set price for those items.
+    of the last human set price for those items. Only the items claimed by
+    claim_items are priced, so that a concurrent tracking run never prices an
+    item twice. Items whose price change fails return to their status.
     :param items: Queryset of items which to be forwarded into target_stage
     :param target_stage: stage which the items should be forwarded
-    :return: None
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: ids of the forwarded items
     """
-    # get batch price data and updated item list for ebay batch pricing api
-    batch_price_data, updated_items = prepare_pricing_api_data(
-        items, discount,
-        'EBay_Badewanne_Auto_Start_{}'.format(target_stage.value)
-    )
-    # get response of ebay pricing api call
-    response = execute_ebay_batch_pricing_api(batch_price_data)
-    # get items whose price changed successfully
-    success_items = get_price_changing_success_items(response, updated_items)
-    # update success items' item status
-    success_items.update(item_status=target_stage.value)
+    items = claim_items(items, target_stage)
+    if not items:
+        return []
+    old_prices = {item.id: item.current_sale_price for item in items}
+    reason = 'EBay_Badewanne_Auto_Start_{}'.format(target_stage.value)
+    try:
+        # get batch price data and updated item list for ebay batch pricing api
+        batch_price_data, updated_items = prepare_pricing_api_data(items, discount, reason,
+                                                                   workers)
+        # get response of ebay pricing api call
+        response = execute_ebay_batch_pricing_api(batch_price_data)
+        throughput.api_call()
+        # get items whose price changed successfully
+        success_list = price_changing_success_list(response, updated_items)
+    except Exception:
+        release_items(items, target_stage)
+        raise
+    success_ids = {item.id for item in success_list}
+    release_items([item for item in items if item.id not in success_ids], target_stage)
+    success_items = save_price_changing_success_items(success_list)
+    drop_claims(sorted(success_ids))
+    history.record_price_changes(success_list, old_prices, target_stage, reason)
     if target_stage == BWStageEnum.BW_BLOCKED:
         success_items.update(last_bw_end_date=datetime.datetime.now(tz=get_current_timezone()))
+    return sorted(success_ids)
+
 
+def claim_items(items: List[EbayItem], target_stage: BWStageEnum) -> List[EbayItem]:
+    """
+    Move the items which still have the status they were selected with into
+    target_stage. An item a concurrent run moved meanwhile is not claimed.
+    The rows of every update are stamped with their own catalog version,
+    which tells the claimed ones apart. Every claimed item gets an ItemClaim
+    until it is priced or released, see release_stale_claims.
+    :param items: list of EbayItem with the status they were selected with
+    :param target_stage: stage the items are forwarded to
+    :return: the claimed items
+    """
+    claimed = set()
+    now = datetime.datetime.now(tz=get_current_timezone())
+    with transaction.atomic():
+        for status in sorted({item.item_status for item in items}):
+            ids = [item.id for item in items if item.item_status == status]
+            for start in range(0, len(ids), QUERY_BATCH_SIZE):
+                version = catalog.next_version()
+                if EbayItem.objects.filter(
+                        id__in=ids[start:start + QUERY_BATCH_SIZE], item_status=status
+                ).update(item_status=target_stage.value, catalog_version=version):
+                    chunk = list(EbayItem.objects.filter(catalog_version=version)
+                                 .values_list('id', flat=True))
+                    ItemClaim.objects.bulk_create([
+                        ItemClaim(item_id=item_id, item_status=status,
+                                  catalog_version=version, claimed_at=now)
+                        for item_id in chunk
+                    ])
+                    claimed.update(chunk)
+    if len(claimed) < len(items):
+        LOGGER.info("%s items were moved by a concurrent run and are skipped",
+                    len(items) - len(claimed))
+    return [item for item in items if item.id in claimed]
 
-def prepare_pricing_api_data(items: List[EbayItem], discount: float,
-                             price_change_reason: str) -> Tuple[List[dict], List[EbayItem]]:
+
+def release_items(items: List[EbayItem], target_stage: BWStageEnum) -> None:
+    """
+    Return claimed items which were not priced to the status they were
+    selected with
+    :param items: list of EbayItem with the status they were selected with
+    :param target_stage: stage the items were claimed for
+    :return: None
+    """
+    for status in sorted({item.item_status for item in items}):
+        ids = [item.id for item in items if item.item_status == status]
+        for start in range(0, len(ids), QUERY_BATCH_SIZE):
+            EbayItem.objects.filter(
+                id__in=ids[start:start + QUERY_BATCH_SIZE], item_status=target_stage.value
+            ).update(item_status=status)
+    drop_claims([item.id for item in items])
+
+
+def drop_claims(ids: List[int]) -> None:
+    """
+    Remove the claims of priced or released items
+    :param ids: item ids
+    :return: None
+    """
+    for start in range(0, len(ids), QUERY_BATCH_SIZE):
+        ItemClaim.objects.filter(item_id__in=ids[start:start + QUERY_BATCH_SIZE]).delete()
+
+
+def get_claim_timeout() -> datetime.timedelta:
+    """
+    Age after which a claim belongs to a run that died before pricing
+    :return: claim timeout
+    """
+    return datetime.timedelta(seconds=getattr(settings, 'BADEWANNE_CLAIM_SECONDS', 3600))
+
+
+def release_stale_claims(now: datetime.datetime) -> int:
+    """
+    Return the items of claims older than the claim timeout to the status
+    they were claimed from. The run which claimed them was killed between the
+    claim and the price change. An item written since its claim still has a
+    newer catalog version and keeps its status.
+    :param now: point of time of the tracking run
+    :return: number of released items
+    """
+    stale = list(ItemClaim.objects.filter(claimed_at__lt=now - get_claim_timeout())
+                 .values_list('id', 'item_id', 'item_status', 'catalog_version'))
+    if not stale:
+        return 0
+    claims = collections.defaultdict(list)
+    for _, item_id, status, version in stale:
+        claims[(status, version)].append(item_id)
+    released = 0
+    for (status, version), ids in sorted(claims.items()):
+        for start in range(0, len(ids), QUERY_BATCH_SIZE):
+            released += EbayItem.objects.filter(
+                id__in=ids[start:start + QUERY_BATCH_SIZE], catalog_version=version
+            ).update(item_status=status)
+    claim_ids = [claim[0] for claim in stale]
+    for start in range(0, len(claim_ids), QUERY_BATCH_SIZE):
+        ItemClaim.objects.filter(id__in=claim_ids[start:start + QUERY_BATCH_SIZE]).delete()
+    LOGGER.warning("Released %s of %s items claimed by a tracking run which did not price them",
+                   released, len(stale))
+    return released
+
+
+def prepare_pricing_api_data(items: List[EbayItem], discount: float, price_change_reason: str,
+                             workers: int = None) -> Tuple[List[dict], List[EbayItem]]:
     """
     Prepare the post data for ebay batch item pricing api
     :param items: list of EbayItem object
     :param discount: discount rate
     :param price_change_reason: reason for price changing
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
     :return: batch price data for pricing api
     """
     batch_price_data = []
     for item in items:
         if BWStageEnum(item.item_status) is BWStageEnum.BW_STAGE0:
             item.last_humansetprice_before_badewanne = item.current_sale_price
-        item.new_price = get_smart_price_number(
-            item.last_humansetprice_before_badewanne,
-            item.our_purchase_price,
-            discount
-        )
+    new_prices = get_smart_prices(items, discount, workers)
+    for item, new_price in zip(items, new_prices):
+        item.new_price = new_price
         item.current_sale_price = item.new_price
         batch_price_data.append({
             "Price": item.new_price,
@@ -282,6 +920,61 @@ def prepare_pricing_api_data(items: List[EbayItem], discount: float,
     return batch_price_data, items
 
 
+def get_smart_prices(items: List[EbayItem], discount: float,
+                     workers: int = None) -> List[float]:
+    """
+    Smart price of every item wrt discount of its last human set price. With
+    more than one pipeline worker the items are partitioned and priced in the
+    worker pool.
+    :param items: list of EbayItem object
+    :param discount: discount rate
+    :param workers: pipeline worker processes, PIPELINE_WORKERS when None
+    :return: new prices in the order of items
+    """
+    base_prices = [item.last_humansetprice_before_badewanne for item in items]
+    purchase_prices = [item.our_purchase_price for item in items]
+    workers = workers or parallel.get_pipeline_workers()
+    if workers <= 1 or len(items) < parallel.get_parallel_min_items():
+        return price_partition(base_prices, purchase_prices, discount)
+
+    labels = parallel.partition_labels(
+        pd.DataFrame({
+            'item_no': [item.item_no for item in items],
+            'country': [item.country for item in items],
+            'channel': [item.channel for item in items],
+        }),
+        parallel.get_partition_by(), 'item_no', 'country', 'channel'
+    )
+    partition_positions = parallel.split_positions(labels)
+    partitions = [
+        ([base_prices[i] for i in positions],
+         [purchase_prices[i] for i in positions],
+         discount)
+        for positions in partition_positions
+    ]
+    new_prices = [None] * len(items)
+    for positions, prices in zip(partition_positions,
+                                 parallel.run_partitioned(price_partition, partitions, workers)):
+        for position, price in zip(positions, prices):
+            new_prices[position] = price
+    return new_prices
+
+
+def price_partition(base_prices: List[float], purchase_prices: List[float],
+                    discount: float) -> List[float]:
+    """
+    Smart prices of one partition of items
+    :param base_prices: base prices for badewanne process
+    :param purchase_prices: prices we pay for manufacture
+    :param discount: discount value
+    :return: smart prices
+    """
+    return [
+        get_smart_price_number(base_price, purchase_price, discount)
+        for base_price, purchase_price in zip(base_prices, purchase_prices)
+    ]
+
+
 def get_smart_price_number(base_price: float, purchase_price: float,
                            discount: float) -> float:
     """
@@ -337,6 +1030,17 @@ def get_price_changing_success_items(response: requests.Response,
     :param items: list of EbayItem items in the api call
     :return: return the queryset of the successful items
     """
+    return save_price_changing_success_items(price_changing_success_list(response, items))
+
+
+def price_changing_success_list(response: requests.Response,
+                                items: List[EbayItem]) -> List[EbayItem]:
+    """
+    get the items whose prices has been changed successfully
+    :param response: api response
+    :param items: list of EbayItem items in the api call
+    :return: list of the successful items
+    """
     success_items = []
     failed_items = []
     if response.json()['HasErrors']:
@@ -355,6 +1059,15 @@ def get_price_changing_success_items(response: requests.Response,
 
     LOGGER.info("[%s/%s] items' prices have been changed successfully!",
                 len(success_items), len(items))
+    return success_items
+
+
+def save_price_changing_success_items(success_items: List[EbayItem]) -> query.QuerySet:
+    """
+    Save the prices of the successful items
+    :param success_items: list of the successful items
+    :return: return the queryset of the successful items
+    """
     EbayItem.objects.bulk_update(success_items, [
         'last_humansetprice_before_badewanne',
         'new_price'
@@ -362,6 +1075,26 @@ def get_price_changing_success_items(response: requests.Response,
     return EbayItem.objects.filter(id__in=[item.id for item in success_items])
 
 
+def rule_items(rule: rules.Rule,
+               thresholds: rules.BadewanneThresholds = rules.DEFAULT_THRESHOLDS,
+               ids: List = None, countries: List[str] = None) -> query.QuerySet:
+    """
+    Get the items a rule moves. When ids is None search all objects
+    available; otherwise, search items in id list.
+    :param rule: rule of rules module
+    :param thresholds: BadewanneThresholds
+    :param ids: list of item id
+    :param countries: markets to search, all when None
+    :return: items ordered by id
+    """
+    condition = rules.compile_q(rule, thresholds)
+    if ids:
+        condition &= Q(id__in=ids)
+    if countries:
+        condition &= Q(country__in=countries)
+    return EbayItem.objects.filter(condition).order_by('id')
+
+
 def items_to_blocked(ids: List = None) -> query.QuerySet:
     """
     Get items to be blocked. When ids is None search all objects available;
@@ -369,13 +1102,7 @@ def items_to_blocked(ids: List = None) -> query.QuerySet:
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status=BWStageEnum.BW_TOBLOCK.value)
-    if ids:
-        rules &= Q(id__in=ids)
-
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.BLOCK_RULE, ids=ids)
 
 
 def items_price_increase_10percent(ids: List = None):
@@ -386,15 +1113,7 @@ def items_price_increase_10percent(ids: List = None):
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status__startswith="BW_STAGE") & \
-            (~Q(item_status=BWStageEnum.BW_STAGE6_10I.value)) & \
-            Q(sales_goal_reached_in_last7days__gt=120)
-    if ids:
-        rules &= Q(id__in=ids)
-
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.INCREASE_10PERCENT_RULE, ids=ids)
 
 
 def items_price_increase_5percent(ids: List = None):
@@ -405,16 +1124,7 @@ def items_price_increase_5percent(ids: List = None):
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status__startswith="BW_STAGE") & \
-            (~Q(item_status__in=[BWStageEnum.BW_STAGE6_10I.value,
-                                 BWStageEnum.BW_STAGE5_5I.value])) & \
-            Q(sales_goal_reached_in_last7days__gt=110)
-    if ids:
-        rules &= Q(id__in=ids)
-
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.INCREASE_5PERCENT_RULE, ids=ids)
 
 
 def items_price_decrease_0percent(last_threshold: float, ids: List = None):
@@ -426,22 +1136,8 @@ def items_price_decrease_0percent(last_threshold: float, ids: List = None):
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status__in=[
-        BWStageEnum.BW_STAGE3_10D.value,
-        BWStageEnum.BW_STAGE2_20D.value,
-        BWStageEnum.BW_STAGE1_30D.value,
-        BWStageEnum.BW_STAGE0.value
-    ]) & (
-        Q(item_ranking_today__lt=10) |
-        Q(sales_goal_reached_in_last14days__gt=last_threshold) |
-        Q(cogs_24h_vs_7d__gt=50.0)
-    )
-    if ids:
-        rules &= Q(id__in=ids)
-
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.DECREASE_0PERCENT_RULE,
+                      rules.DEFAULT_THRESHOLDS._replace(last_threshold=last_threshold), ids)
 
 
 def items_price_decrease_10percent(second_threshold: float, ids: List = None):
@@ -453,20 +1149,8 @@ def items_price_decrease_10percent(second_threshold: float, ids: List = None):
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status__in=[
-        BWStageEnum.BW_STAGE2_20D.value,
-        BWStageEnum.BW_STAGE1_30D.value,
-        BWStageEnum.BW_STAGE0.value
-    ]) & (
-        Q(cogs_24h_vs_7d__gt=40.0) |
-        Q(item_ranking_today__lt=20) |
-        Q(sales_goal_reached_in_last7days__gt=second_threshold)
-    )
-    if ids:
-        rules &= Q(id__in=ids)
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.DECREASE_10PERCENT_RULE,
+                      rules.DEFAULT_THRESHOLDS._replace(second_threshold=second_threshold), ids)
 
 
 def items_price_decrease_20percent(first_threshold: float, ids: List = None):
@@ -478,108 +1162,68 @@ def items_price_decrease_20percent(first_threshold: float, ids: List = None):
     :param ids: list of item id
     :return: items
     """
-    rules = Q(item_status__in=[
-        BWStageEnum.BW_STAGE1_30D.value,
-        BWStageEnum.BW_STAGE0.value
-    ]) & (
-        Q(cogs_24h_vs_7d__gt=30.0) |
-        Q(item_ranking_today__lt=50) |
-        Q(sales_goal_reached_in_last7days__gt=first_threshold)
-    )
-    if ids:
-        rules &= Q(id__in=ids)
-    return EbayItem.objects.filter(
-        rules
-    )
+    return rule_items(rules.DECREASE_20PERCENT_RULE,
+                      rules.DEFAULT_THRESHOLDS._replace(first_threshold=first_threshold), ids)
+
+
+def items_price_decrease_30percent(ids: List = None):
+    """
+    Get items to stage 1 and set their price to 30 percent decrease.
+    When ids is None search all objects available; otherwise,
+    search items in id list.
+    :param ids: list of item id
+    :return: items
+    """
+    return rule_items(rules.DECREASE_30PERCENT_RULE, ids=ids)
 
 
-def maintain_lrw_list() -> None:
+def maintain_lrw_list(ids: List = None, countries: List[str] = None) -> None:
     """
     Add normal item to lrw_list when it meets the rule
+    :param ids: list of item id, all items when None
+    :param countries: markets to maintain, all when None
     :return: None
     """
-    # Move fufilled items into lrw_List
-    items = EbayItem.objects.filter(
-        Q(item_status=BWStageEnum.NORMAL.value) &
-        Q(lrw__lt=50)
-    )
+    items = rule_items(rules.LRW_LIST_RULE, ids=ids, countries=countries)
     if items:
         LOGGER.info("%s items to be forwarded LRW_LIST.",
                     items.values_list('id', flat=True))
         items.update(item_status=BWStageEnum.LRW_LIST.value)
 
 
-def maintain_blocked_list() -> None:
+def maintain_blocked_list(ids: List = None) -> None:
     """
     Add items to blocked list when it meets the rule
+    :param ids: list of item id, all items when None
     :return: None
     """
-    # Move items to blocked list if badewanne lasts for more than 30 days or
-    # item status is toblock
-    items = EbayItem.objects.filter(
-        (
-            Q(item_status__startswith="BW_STAGE") &
-            Q(last_bw_start_date__lt=datetime.datetime.now(tz=get_current_timezone()) -
-              datetime.timedelta(days=30))
-        ) | (
-            Q(item_status=BWStageEnum.BW_TOBLOCK.value)
-        )
-    )
+    items = rule_items(rules.BLOCKED_LIST_RULE, ids=ids)
     if items:
         LOGGER.info("%s items to be forwarded to BLOCKED_LIST.",
                     items.values_list('id', flat=True))
         items.update(item_status=BWStageEnum.BW_BLOCKED.value)
 
 
-def maintain_normal_list() -> None:
+def maintain_normal_list(ids: List = None) -> None:
     """
     Add items to normal list when it meets the rule
+    :param ids: list of item id, all items when None
     :return: None
     """
-    # Move items to normal list when it fulfills
-    items = EbayItem.objects.filter(
-        # items not fulfill bw_ready any more
-        (Q(item_status=BWStageEnum.BW_READY.value) & ~(
-            Q(sales_goal_reached_in_last7days__lt=100) &
-            Q(sales_goal_reached_in_last14days__lt=100) &
-            Q(sales_goal_reached_mtd__lt=100) &
-            Q(lrw__gt=50) &
-            Q(stock__gt=150) &
-            Q(fc__gt=15) &
-            Q(item_ranking_today__gt=50)
-        )) | (
-            # items in blocked list more than 30 days
-            Q(item_status=BWStageEnum.BW_BLOCKED.value) &
-            Q(last_bw_end_date__lt=datetime.datetime.now(tz=get_current_timezone()) -
-              datetime.timedelta(days=30))
-        ) | (
-            # items in lrw_list more than 50 lrw
-            Q(item_status=BWStageEnum.LRW_LIST.value) &
-            Q(lrw__gt=50)
-        )
-    )
+    items = rule_items(rules.NORMAL_LIST_RULE, ids=ids)
     if items:
         LOGGER.info("%s items to be forwarded to NORMAL.",
                     items.values_list('id', flat=True))
         items.update(item_status=BWStageEnum.NORMAL.value)
 
 
-def maintain_bwready_list() -> None:
+def maintain_bwready_list(ids: List = None) -> None:
     """
     Add normal items to bwready when it meets the rule
+    :param ids: list of item id, all items when None
     :return: None
     """
-    # Forward items to bw_ready if it fulfills the requirements
-    items = EbayItem.objects.filter(
-        Q(item_status=BWStageEnum.NORMAL.value) &
-        Q(sales_goal_reached_in_last7days__lt=100) &
-        Q(sales_goal_reached_in_last14days__lt=100) &
-        Q(sales_goal_reached_mtd__lt=100) &
-        Q(lrw__gt=50) &
-        Q(stock__gt=150) &
-        Q(fc__gt=15) &
-        Q(item_ranking_today__gt=50)
-    )
+    items = rule_items(rules.BWREADY_LIST_RULE, ids=ids)
     if items:
         LOGGER.info("%s items to be forwarded BW_READY.",
                     items.values_list('id', flat=True))
@@ -3,19 +3,49 @@
 """
 
 import datetime
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
 import requests
+from unittest import mock, skipUnless
 
+import numpy as np
 import pandas as pd
 
+from background_task.models import Task
+from background_task.models_completed import CompletedTask
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError
+from django.core.management import call_command
 from django.db.models import Q
 from django.db import connection
 from django.forms.models import model_to_dict
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils.timezone import get_current_timezone
 
-from .models import EbayItem, BWStageEnum
+from .admin import EbayItemAdmin
+from .models import (
+    ArchivedEbayItem, CatalogVersion, EbayItem, EbayItemPriceHistory, EbayItemsFilter,
+    BWStageEnum, ItemClaim, PartitionLease, RequestProfile, SlowQuery
+)
+from .management.commands import run_worker
 from .tables import EbayItemTable
-from . import tasks
+from . import (
+    archive, catalog, enqueue, history, leases, memprofile, parallel, partitioning, profiling,
+    progress, routers, rules, simulator, slowsql, snapshots, tasks, throughput, transitions
+)
 
 
 class TasksDBRelatedTestCase(TestCase):
@@ -146,6 +176,154 @@ class TasksDBRelatedTestCase(TestCase):
             "The updated ebayitem table equals to BIServer"
         )
 
+    @override_settings(PIPELINE_WORKERS=2, PIPELINE_PARALLEL_MIN_ITEMS=0,
+                       PIPELINE_HASH_PARTITIONS=3)
+    def test_update_or_create_ebay_items_partitioned(self) -> None:
+        """
+        Test tasks function update_or_create_ebay_items with the diff running
+        in the worker pool
+        :return: None
+        """
+        tasks.update_or_create_ebay_items(self.ebay_item_daily,
+                                          tasks.get_all_django_exist_items())
+        self.assertEqual(
+            list(EbayItem.objects.order_by('id').values_list('auction_id', 'country', 'lrw')),
+            list(self.ebay_item_daily[['AuctionID', 'Country', 'LRW']].itertuples(
+                index=False, name=None
+            ))
+        )
+
+    def test_coerce_biserver_frame(self) -> None:
+        """
+            test function coerce_biserver_frame
+        :return: None
+        """
+        daily = self.ebay_item_daily.copy()
+        daily.loc[3, 'ItemStatus'] = None
+        coerced = tasks.coerce_biserver_frame(daily)
+        self.assertEqual(coerced.columns.to_list(), list(tasks.BISERVER_SCHEMA))
+        self.assertEqual(len(coerced), 4)
+        self.assertEqual(str(coerced['Country'].dtype), 'category')
+        self.assertEqual(str(coerced['PositionCurrentDay'].dtype), 'int16')
+        self.assertEqual(str(coerced['COGS24HVS7D'].dtype), 'float32')
+        self.assertEqual(str(coerced['CurrentSalePrice'].dtype), 'float64')
+        self.assertEqual(
+            coerced.astype(object).values.tolist(),
+            daily[list(tasks.BISERVER_SCHEMA)].astype(object).values.tolist()
+        )
+        self.assertLess(tasks.frame_memory_usage(coerced), tasks.frame_memory_usage(daily))
+
+        daily.loc[2, 'LRW'] = None
+        self.assertEqual(len(tasks.coerce_biserver_frame(daily)), 3)
+        with self.assertRaises(ValueError):
+            tasks.coerce_biserver_frame(daily.drop(columns=['SKU']))
+
+        tasks.update_or_create_ebay_items(tasks.coerce_biserver_frame(self.ebay_item_daily),
+                                          tasks.get_all_django_exist_items())
+        self.assertEqual(
+            list(EbayItem.objects.values_list('country', 'cogs_24h_vs_7d', 'current_sale_price',
+                                              'item_ranking_today')),
+            list(self.ebay_item_daily[['Country', 'COGS24HVS7D', 'CurrentSalePrice',
+                                       'PositionCurrentDay']].itertuples(index=False, name=None))
+        )
+
+    @override_settings(ARCHIVE_MISSING_CYCLES=2)
+    def test_archive_missing_items(self) -> None:
+        """
+            Test that items missing from BIServer are archived after the
+            configured cycles and restored under their id when they reappear
+        :return: None
+        """
+        daily = tasks.coerce_biserver_frame(self.ebay_item_daily)
+        missing = EbayItem.objects.get(auction_id='121853803976')
+        without = daily[daily['AuctionID'] != '121853803976'].reset_index(drop=True)
+
+        def sync(frame):
+            tasks.update_or_create_ebay_items(frame, tasks.get_all_django_exist_items())
+
+        sync(without)
+        self.assertEqual(EbayItem.objects.get(id=missing.id).missing_cycles, 1)
+        sync(daily)
+        self.assertEqual(EbayItem.objects.get(id=missing.id).missing_cycles, 0)
+        sync(without)
+        sync(without)
+        self.assertFalse(EbayItem.objects.filter(id=missing.id).exists())
+        archived = ArchivedEbayItem.objects.get()
+        self.assertEqual((archived.id, archived.item_status, archived.sku),
+                         (missing.id, 'NORMAL', '10026400;0'))
+
+        # an incomplete BIServer result is not counted
+        sync(without.iloc[:1])
+        self.assertEqual(EbayItem.objects.filter(missing_cycles__gt=0).count(), 0)
+
+        daily.loc[daily['AuctionID'] == '121853803976', 'LRW'] = 9
+        sync(daily)
+        restored = EbayItem.objects.get(auction_id='121853803976')
+        self.assertEqual((restored.id, restored.lrw, restored.item_status),
+                         (missing.id, 9, 'NORMAL'))
+        self.assertFalse(ArchivedEbayItem.objects.exists())
+        self.assertEqual(EbayItem.objects.count(), 4)
+
+    def test_sync_against_snapshot(self) -> None:
+        """
+            test function sync_against_snapshot
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as snapshot_dir, \
+                self.settings(BISERVER_SNAPSHOT_DIR=snapshot_dir, BISERVER_SNAPSHOT_RETENTION=2):
+            daily = tasks.coerce_biserver_frame(self.ebay_item_daily)
+            tasks.sync_against_snapshot(daily)
+            self.assertEqual(EbayItem.objects.count(), 4)
+            previous = snapshots.read_latest_snapshot()
+            self.assertEqual(
+                previous['id'].tolist(),
+                list(EbayItem.objects.order_by('id').values_list('id', flat=True))
+            )
+
+            # unchanged rows are not written again
+            EbayItem.objects.filter(auction_id='121497332358').update(lrw=1)
+            daily.loc[daily['AuctionID'] == '361127495438', 'LRW'] = 7
+            daily = pd.concat([daily, daily.iloc[[3]].assign(AuctionID='121853803978')])
+            tasks.sync_against_snapshot(daily)
+            self.assertEqual(
+                list(EbayItem.objects.order_by('id').values_list('auction_id', 'lrw')),
+                [('121497332358', 1), ('361127495438', 7), ('121853803976', 147),
+                 ('121853803977', 147), ('121853803978', 147)]
+            )
+            self.assertEqual(
+                snapshots.read_latest_snapshot()['id'].tolist(),
+                list(EbayItem.objects.order_by('id').values_list('id', flat=True))
+            )
+
+            tasks.sync_against_snapshot(daily)
+            self.assertEqual(len(snapshots.snapshot_paths()), 2)
+
+            # a due full diff overwrites the local edit the snapshot diff missed
+            self.assertFalse(snapshots.full_diff_due())
+            self.assertTrue(snapshots.full_diff_due(
+                datetime.datetime.now(tz=get_current_timezone()) + datetime.timedelta(days=1)
+            ))
+            with self.settings(BISERVER_SNAPSHOT_FULL_DIFF_SECONDS=0):
+                tasks.sync_against_snapshot(daily)
+            self.assertEqual(
+                EbayItem.objects.get(auction_id='121497332358').lrw,
+                daily.loc[daily['AuctionID'] == '121497332358', 'LRW'].iloc[0]
+            )
+
+    def test_diff_snapshots(self) -> None:
+        """
+            test function diff_snapshots
+        :return: None
+        """
+        previous = tasks.coerce_biserver_frame(self.ebay_item_daily).assign(id=[11, 12, 13, 14])
+        current = tasks.coerce_biserver_frame(self.ebay_item_daily.iloc[[3, 2, 1, 0]])
+        current['CurrentSalePrice'] = [109.99, 109.99, 300.5, 199.99]
+        current['AuctionID'] = ['1', '121853803976', '361127495438', '121497332358']
+        diff = snapshots.diff_snapshots(previous, current, tasks.KEY_COLUMNS,
+                                        list(tasks.SYNC_UPDATE_FIELDS.values()))
+        self.assertEqual([values.tolist() for values in diff],
+                         [[0], [2], [12], [1, 3], [13, 11]])
+
     def test_get_all_django_exist_items(self) -> None:
         """
             test function get_all_django_exist_items
@@ -165,6 +343,30 @@ class TasksDBRelatedTestCase(TestCase):
             [10027587, '121497332358', 'BW_STAGE0']
         )
 
+    def test_get_all_django_exist_items_typed(self) -> None:
+        """
+            test the dtypes of function get_all_django_exist_items on a scoped queryset
+        :return: None
+        """
+        with self.settings(PIPELINE_HASH_PARTITIONS=4), \
+                mock.patch.object(tasks, 'LOAD_CHUNK_SIZE', 1):
+            partition = EbayItem.objects.first().item_no % 4
+            ebay_django = tasks.get_all_django_exist_items(leases.partition_items([partition]))
+        self.assertEqual(
+            [str(dtype) for dtype in ebay_django.dtypes],
+            ['int64', 'int64', 'object', 'category']
+        )
+        self.assertEqual(
+            sorted(ebay_django['id'].to_list()),
+            sorted(EbayItem.objects.filter(
+                item_no__in=ebay_django['ItemNo'].to_list()
+            ).values_list('id', flat=True))
+        )
+        self.assertEqual(
+            list(ebay_django['ItemStatus'].cat.categories),
+            [stage.value for stage in BWStageEnum]
+        )
+
 
 def create_ebayitem(item_no=10029331, item_id='3190685',
                     auction_id='282846089528', sku='10029331;0',
@@ -265,7 +467,7 @@ class TestTasksMaintainListCase(TestCase):
                         item_status=BWStageEnum.BW_STAGE1_30D.value)
         tasks.maintain_bwready_list()
         self.assertEqual(
-            list(EbayItem.objects.all().values('item_status')),
+            list(EbayItem.objects.order_by('id').values('item_status')),
             [
                 {'item_status': 'BW_READY'},
                 {'item_status': 'NORMAL'},
@@ -294,7 +496,7 @@ class TestTasksMaintainListCase(TestCase):
                         item_status=BWStageEnum.BW_READY.value)
         tasks.maintain_normal_list()
         self.assertEqual(
-            list(EbayItem.objects.all().values('item_status')),
+            list(EbayItem.objects.order_by('id').values('item_status')),
             [
                 {'item_status': 'NORMAL'},
                 {'item_status': 'NORMAL'},
@@ -318,7 +520,7 @@ class TestTasksMaintainListCase(TestCase):
         create_ebayitem(item_status=BWStageEnum.NORMAL.value)
         tasks.maintain_blocked_list()
         self.assertEqual(
-            list(EbayItem.objects.all().values('item_status')),
+            list(EbayItem.objects.order_by('id').values('item_status')),
             [
                 {'item_status': 'BW_BLOCKED'},
                 {'item_status': 'BW_READY'},
@@ -337,7 +539,7 @@ class TestTasksMaintainListCase(TestCase):
         create_ebayitem(item_status=BWStageEnum.BW_READY.value, lrw=49)
         tasks.maintain_lrw_list()
         self.assertEqual(
-            list(EbayItem.objects.all().values('item_status')),
+            list(EbayItem.objects.order_by('id').values('item_status')),
             [
                 {'item_status': 'LRW_LIST'},
                 {'item_status': 'NORMAL'},
@@ -345,6 +547,29 @@ class TestTasksMaintainListCase(TestCase):
             ]
         )
 
+    def test_sync_items_status_moved_meanwhile(self) -> None:
+        """
+            Test that sync_items_status keeps the status of an item moved between
+            the load and the write
+        :return: None
+        """
+        moved = create_ebayitem(item_no=1, item_status=BWStageEnum.NORMAL.value, lrw=49)
+        kept = create_ebayitem(item_no=2, item_status=BWStageEnum.NORMAL.value, lrw=49)
+        status_transitions = tasks.status_transitions
+
+        def click(*args):
+            changes = status_transitions(*args)
+            # a start click moves the item after the rules saw it
+            EbayItem.objects.filter(id=moved.id).update(item_status=BWStageEnum.BW_STAGE0.value)
+            return changes
+
+        with mock.patch.object(tasks, 'status_transitions', side_effect=click):
+            tasks.sync_items_status()
+        self.assertEqual(EbayItem.objects.get(id=moved.id).item_status,
+                         BWStageEnum.BW_STAGE0.value)
+        self.assertEqual(EbayItem.objects.get(id=kept.id).item_status,
+                         BWStageEnum.LRW_LIST.value)
+
     def test_sync_items_status(self) -> None:
         """
             Test function sync_items_status
@@ -363,7 +588,7 @@ class TestTasksMaintainListCase(TestCase):
                         stock=200, fc=20, item_ranking_today=100)
         tasks.sync_items_status()
         self.assertEqual(
-            list(EbayItem.objects.all().values('item_status')),
+            list(EbayItem.objects.order_by('id').values('item_status')),
             [
                 {'item_status': 'LRW_LIST'},
                 {'item_status': 'BW_BLOCKED'},
@@ -373,6 +598,356 @@ class TestTasksMaintainListCase(TestCase):
         )
 
 
+class TestParallelPipelineCase(TestCase):
+    """
+        Test that the partitioned pipeline gives the same result as the serial one
+    """
+
+    def test_diff_ebay_items(self) -> None:
+        """
+            Test function diff_ebay_items serial against partitioned
+        :return: None
+        """
+        items_new = pd.DataFrame(data={
+            'ItemNo': [10 + i % 7 for i in range(40)],
+            'AuctionID': [str(1000 + i) for i in range(40)],
+        })
+        items_old = pd.DataFrame(data={
+            'id': list(range(1, 31)),
+            'ItemNo': [10 + i % 7 for i in range(0, 60, 2)],
+            'AuctionID': [str(1000 + i) for i in range(0, 60, 2)],
+        })
+        serial = tasks.diff_ebay_items(items_new, items_old)
+        with self.settings(PIPELINE_WORKERS=2, PIPELINE_PARALLEL_MIN_ITEMS=0,
+                           PIPELINE_HASH_PARTITIONS=4):
+            partitioned = tasks.diff_ebay_items(items_new, items_old)
+        self.assertEqual(serial[0].tolist(), list(range(1, 40, 2)))
+        self.assertEqual(serial[1].tolist(), list(range(0, 40, 2)))
+        self.assertEqual(serial[2].tolist(), list(range(1, 21)))
+        for expected, actual in zip(serial, partitioned):
+            self.assertEqual(expected.tolist(), actual.tolist())
+
+    @override_settings(PIPELINE_WORKERS=2)
+    def test_sync_items_status_partitioned(self) -> None:
+        """
+            Test function sync_items_status with the partitioned transitions
+        :return: None
+        """
+        create_ebayitem(item_status=BWStageEnum.NORMAL.value, lrw=49)
+        create_ebayitem(item_status=BWStageEnum.BW_STAGE1_30D.value, country='FR',
+                        last_bw_start_date=datetime.datetime.now(tz=get_current_timezone()) -
+                        datetime.timedelta(days=31))
+        create_ebayitem(last_bw_end_date=datetime.datetime.now(tz=get_current_timezone()) -
+                        datetime.timedelta(days=31),
+                        item_status=BWStageEnum.BW_BLOCKED.value, fc=14)
+        create_ebayitem(sales_goal_reached_in_last7days=90,
+                        sales_goal_reached_in_last14days=90,
+                        sales_goal_reached_mtd=90, lrw=60, country='IT',
+                        stock=200, fc=20, item_ranking_today=100)
+        create_ebayitem(item_status=BWStageEnum.BW_TOBLOCK.value, channel='ebay-plus')
+        tasks.sync_items_status()
+        self.assertEqual(
+            list(EbayItem.objects.order_by('id').values_list('item_status', flat=True)),
+            ['LRW_LIST', 'BW_BLOCKED', 'NORMAL', 'BW_READY', 'BW_BLOCKED']
+        )
+
+    def test_get_smart_prices(self) -> None:
+        """
+            Test function get_smart_prices serial against partitioned
+        :return: None
+        """
+        items = [
+            EbayItem(item_no=10000 + i, country=['DE', 'FR', 'IT'][i % 3], channel='ebay',
+                     last_humansetprice_before_badewanne=9.99 + i * 3.5,
+                     our_purchase_price=3.59 + i)
+            for i in range(30)
+        ]
+        serial = tasks.get_smart_prices(items, 0.3)
+        with self.settings(PIPELINE_WORKERS=2, PIPELINE_PARALLEL_MIN_ITEMS=0):
+            partitioned = tasks.get_smart_prices(items, 0.3)
+        self.assertEqual(serial, partitioned)
+        self.assertEqual(serial[0], tasks.get_smart_price_number(9.99, 3.59, 0.3))
+
+
+class TestRulesCase(TestCase):
+    """
+        Test that the rules compile to equal Q objects and NumPy masks
+    """
+
+    def setUp(self) -> None:
+        now = datetime.datetime.now(tz=get_current_timezone())
+        rng = np.random.RandomState(0)
+        for index in range(300):
+            create_ebayitem(
+                item_no=10000 + index, auction_id=str(200000 + index),
+                item_status=rng.choice([stage.value for stage in BWStageEnum]),
+                sales_goal_reached_in_last7days=rng.choice([50.0, 95.0, 105.0, 115.0, 125.0]),
+                sales_goal_reached_in_last14days=rng.choice([80.0, 95.0]),
+                sales_goal_reached_mtd=rng.choice([90.0, 100.0]),
+                cogs_24h_vs_7d=rng.choice([10.0, 35.0, 45.0, 55.0]),
+                item_ranking_today=int(rng.choice([5, 15, 40, 300])),
+                lrw=int(rng.choice([30, 50, 60])), stock=int(rng.choice([100, 200])),
+                fc=int(rng.choice([10, 20])),
+                last_bw_start_date=now - datetime.timedelta(days=int(rng.choice([5, 40]))),
+                last_bw_end_date=now - datetime.timedelta(days=int(rng.choice([5, 40])))
+            )
+        for item_status in [BWStageEnum.NORMAL.value, BWStageEnum.BW_READY.value]:
+            create_ebayitem(item_no=20000, item_status=item_status,
+                            sales_goal_reached_in_last7days=90,
+                            sales_goal_reached_in_last14days=90,
+                            sales_goal_reached_mtd=90, lrw=60,
+                            stock=200, fc=20, item_ranking_today=100)
+
+    def test_compile_q_and_mask(self) -> None:
+        """
+            Test functions compile_q and compile_mask select the same items
+        :return: None
+        """
+        now = datetime.datetime.now(tz=get_current_timezone())
+        fields = ['id'] + rules.rule_fields(rules.STATUS_RULES + rules.BADEWANNE_RULES)
+        items = pd.DataFrame.from_records(list(EbayItem.objects.values_list(*fields)),
+                                          columns=fields)
+        for rule in rules.STATUS_RULES + rules.BADEWANNE_RULES:
+            selected = items['id'].values[
+                rules.compile_mask(rule, items['item_status'].values, items, now=now)
+            ]
+            self.assertEqual(
+                sorted(selected.tolist()),
+                sorted(EbayItem.objects.filter(rules.compile_q(rule, now=now))
+                       .values_list('id', flat=True)),
+                rule.name
+            )
+            self.assertTrue(len(selected), rule.name)
+
+    def test_sync_items_status(self) -> None:
+        """
+            Test function sync_items_status in one pass against the maintain functions
+        :return: None
+        """
+        ids = list(EbayItem.objects.order_by('id').values_list('id', flat=True))
+        # the update of every rule and the two statements of its catalog version
+        with self.assertNumQueries(1 + 3 * len(rules.STATUS_RULES)):
+            tasks.sync_items_status(ids)
+        one_pass = list(EbayItem.objects.order_by('id').values_list('item_status', flat=True))
+        self.tearDown()
+        EbayItem.objects.all().delete()
+        self.setUp()
+        tasks.maintain_lrw_list()
+        tasks.maintain_blocked_list()
+        tasks.maintain_normal_list()
+        tasks.maintain_bwready_list()
+        self.assertEqual(
+            list(EbayItem.objects.order_by('id').values_list('item_status', flat=True)),
+            one_pass
+        )
+
+
+class TestBadewanneSimulatorCase(TestCase):
+    """
+        Test the badewanne what-if simulator
+    """
+
+    def setUp(self) -> None:
+        stages = [BWStageEnum.BW_STAGE0, BWStageEnum.BW_STAGE1_30D, BWStageEnum.BW_STAGE2_20D,
+                  BWStageEnum.BW_STAGE3_10D, BWStageEnum.BW_STAGE4_0D, BWStageEnum.BW_STAGE5_5I,
+                  BWStageEnum.BW_TOBLOCK, BWStageEnum.NORMAL]
+        for index in range(48):
+            create_ebayitem(
+                item_no=10000 + index, auction_id=str(200000 + index),
+                item_status=stages[index % len(stages)].value,
+                sales_goal_reached_in_last7days=[50.0, 95.0, 105.0, 115.0, 125.0][index % 5],
+                sales_goal_reached_in_last14days=[80.0, 95.0][index % 2],
+                cogs_24h_vs_7d=[10.0, 35.0, 45.0, 55.0][index % 4],
+                item_ranking_today=[5, 15, 40, 300][index % 7 % 4],
+                current_sale_price=49.99 + index, last_humansetprice_before_badewanne=59.99 + index,
+                our_purchase_price=20.0 + index / 2
+            )
+
+    def test_smart_prices(self) -> None:
+        """
+            Test function smart_prices against get_smart_price_number
+        :return: None
+        """
+        base_prices = np.round(np.random.RandomState(0).uniform(1, 500, size=2000), 2)
+        purchase_prices = np.round(base_prices * np.random.RandomState(1).uniform(
+            0.2, 0.9, size=2000), 2)
+        for discount in [-0.1, -0.05, 0.0, 0.1, 0.2, 0.3]:
+            self.assertEqual(
+                simulator.smart_prices(base_prices, purchase_prices, discount).tolist(),
+                [tasks.get_smart_price_number(base_price, purchase_price, discount)
+                 for base_price, purchase_price in zip(base_prices, purchase_prices)]
+            )
+
+    def test_simulate(self) -> None:
+        """
+            Test the simulation with default thresholds against badewanne_process_tracking
+        :return: None
+        """
+        catalog = simulator.load_catalog()
+        target = simulator.simulate(catalog, rules.DEFAULT_THRESHOLDS)
+        summary = simulator.summarize(catalog, rules.DEFAULT_THRESHOLDS, target)
+        response = mock.Mock(json=mock.Mock(return_value={'HasErrors': False}))
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api', return_value=response):
+            tasks.badewanne_process_tracking.now()
+
+        items = EbayItem.objects.in_bulk(catalog.ids.tolist())
+        for position, item_id in enumerate(catalog.ids):
+            if target[position] < 0:
+                continue
+            stage = rules.BADEWANNE_RULES[target[position]].target
+            self.assertEqual(items[item_id].item_status, stage.value)
+            self.assertEqual(items[item_id].new_price,
+                             catalog.stage_prices[target[position], position])
+        self.assertEqual(summary['moved'], int((target >= 0).sum()))
+        self.assertEqual(
+            EbayItem.objects.filter(item_status=BWStageEnum.BW_STAGE1_30D.value).count(),
+            summary[BWStageEnum.BW_STAGE1_30D.value]
+        )
+
+    def test_sweep(self) -> None:
+        """
+            Test function sweep over a threshold grid
+        :return: None
+        """
+        combinations = simulator.threshold_grid(increase_10percent=[100.0, 130.0],
+                                                stage2_rank=[10, 50, 100])
+        summaries = simulator.sweep(simulator.load_catalog(), combinations)
+        self.assertEqual(len(summaries), 6)
+        self.assertEqual(summaries['stage2_rank'].tolist(), [10, 50, 100, 10, 50, 100])
+        self.assertTrue((summaries[BWStageEnum.BW_STAGE6_10I.value][3:] == 0).all())
+        self.assertTrue((summaries[BWStageEnum.BW_STAGE6_10I.value][:3] > 0).all())
+        self.assertEqual(summaries['first_threshold'].unique().tolist(),
+                         [rules.DEFAULT_THRESHOLDS.first_threshold])
+
+
+@override_settings(PIPELINE_HASH_PARTITIONS=4, PIPELINE_LEASE_SECONDS=300)
+class TestPartitionLeaseCase(TestCase):
+    """
+        Test lease based partition ownership of several worker nodes
+    """
+
+    def test_claim_partitions_fair_share(self) -> None:
+        """
+            Test that a second node gets its share once the first one renews
+        :return: None
+        """
+        self.assertEqual(leases.claim_partitions('node-a'), [0, 1, 2, 3])
+        self.assertEqual(leases.claim_partitions('node-b'), [])
+        self.assertEqual(leases.claim_partitions('node-a'), [0, 1])
+        self.assertEqual(leases.claim_partitions('node-b'), [2, 3])
+        self.assertEqual(leases.claim_partitions('node-a'), [0, 1])
+
+    def test_claim_partitions_after_expiry(self) -> None:
+        """
+            Test that partitions of a dead node are taken over after the lease expires
+        :return: None
+        """
+        now = datetime.datetime.now(tz=get_current_timezone())
+        self.assertEqual(leases.claim_partitions('node-a', now), [0, 1, 2, 3])
+        self.assertEqual(
+            leases.claim_partitions('node-b', now + datetime.timedelta(seconds=299)), []
+        )
+        self.assertEqual(
+            leases.claim_partitions('node-b', now + datetime.timedelta(seconds=301)),
+            [0, 1, 2, 3]
+        )
+
+    def test_start_cycle(self) -> None:
+        """
+            Test that a partition is processed only once per cycle
+        :return: None
+        """
+        now = datetime.datetime.now(tz=get_current_timezone())
+        cycle = leases.current_cycle(now)
+        owned = leases.claim_partitions('node-a', now)
+        self.assertEqual(leases.start_cycle('node-a', owned, cycle), [0, 1, 2, 3])
+        self.assertEqual(leases.start_cycle('node-a', owned, cycle), [])
+        owned = leases.claim_partitions('node-b', now + datetime.timedelta(seconds=301))
+        self.assertEqual(leases.start_cycle('node-b', owned, cycle), [])
+        self.assertEqual(leases.start_cycle('node-a', [0, 1, 2, 3], cycle + 1), [])
+        self.assertEqual(leases.start_cycle('node-b', owned, cycle + 1), [0, 1, 2, 3])
+
+    def test_partition_items(self) -> None:
+        """
+            Test function partition_items
+        :return: None
+        """
+        for item_no in [8, 9, 10, 13]:
+            create_ebayitem(item_no=item_no)
+        self.assertEqual(
+            sorted(leases.partition_items([1]).values_list('item_no', flat=True)),
+            [9, 13]
+        )
+        self.assertEqual(
+            sorted(leases.partition_items([0, 2]).values_list('item_no', flat=True)),
+            [8, 10]
+        )
+        # the bucket follows writes of item_no
+        EbayItem.objects.filter(item_no=13).update(item_no=14)
+        item = EbayItem.objects.get(item_no=8)
+        item.item_no = 263
+        item.save(update_fields=['item_no'])
+        self.assertEqual(
+            list(EbayItem.objects.order_by('item_no').values_list('item_no', 'item_bucket')),
+            [(9, 9), (10, 10), (14, 14), (263, 7)]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                sorted(leases.partition_items([2, 3]).values_list('item_no', flat=True)),
+                [10, 14, 263]
+            )
+        self.assertIn('"ItemBucket" IN', queries.captured_queries[0]['sql'])
+        # a count which does not divide the buckets falls back to the modulo
+        with override_settings(PIPELINE_HASH_PARTITIONS=3):
+            self.assertEqual(
+                sorted(leases.partition_items([2]).values_list('item_no', flat=True)),
+                [14, 263]
+            )
+
+    def test_renew_from_progress(self) -> None:
+        """
+            Test that a leased cycle renews its leases while a phase processes rows
+        :return: None
+        """
+        owned = leases.claim_partitions('node-a')
+        renewal = leases.LeaseRenewal('node-a', owned)
+        with mock.patch.object(leases, 'renew_partitions',
+                               wraps=leases.renew_partitions) as renew, \
+                throughput.metered() as meter, throughput.observed(renewal.renew), \
+                meter.phase('sync'):
+            throughput.advance(1)
+            renew.assert_not_called()
+            renewal.renewed -= leases.get_lease_duration().total_seconds()
+            throughput.advance(1)
+            throughput.advance(1)
+        renew.assert_called_once_with('node-a', owned)
+        self.assertIsNone(meter.on_progress)
+
+    def test_run_leased_cycle(self) -> None:
+        """
+            Test that a leased cycle filters on its partitions instead of loading their ids
+        :return: None
+        """
+        for item_no in [8, 9, 10, 11]:
+            create_ebayitem(item_no=item_no, item_status=BWStageEnum.NORMAL.value, lrw=49)
+        leases.claim_partitions('node-a')
+        leases.claim_partitions('node-b')
+        leases.claim_partitions('node-a')
+        with override_settings(PIPELINE_NODE_NAME='node-b'), \
+                mock.patch.object(tasks, 'sync_eaby_item') as sync, \
+                mock.patch.object(tasks, 'badewanne_process_tracking') as tracking, \
+                CaptureQueriesContext(connection) as queries:
+            tasks.run_leased_cycle()
+        sync.assert_called_once_with([2, 3])
+        tracking.now.assert_called_once_with(countries=None, partitions=[2, 3])
+        self.assertEqual(
+            list(EbayItem.objects.order_by('item_no').values_list('item_no', 'item_status')),
+            [(8, 'NORMAL'), (9, 'NORMAL'), (10, 'LRW_LIST'), (11, 'LRW_LIST')]
+        )
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT "ebayItems_ebayitem"."id" FROM')])
+
+
 class TestTasksItemFilteringCase(TestCase):
     """
         Test functions in tasks which filters items based on various rules
@@ -689,6 +1264,159 @@ class TestTaskPriceChaningAPIRelatedCase(TestCase):
             list(EbayItem.objects.all())
         )
 
+    def test_forward_badewanne_stage_history(self) -> None:
+        """
+        Test function forward_badewanne_stage records the successful price changes
+        :return: None
+        """
+        stage0_item1 = create_ebayitem(item_status=BWStageEnum.BW_STAGE0.value,
+                                       current_sale_price=100.00, our_purchase_price=30.00,
+                                       auction_id='100101102')
+        stage0_item2 = create_ebayitem(item_status=BWStageEnum.BW_STAGE0.value,
+                                       current_sale_price=200.00, our_purchase_price=30.00,
+                                       auction_id='100101101')
+        response = requests.models.Response()
+        response._content = b'{"HasErrors": true, "Results":' \
+                            b'[{"IsSuccessful": true, "Message": "sample string 2"}, ' \
+                            b'{"IsSuccessful": false, "Message": "sample string 2"}]}'
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api', return_value=response):
+            tasks.forward_badewanne_stage([stage0_item1, stage0_item2],
+                                          BWStageEnum.BW_STAGE1_30D, 0.3)
+        self.assertEqual(
+            list(EbayItemPriceHistory.objects.values_list(
+                'item_id', 'old_price', 'new_price', 'stage', 'reason'
+            )),
+            [(stage0_item1.id, 100.00, 69.99, 'BW_STAGE1_30D',
+              'EBay_Badewanne_Auto_Start_BW_STAGE1_30D')]
+        )
+
+    def test_forward_badewanne_stage_claim(self) -> None:
+        """
+        Test that forward_badewanne_stage prices only the items still in the
+        status they were selected with and releases the failed ones
+        :return: None
+        """
+        items = [create_ebayitem(item_status=BWStageEnum.BW_STAGE0.value,
+                                 current_sale_price=100.00, our_purchase_price=30.00,
+                                 auction_id=auction_id)
+                 for auction_id in ('100101101', '100101102', '100101103')]
+        # a concurrent run forwarded the first item after both selected it
+        EbayItem.objects.filter(id=items[0].id).update(
+            item_status=BWStageEnum.BW_STAGE1_30D.value
+        )
+        response = requests.models.Response()
+        response._content = b'{"HasErrors": true, "Results":' \
+                            b'[{"IsSuccessful": true, "Message": "sample string 2"}, ' \
+                            b'{"IsSuccessful": false, "Message": "sample string 2"}]}'
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api',
+                               return_value=response) as api:
+            forwarded = tasks.forward_badewanne_stage(items, BWStageEnum.BW_STAGE1_30D, 0.3)
+        self.assertEqual([data['ListingId'] for data in api.call_args[0][0]],
+                         ['100101102', '100101103'])
+        self.assertEqual(forwarded, [items[1].id])
+        self.assertEqual(
+            list(EbayItem.objects.order_by('id').values_list('item_status', flat=True)),
+            [BWStageEnum.BW_STAGE1_30D.value, BWStageEnum.BW_STAGE1_30D.value,
+             BWStageEnum.BW_STAGE0.value]
+        )
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api') as api:
+            self.assertEqual(tasks.forward_badewanne_stage(
+                items[:2], BWStageEnum.BW_STAGE1_30D, 0.3
+            ), [])
+        api.assert_not_called()
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api',
+                               side_effect=requests.ConnectionError):
+            with self.assertRaises(requests.ConnectionError):
+                tasks.forward_badewanne_stage(items[2:], BWStageEnum.BW_STAGE1_30D, 0.3)
+        self.assertEqual(EbayItem.objects.get(id=items[2].id).item_status,
+                         BWStageEnum.BW_STAGE0.value)
+        self.assertFalse(ItemClaim.objects.exists())
+
+    def test_release_stale_claims(self) -> None:
+        """
+            Test that the items of a tracking run killed between the claim and
+            the price change are released once their claims are stale
+        :return: None
+        """
+        items = [create_ebayitem(item_no=item_no, item_status=BWStageEnum.BW_STAGE0.value,
+                                 current_sale_price=100.00, our_purchase_price=30.00)
+                 for item_no in (1, 2)]
+        # the run dies before it prices the claimed items
+        self.assertEqual(len(tasks.claim_items(items, BWStageEnum.BW_STAGE1_30D)), 2)
+        claimed_at = ItemClaim.objects.get(item_id=items[0].id).claimed_at
+        # a user moved the second item since the claim
+        EbayItem.objects.filter(id=items[1].id).update(item_status=BWStageEnum.NORMAL.value)
+        self.assertEqual(tasks.release_stale_claims(claimed_at + datetime.timedelta(minutes=1)), 0)
+        self.assertEqual(ItemClaim.objects.count(), 2)
+        self.assertEqual(tasks.release_stale_claims(
+            claimed_at + tasks.get_claim_timeout() + datetime.timedelta(minutes=1)
+        ), 1)
+        self.assertEqual(
+            list(EbayItem.objects.order_by('id').values_list('item_status', flat=True)),
+            [BWStageEnum.BW_STAGE0.value, BWStageEnum.NORMAL.value]
+        )
+        self.assertFalse(ItemClaim.objects.exists())
+
+    def test_badewanne_fall_through(self) -> None:
+        """
+        Test that an item whose price change fails at a stage is forwarded by a
+        later stage whose rule it fulfills, priced from its stored prices
+        :return: None
+        """
+        item = create_ebayitem(item_status=BWStageEnum.BW_STAGE0.value,
+                               sales_goal_reached_in_last14days=95.0,
+                               current_sale_price=100.00, our_purchase_price=30.00)
+        failed = requests.models.Response()
+        failed._content = b'{"HasErrors": true, "Results":' \
+                          b'[{"IsSuccessful": false, "Message": "sample string 2"}]}'
+        succeeded = requests.models.Response()
+        succeeded._content = b'{"HasErrors": false}'
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api',
+                               side_effect=[failed, succeeded]) as api:
+            tasks.badewanne_process_tracking.now()
+        self.assertEqual([call[0][0][0]['Reason'] for call in api.call_args_list], [
+            'EBay_Badewanne_Auto_Start_BW_STAGE4_0D', 'EBay_Badewanne_Auto_Start_BW_STAGE1_30D'
+        ])
+        item.refresh_from_db()
+        self.assertEqual(item.item_status, BWStageEnum.BW_STAGE1_30D.value)
+        self.assertEqual(item.last_humansetprice_before_badewanne, 100.00)
+        self.assertEqual(api.call_args_list[1][0][0][0]['Price'],
+                         tasks.price_partition([100.00], [30.00], 0.3)[0])
+
+    def test_get_price_history(self) -> None:
+        """
+        Test function get_price_history
+        :return: None
+        """
+        item1 = create_ebayitem(auction_id='100101102')
+        item2 = create_ebayitem(auction_id='100101101')
+        item3 = create_ebayitem(auction_id='100101103')
+        now = datetime.datetime.now(tz=get_current_timezone())
+        for day, price in enumerate([100.0, 80.0, 70.0, 75.0]):
+            item1.new_price = item2.new_price = price
+            history.record_price_changes([item1, item2], {item1.id: price + 1, item2.id: price},
+                                         BWStageEnum.BW_STAGE2_20D, 'reason',
+                                         now + datetime.timedelta(days=day))
+        for over_clause in (False, True):
+            # SQLite numbers rows since 3.25, Django 2.2 does not use it there
+            with mock.patch.object(connection.features, 'supports_over_clause', over_clause), \
+                    CaptureQueriesContext(connection) as queries:
+                changes = history.get_price_history([item1.id, item2.id, item3.id], last=2)
+            self.assertEqual(len(queries), 1)
+            self.assertIn('ROW_NUMBER' if over_clause else 'UNION ALL',
+                          queries.captured_queries[0]['sql'])
+            for item in (item1, item2):
+                self.assertEqual(
+                    [(change['old_price'], change['new_price'], change['ts'])
+                     for change in changes[item.id]],
+                    [(75.0 + (item is item1), 75.0, now + datetime.timedelta(days=3)),
+                     (70.0 + (item is item1), 70.0, now + datetime.timedelta(days=2))]
+                )
+            self.assertEqual(changes[item3.id], [])
+            self.assertEqual(list(changes[item1.id][0]),
+                             ['item_id', 'ts', 'old_price', 'new_price', 'stage', 'reason'])
+
+
 class TestTasksUtilCase(TestCase):
     """
         Test utility functions in tasks.
@@ -719,3 +1447,1250 @@ class TestTasksUtilCase(TestCase):
             tasks.get_smart_price_number(9.99, 3.59, 0.3),
             6.99
         )
+
+
+class TestReplicaRouterCase(TestCase):
+    """
+        Test routing the reads of the views to the read replica
+    """
+
+    def test_read_alias_for(self) -> None:
+        """
+            Test which database the reads of a request go to
+        :return: None
+        """
+        request = RequestFactory().get('/')
+        request.session = {}
+        with mock.patch.object(routers, 'get_replica_alias', return_value=None):
+            self.assertEqual(routers.read_alias_for(request), 'default')
+        with mock.patch.object(routers, 'get_replica_alias', return_value='replica'):
+            self.assertEqual(routers.read_alias_for(request), 'replica')
+            with override_settings(REPLICA_MAX_LAG=10):
+                with mock.patch.object(routers, 'replica_lag', return_value=3):
+                    self.assertEqual(routers.read_alias_for(request), 'replica')
+                with mock.patch.object(routers, 'replica_lag', return_value=30):
+                    self.assertEqual(routers.read_alias_for(request), 'default')
+                with mock.patch.object(routers, 'replica_lag', return_value=None):
+                    self.assertEqual(routers.read_alias_for(request), 'default')
+            routers.pin_primary(request)
+            self.assertEqual(routers.read_alias_for(request), 'default')
+            request.session[routers.PIN_SESSION_KEY] = 0
+            self.assertEqual(routers.read_alias_for(request), 'replica')
+
+    def test_router(self) -> None:
+        """
+            Test that only the reads inside a read_from block leave the primary
+        :return: None
+        """
+        self.assertEqual(EbayItem.objects.all().db, 'default')
+        with routers.read_from('replica'):
+            self.assertEqual(EbayItem.objects.all().db, 'replica')
+            self.assertEqual(EbayItem.objects.all().update(item_status=BWStageEnum.BW_BLOCKED.value), 0)
+            self.assertEqual(routers.ReplicaRouter().db_for_write(EbayItem), 'default')
+            self.assertIsNone(routers.ReplicaRouter().db_for_read(User))
+        self.assertEqual(EbayItem.objects.all().db, 'default')
+
+    def test_views(self) -> None:
+        """
+            Test that the list reads from the replica and a write pins the client
+        :return: None
+        """
+        item = create_ebayitem(item_no=1)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.de', 'pw'))
+        with mock.patch.object(routers, 'read_alias_for', return_value='default') as read_alias:
+            response = self.client.get(reverse('ebayItems:items-list'))
+            self.assertEqual(response.status_code, 200)
+            read_alias.assert_called_once()
+        response = self.client.put(
+            reverse('ebayItems:items-partial-update', args=[item.id]),
+            data='{"item_status": "BW_BLOCKED"}', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.client.session[routers.PIN_SESSION_KEY], time.time())
+
+
+class TestItemSearchCase(TestCase):
+    """
+        Test the search over item description and SKU
+    """
+
+    def setUp(self) -> None:
+        """
+            Create items to search in
+        :return: None
+        """
+        create_ebayitem(item_no=1, sku='10030001;0',
+                        item_description='Klarstein Einkochtopf 27 Liter')
+        create_ebayitem(item_no=2, sku='10030002;0', item_ranking_today=5,
+                        item_description='Klarstein Kühlschrank Einkochautomat')
+        create_ebayitem(item_no=3, sku='20040003;0',
+                        item_description='oneConcept Einkochtopf 100%')
+
+    def search(self, data) -> list:
+        """
+            Item numbers matched by the filter
+        :param data: filter input
+        :return: sorted list of item numbers
+        """
+        return sorted(EbayItemsFilter(data, queryset=EbayItem.objects.all()).qs
+                      .values_list('item_no', flat=True))
+
+    def test_search(self) -> None:
+        """
+            Test all words of the description or the SKU prefix match
+        :return: None
+        """
+        self.assertEqual(self.search({'search': 'klarstein einkochtopf'}), [1])
+        self.assertEqual(self.search({'search': 'Einkoch'}), [1, 2, 3])
+        self.assertEqual(self.search({'search': '+Einkochtopf -Klarstein'}), [1])
+        self.assertEqual(self.search({'search': '100%'}), [3])
+        self.assertEqual(self.search({'search': '1003'}), [1, 2])
+        self.assertEqual(self.search({'search': '10030001;'}), [1])
+        self.assertEqual(self.search({'search': '  '}), [1, 2, 3])
+        self.assertEqual(self.search({'search': 'Einkoch', 'rank': '10', 'rank_lookup': 'lt'}), [2])
+        # word prefixes like MATCH AGAINST, not substrings
+        self.assertEqual(self.search({'search': 'kochtopf'}), [])
+        self.assertEqual(self.search({'search': 'lit einko'}), [1])
+        self.assertEqual(self.search({'search': 'kühl'}), [2])
+
+    def test_search_mysql(self) -> None:
+        """
+            Test the search lookup compiles to MATCH AGAINST on MySQL
+        :return: None
+        """
+        items = EbayItem.objects.filter(item_description__search='Klarstein Einkoch+')
+        compiler = items.query.get_compiler(connection=connection)
+        lookup = items.query.where.children[0]
+        sql, params = lookup.as_mysql(compiler, connection)
+        self.assertIn('MATCH (', sql)
+        self.assertIn('AGAINST (%s IN BOOLEAN MODE)', sql)
+        self.assertEqual(params, ['+Klarstein* +Einkoch*'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestTableCacheCase(TestCase):
+    """
+        Test caching the rendered item table
+    """
+
+    def setUp(self) -> None:
+        """
+            Log in with an empty cache
+        :return: None
+        """
+        cache.clear()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@test.de', 'pw'))
+
+    def test_catalog_version(self) -> None:
+        """
+            Test that writes to EbayItem bump the catalog version
+        :return: None
+        """
+        version = catalog.get_catalog_version()
+        item = create_ebayitem(item_no=1)
+        self.assertGreater(catalog.get_catalog_version(), version)
+        version = catalog.get_catalog_version()
+        EbayItem.objects.filter(id=item.id).update(stock=1)
+        self.assertGreater(catalog.get_catalog_version(), version)
+        version = catalog.get_catalog_version()
+        EbayItem.objects.bulk_update([item], ['stock'])
+        self.assertGreater(catalog.get_catalog_version(), version)
+        version = catalog.get_catalog_version()
+        item.delete()
+        self.assertGreater(catalog.get_catalog_version(), version)
+        # the version is kept in the database, not in the cache of a node
+        version = catalog.get_catalog_version()
+        cache.clear()
+        self.assertEqual(catalog.get_catalog_version(), version)
+        self.assertEqual(CatalogVersion.objects.get().version, version)
+        self.assertEqual(catalog.cache_key('table', {'b': '2', 'a': '1', 'page': ''}),
+                         catalog.cache_key('table', {'a': '1', 'b': '2'}))
+
+    def test_catalog_version_read_only(self) -> None:
+        """
+            Test that reading the catalog version without its counter row does
+            not write, the next write creates the row above the read version
+        :return: None
+        """
+        CatalogVersion.objects.all().delete()
+        with self.assertNumQueries(1):
+            version = catalog.get_catalog_version()
+        self.assertFalse(CatalogVersion.objects.exists())
+        create_ebayitem(item_no=1)
+        self.assertGreater(catalog.get_catalog_version(), version)
+
+    def test_table_cache(self) -> None:
+        """
+            Test that a warm page load does not query the items
+        :return: None
+        """
+        item = create_ebayitem(item_no=1, stock=184)
+        url = reverse('ebayItems:ebay_index') + '?country=DE&sort=stock'
+        response = self.client.get(url)
+        self.assertContains(response, '>184<')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, '>184<')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'ebayItems_ebayitem' in query['sql']])
+        EbayItem.objects.filter(id=item.id).update(stock=185)
+        self.assertContains(self.client.get(url), '>185<')
+        response = self.client.get(url + '&_export=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_column_preset(self) -> None:
+        """
+            Test that a column preset limits the rendered, loaded and exported columns
+        :return: None
+        """
+        create_ebayitem(item_no=1, stock=184)
+        create_ebayitem(item_no=2, stock=183)
+        url = reverse('ebayItems:ebay_index')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + '?preset=overview&sort=stock')
+        self.assertContains(response, '>184<')
+        self.assertNotContains(response, 'Kühl- &amp; Gefrierkombination')
+        item_queries = [query['sql'] for query in queries.captured_queries
+                        if 'FROM "ebayItems_ebayitem"' in query['sql']]
+        self.assertTrue(item_queries)
+        self.assertFalse([sql for sql in item_queries if 'ItemDescription' in sql])
+        self.assertLess(response.content.index(b'>183<'), response.content.index(b'>184<'))
+        # the preset is kept in the session, sorting by a hidden column is ignored
+        response = self.client.get(url + '?sort=dio1')
+        self.assertNotContains(response, 'Kühl- &amp; Gefrierkombination')
+        export = self.client.get(url + '?_export=csv').content.decode('utf-8')
+        self.assertEqual(export.splitlines()[0].split(','), [
+            'ItemNo', 'SKU', 'Country', 'Status', 'Stock', 'Rank', 'CPrice', 'SalesL7'
+        ])
+        response = self.client.get(url + '?preset=all')
+        self.assertContains(response, 'Kühl- &amp; Gefrierkombination')
+        # the bookkeeping of the pipeline is neither shown nor exported
+        self.assertNotContains(response, 'CatalogVersion')
+        self.assertNotContains(response, 'MissingCycles')
+        header = self.client.get(url + '?_export=csv').content.decode('utf-8').splitlines()[0]
+        self.assertIn('Description', header)
+        self.assertNotIn('CatalogVersion', header)
+        self.assertNotIn('MissingCycles', header)
+
+
+class TestEbayItemAdminCase(TestCase):
+    """
+        Test the EbayItem admin and the shared badewanne transitions
+    """
+
+    def setUp(self) -> None:
+        """
+            Log in as admin
+        :return: None
+        """
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.de', 'pw'))
+
+    def test_changelist(self) -> None:
+        """
+            Test the changelist with filter, search and pagination by key
+        :return: None
+        """
+        for item_no in range(1, 6):
+            create_ebayitem(item_no=item_no, sku='{};0'.format(item_no),
+                            country='DE' if item_no % 2 else 'FR')
+        url = reverse('admin:ebayItems_ebayitem_changelist')
+        response = self.client.get(url, {'country': 'DE'})
+        self.assertEqual([item.item_no for item in response.context['cl'].result_list], [5, 3, 1])
+        response = self.client.get(url, {'q': '3;'})
+        self.assertEqual([item.item_no for item in response.context['cl'].result_list], [3])
+        with mock.patch.object(EbayItemAdmin, 'list_per_page', 2):
+            response = self.client.get(url, {'p': 1})
+        self.assertEqual([item.item_no for item in response.context['cl'].result_list], [3, 2])
+
+    def test_actions(self) -> None:
+        """
+            Test the badewanne actions on all items of the changelist in a
+            constant number of queries
+        :return: None
+        """
+        for item_no in range(1, 121):
+            create_ebayitem(item_no=item_no, item_status=BWStageEnum.BW_READY.value
+                            if item_no % 4 else BWStageEnum.NORMAL.value)
+        url = reverse('admin:ebayItems_ebayitem_changelist')
+        select_all = {'select_across': 1, 'index': 0,
+                      '_selected_action': [EbayItem.objects.first().id]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, dict(select_all, action='start_badewanne'))
+        action_queries = len(queries)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(EbayItem.objects.filter(item_status=BWStageEnum.BW_STAGE0.value).count(),
+                         90)
+        task = Task.objects.get(task_name='ebayItems.tasks.badewanne_process_tracking')
+        self.assertEqual(len(json.loads(task.task_params)[0][0]), 90)
+        self.client.post(url, dict(select_all, action='stop_badewanne'))
+        self.assertEqual(
+            EbayItem.objects.filter(item_status=BWStageEnum.BW_TOBLOCK.value).count(), 90
+        )
+        for item_no in range(121, 1121):
+            create_ebayitem(item_no=item_no, item_status=BWStageEnum.BW_READY.value)
+        with self.assertNumQueries(action_queries):
+            self.client.post(url, dict(select_all, action='start_badewanne'))
+        self.assertEqual(EbayItem.objects.filter(item_status=BWStageEnum.BW_STAGE0.value).count(),
+                         1000)
+
+    def test_item_badewanne_view(self) -> None:
+        """
+            Test that the table view schedules the tracking of the moved items
+        :return: None
+        """
+        items = [create_ebayitem(item_no=item_no, item_status=BWStageEnum.BW_READY.value)
+                 for item_no in range(1, 4)]
+        self.client.post(reverse('ebayItems:badewanne'), {
+            'start-badewanne': 1, 'selection': [items[0].id, items[1].id]
+        }, HTTP_REFERER='/')
+        task = Task.objects.get(task_name='ebayItems.tasks.badewanne_process_tracking')
+        self.assertEqual(json.loads(task.task_params)[0][0], [items[0].id, items[1].id])
+        self.client.post(reverse('ebayItems:badewanne'), {
+            'stop-badewanne': 1, 'selection': [items[2].id]
+        }, HTTP_REFERER='/')
+        self.assertEqual(Task.objects.count(), 1)
+
+
+class TestMemoryProfileCase(TestCase):
+    """
+        Test the opt-in memory profiling of the pipeline runs
+    """
+
+    def test_profiled_run(self) -> None:
+        """
+            Test retained and peak memory and allocation sites per phase
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PIPELINE_MEMORY_PROFILE_DIR=directory):
+            with memprofile.profiled_run('run'):
+                self.assertTrue(tracemalloc.is_tracing())
+                with memprofile.phase('retain'):
+                    retained = [str(number) for number in range(50000)]
+                with memprofile.phase('release'):
+                    released = bytearray(10 * 1024 * 1024)
+                    del released
+            self.assertFalse(tracemalloc.is_tracing())
+            reports = os.listdir(directory)
+            self.assertEqual(len(reports), 1)
+            with open(os.path.join(directory, reports[0])) as report:
+                report = json.load(report)
+        phases = {phase['phase']: phase for phase in report['phases']}
+        self.assertEqual(list(phases), ['run', 'run/retain', 'run/release'])
+        self.assertGreater(phases['run/retain']['retained_bytes'], 50000 * 50)
+        self.assertIn(os.path.basename(__file__), phases['run/retain']['top_sites'][0]['site'])
+        release = phases['run/release']
+        self.assertLess(release['retained_bytes'], 1024 * 1024)
+        self.assertGreater(release['peak_bytes'] - release['start_bytes'], 10 * 1024 * 1024)
+        self.assertGreaterEqual(phases['run']['peak_bytes'], release['peak_bytes'])
+        self.assertEqual(len(retained), 50000)
+
+    def test_chunk_phases(self) -> None:
+        """
+            Test that only the top-level phases take snapshots and repeated chunks
+            are reported once
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PIPELINE_MEMORY_PROFILE_DIR=directory), \
+                mock.patch.object(tracemalloc, 'take_snapshot',
+                                  wraps=tracemalloc.take_snapshot) as take_snapshot:
+            with memprofile.profiled_run('run'):
+                with memprofile.phase('sync'):
+                    chunks = []
+                    for _ in range(3):
+                        with memprofile.phase('chunk'):
+                            chunks.append(bytearray(1024 * 1024))
+            with open(os.path.join(directory, os.listdir(directory)[0])) as report:
+                report = json.load(report)
+        self.assertEqual(take_snapshot.call_count, 4)
+        phases = {phase['phase']: phase for phase in report['phases']}
+        self.assertEqual(list(phases), ['run', 'run/sync', 'run/sync/chunk'])
+        chunk = phases['run/sync/chunk']
+        self.assertEqual(chunk['calls'], 3)
+        self.assertNotIn('top_sites', chunk)
+        self.assertGreaterEqual(chunk['retained_bytes'], 3 * 1024 * 1024)
+        self.assertIn('top_sites', phases['run/sync'])
+        self.assertEqual(len(chunks), 3)
+
+    def test_profiling_off(self) -> None:
+        """
+            Test that nothing is traced without a report directory
+        :return: None
+        """
+        with override_settings(PIPELINE_MEMORY_PROFILE_DIR=None):
+            with memprofile.profiled_run('run'):
+                self.assertFalse(tracemalloc.is_tracing())
+                self.assertIs(memprofile.phase('phase'), memprofile.phase('other'))
+
+    def test_badewanne_process_tracking(self) -> None:
+        """
+            Test the phases of a profiled badewanne_process_tracking
+        :return: None
+        """
+        create_ebayitem(item_no=1, item_status=BWStageEnum.BW_TOBLOCK.value)
+        response = mock.Mock(json=mock.Mock(return_value={'HasErrors': False}))
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(PIPELINE_MEMORY_PROFILE_DIR=directory), \
+                mock.patch.object(tasks, 'execute_ebay_batch_pricing_api',
+                                  return_value=response):
+            tasks.badewanne_process_tracking.now()
+            with open(os.path.join(directory, os.listdir(directory)[0])) as report:
+                report = json.load(report)
+        self.assertEqual([phase['phase'] for phase in report['phases']], [
+            'badewanne_process_tracking', 'badewanne_process_tracking/candidates',
+            'badewanne_process_tracking/rules', 'badewanne_process_tracking/BW_BLOCKED'
+        ])
+
+
+class TestRequestProfilerCase(TestCase):
+    """
+        Test the request profiler middleware and its staff pages
+    """
+
+    @staticmethod
+    def slow_view(request):
+        """
+            View which queries and sleeps
+        :param request:
+        :return: response
+        """
+        EbayItem.objects.count()
+        time.sleep(0.05)
+        return HttpResponse('ok')
+
+    def test_middleware_not_used(self) -> None:
+        """
+            Test that the middleware removes itself when profiling is off
+        :return: None
+        """
+        with override_settings(REQUEST_PROFILE_SAMPLE_RATE=0, REQUEST_PROFILE_SLOW_MS=None):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.RequestProfilerMiddleware(self.slow_view)
+
+    def test_cprofile(self) -> None:
+        """
+            Test that sampled requests are stored with cProfile stats
+        :return: None
+        """
+        with override_settings(REQUEST_PROFILE_SAMPLE_RATE=1.0, REQUEST_PROFILE_SLOW_MS=None):
+            middleware = profiling.RequestProfilerMiddleware(self.slow_view)
+        middleware(RequestFactory().get('/items/', {'country': 'DE'}))
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.mode, profile.path, profile.query_string, profile.sql_count),
+                         (RequestProfile.MODE_CPROFILE, '/items/', 'country=DE', 1))
+        self.assertGreaterEqual(profile.duration_ms, 50)
+        self.assertIn('slow_view', profile.profile)
+
+    def test_slow_stacks(self) -> None:
+        """
+            Test that only slow requests keep their sampled stacks
+        :return: None
+        """
+        with override_settings(REQUEST_PROFILE_SAMPLE_RATE=0, REQUEST_PROFILE_SLOW_MS=30,
+                               REQUEST_PROFILE_INTERVAL=0.001):
+            middleware = profiling.RequestProfilerMiddleware(self.slow_view)
+        middleware(RequestFactory().get('/'))
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.mode, RequestProfile.MODE_STACKS)
+        stack, count = profile.profile.splitlines()[0].rsplit(' ', 1)
+        self.assertTrue(stack.endswith('tests.py:slow_view'))
+        self.assertGreater(int(count), 5)
+        middleware.get_response = lambda request: HttpResponse('ok')
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_pages(self) -> None:
+        """
+            Test the staff pages of the profiles
+        :return: None
+        """
+        with override_settings(REQUEST_PROFILE_SAMPLE_RATE=1.0):
+            profiling.RequestProfilerMiddleware(self.slow_view)(RequestFactory().get('/slow/'))
+        profile = RequestProfile.objects.get()
+        self.client.force_login(User.objects.create_user('buyer', 'buyer@test.de', 'pw'))
+        self.assertEqual(self.client.get(reverse('ebayItems:request-profiles')).status_code, 302)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.de', 'pw'))
+        self.assertContains(self.client.get(reverse('ebayItems:request-profiles')), '/slow/')
+        response = self.client.get(reverse('ebayItems:request-profile', args=[profile.pk]),
+                                   {'download': 1})
+        self.assertEqual(response.content.decode('utf-8'), profile.profile)
+
+
+class TestSlowQueryCase(TestCase):
+    """
+        Test the slow SQL recorder of requests and tasks
+    """
+
+    def setUp(self) -> None:
+        """
+            Create items of two countries
+        :return: None
+        """
+        for item_no in range(1, 11):
+            create_ebayitem(item_no=item_no, country='DE' if item_no % 2 else 'AT')
+
+    def test_normalize(self) -> None:
+        """
+            Test that executions of a query share their normalized statement
+        :return: None
+        """
+        self.assertEqual(
+            slowsql.normalize("SELECT * FROM t1 WHERE a = 'x''y' AND id IN (%s, %s, %s) LIMIT 21"),
+            "SELECT * FROM t1 WHERE a = ? AND id IN (...) LIMIT ?"
+        )
+        statements = []
+        for size in (2, 3):
+            with CaptureQueriesContext(connection) as queries:
+                EbayItem.objects.bulk_update(list(EbayItem.objects.all()[:size]), ['stock'])
+            statements.append(slowsql.normalize(
+                [query['sql'] for query in queries.captured_queries
+                 if query['sql'].startswith('UPDATE "ebayItems_ebayitem"')][-1]
+            ))
+        self.assertEqual(statements[0], statements[1])
+        self.assertIn('WHEN ... THEN ?', statements[0])
+
+    def test_off(self) -> None:
+        """
+            Test that nothing is recorded without SLOW_SQL_MS
+        :return: None
+        """
+        with override_settings(SLOW_SQL_MS=None):
+            with self.assertRaises(MiddlewareNotUsed):
+                slowsql.SlowQueryMiddleware(lambda request: HttpResponse('ok'))
+            self.assertEqual(slowsql.recorded('task')(EbayItem.objects.count)(), 10)
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_task(self) -> None:
+        """
+            Test that the statements of a task are aggregated with row counts
+        :return: None
+        """
+        def task(country):
+            EbayItem.objects.filter(country=country).update(stock=1)
+
+        with override_settings(SLOW_SQL_MS=0):
+            slowsql.recorded('ebayItems.tasks.test')(task)('DE')
+            slowsql.recorded('ebayItems.tasks.other')(task)('AT')
+        query = SlowQuery.objects.get(statement__startswith='UPDATE "ebayItems_ebayitem"')
+        self.assertEqual((query.calls, query.max_ms_rows), (2, 5))
+        self.assertEqual(query.call_sites.splitlines(),
+                         ['ebayItems.tasks.test', 'ebayItems.tasks.other'])
+        self.assertEqual(query.last_call_site, 'ebayItems.tasks.other')
+        self.assertIn('-- params:', query.example)
+        self.assertTrue(query.explain)
+
+    def test_request(self) -> None:
+        """
+            Test that requests record under their view and staff can browse it
+        :return: None
+        """
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.de', 'pw'))
+        with override_settings(SLOW_SQL_MS=0):
+            self.client.get(reverse('ebayItems:items-list'), {'country': 'DE'})
+        query = SlowQuery.objects.get(statement__startswith='SELECT "ebayItems_ebayitem"."id"')
+        self.assertEqual(query.last_call_site, 'ebayItems.views.EbayItemsListView')
+        self.assertIn('ebayItems_ebayitem', query.explain)
+        self.assertContains(self.client.get(reverse('ebayItems:slow-queries')),
+                            'ebayItems.views.EbayItemsListView')
+        self.assertContains(self.client.get(reverse('ebayItems:slow-query', args=[query.pk])),
+                            'EXPLAIN')
+
+
+class TestWorkerSplitCase(TestCase):
+    """
+        Test that the web side enqueues tasks without importing them
+    """
+
+    def test_web_startup(self) -> None:
+        """
+            Test that the web application loads none of the pipeline libraries
+        :return: None
+        """
+        output = subprocess.run([sys.executable, '-c', (
+            'import sys; from Backend.wsgi import application; '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            'print(sorted(name for name in ["ebayItems.tasks", "pandas", "numpy", "pymssql"] '
+            'if name in sys.modules))'
+        )], check=True, stdout=subprocess.PIPE, env=dict(os.environ)).stdout
+        self.assertEqual(output.decode('utf-8').strip().splitlines()[-1], '[]')
+
+    def test_schedule_pipeline(self) -> None:
+        """
+            Test that the pipeline is scheduled once per queue
+        :return: None
+        """
+        with override_settings(PIPELINE_LEASES=True, PIPELINE_NODE_NAME='node-a'):
+            self.assertTrue(enqueue.schedule_pipeline())
+            self.assertFalse(enqueue.schedule_pipeline())
+        self.assertTrue(enqueue.schedule_pipeline())
+        self.assertEqual(list(Task.objects.filter(task_name=enqueue.PIPELINE_TASK)
+                              .order_by('id').values_list('queue', 'repeat')),
+                         [('node-a', 900), ('background', 900)])
+
+    def test_pipeline_queue_without_node_name(self) -> None:
+        """
+            Test that leases without a node name stop the worker instead of
+            processing every queue
+        :return: None
+        """
+        with override_settings(PIPELINE_LEASES=True, PIPELINE_NODE_NAME=None):
+            with self.assertRaises(ImproperlyConfigured):
+                enqueue.get_pipeline_queue()
+            with self.assertRaises(ImproperlyConfigured):
+                call_command('run_worker', lane=enqueue.LANE_BACKGROUND, duration=1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_run_worker(self) -> None:
+        """
+            Test that the worker schedules the pipeline and processes the queue
+        :return: None
+        """
+        # enqueued before the lanes had named queues
+        unqueued = enqueue.schedule(enqueue.TRACKING_TASK, [[1]])
+        with mock.patch('ebayItems.management.commands.run_worker.call_command') as process:
+            call_command('run_worker', duration=1, stdout=mock.MagicMock())
+        process.assert_called_once_with('process_tasks', duration=1, sleep=5.0,
+                                        queue='background', log_std=False)
+        task = Task.objects.get(task_name=enqueue.PIPELINE_TASK)
+        self.assertEqual(task.task_name, tasks.ebay_badewanne_update.name)
+        unqueued.refresh_from_db()
+        self.assertEqual(unqueued.queue, 'background')
+
+
+class TestSparseFieldsetCase(TestCase):
+    """
+        Test the fields and exclude parameters of the item API
+    """
+
+    def setUp(self) -> None:
+        """
+            Create an item
+        :return: None
+        """
+        self.item = create_ebayitem(item_no=1)
+        self.url = reverse('ebayItems:items-list')
+
+    def test_default_fields(self) -> None:
+        """
+            Test that the item API keeps its fields without parameters
+        :return: None
+        """
+        result = self.client.get(self.url).json()['results'][0]
+        self.assertEqual(list(result), ['id', 'item_no', 'auction_id', 'sales_l14', 'sales_l7',
+                                        'fc', 'item_status'])
+
+    def test_fields(self) -> None:
+        """
+            Test that only the chosen columns are selected and serialized
+        :return: None
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'id,item_status'})
+        select = queries.captured_queries[-1]['sql']
+        self.assertEqual(response.json()['results'], [
+            {'id': self.item.id, 'item_status': self.item.item_status}
+        ])
+        self.assertIn('"ItemStatus"', select)
+        self.assertNotIn('"ItemNo"', select)
+        result = self.client.get(
+            self.url, {'fields': 'current_sale_price,new_price,stock,sales_l14'}
+        ).json()['results'][0]
+        self.assertEqual(result, {
+            'current_sale_price': self.item.current_sale_price, 'new_price': self.item.new_price,
+            'stock': self.item.stock, 'sales_l14': self.item.sales_goal_reached_in_last14days
+        })
+
+    def test_exclude(self) -> None:
+        """
+            Test that excluded fields are left out of the default and chosen ones
+        :return: None
+        """
+        result = self.client.get(self.url, {'exclude': 'sales_l14,sales_l7'}).json()['results'][0]
+        self.assertEqual(list(result), ['id', 'item_no', 'auction_id', 'fc', 'item_status'])
+        result = self.client.get(self.url, {'fields': 'id,sku', 'exclude': 'id'}).json()
+        self.assertEqual(list(result['results'][0]), ['sku'])
+
+    def test_invalid(self) -> None:
+        """
+            Test that unknown fields and empty projections are rejected
+        :return: None
+        """
+        response = self.client.get(self.url, {'fields': 'id,catalog_version'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: password', response.json()['fields'][0])
+        response = self.client.get(self.url, {'fields': 'id', 'exclude': 'id'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exclude', response.json())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestItemFeedCase(TestCase):
+    """
+        Test the NDJSON item feed
+    """
+
+    def setUp(self) -> None:
+        """
+            Create items of two countries
+        :return: None
+        """
+        cache.clear()
+        self.items = [create_ebayitem(item_no=item_no, country='DE' if item_no % 2 else 'FR')
+                      for item_no in range(1, 6)]
+        self.url = reverse('ebayItems:items-feed')
+
+    def feed(self, params: dict = None, **extra) -> tuple:
+        """
+            Read the feed
+        :param params: query parameters
+        :param extra: request headers
+        :return: response and the decoded objects
+        """
+        response = self.client.get(self.url, params or {}, **extra)
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return response, [json.loads(line) for line in content.decode('utf-8').splitlines()]
+
+    def test_feed(self) -> None:
+        """
+            Test that the filtered items are streamed with the chosen fields
+        :return: None
+        """
+        response, objects = self.feed()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([obj['item_no'] for obj in objects], [1, 2, 3, 4, 5])
+        self.assertEqual(list(objects[0]), ['id', 'item_no', 'auction_id', 'sales_l14', 'sales_l7',
+                                            'fc', 'item_status'])
+        _, objects = self.feed({'country': 'DE', 'fields': 'item_no,current_sale_price'})
+        self.assertEqual(objects, [{'item_no': item.item_no,
+                                    'current_sale_price': item.current_sale_price}
+                                   for item in self.items[::2]])
+
+    def test_since(self) -> None:
+        """
+            Test that only items written after the catalog version are streamed
+        :return: None
+        """
+        response, _ = self.feed()
+        version = int(response['X-Catalog-Version'])
+        self.items[1].stock = 7
+        self.items[1].save(update_fields=['stock'])
+        EbayItem.objects.filter(id=self.items[3].id).update(stock=3)
+        _, objects = self.feed({'since': version, 'fields': 'item_no,stock'})
+        self.assertEqual(objects, [{'item_no': 2, 'stock': 7}, {'item_no': 4, 'stock': 3}])
+        response, _ = self.feed()
+        EbayItem.objects.bulk_update([self.items[4]], ['stock'])
+        _, objects = self.feed({'since': response['X-Catalog-Version'], 'fields': 'item_no'})
+        self.assertEqual(objects, [{'item_no': 5}])
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_since_tombstones(self) -> None:
+        """
+            Test that items archived after the catalog version are reported
+            as deleted, whatever the filters
+        :return: None
+        """
+        response, _ = self.feed()
+        version = int(response['X-Catalog-Version'])
+        EbayItem.objects.filter(id=self.items[2].id).update(missing_cycles=3)
+        self.assertEqual(archive.archive_items(np.array([self.items[2].id])), 1)
+        EbayItem.objects.filter(id__in=[self.items[0].id, self.items[1].id]).update(stock=4)
+        _, objects = self.feed({'since': version, 'country': 'FR', 'fields': 'item_no'})
+        self.assertEqual(objects, [{'item_no': 2}, {'id': self.items[2].id, 'deleted': True}])
+        _, objects = self.feed({'fields': 'item_no'})
+        self.assertEqual(objects, [{'item_no': 1}, {'item_no': 2}, {'item_no': 4},
+                                   {'item_no': 5}])
+        response, _ = self.feed()
+        _, objects = self.feed({'since': response['X-Catalog-Version']})
+        self.assertEqual(objects, [])
+
+    def test_two_writers(self) -> None:
+        """
+            Test that writers of nodes with their own caches stamp increasing
+            versions and a pull misses none of their rows
+        :return: None
+        """
+        response, _ = self.feed()
+        since = response['X-Catalog-Version']
+        stamps = []
+        for node, item in [('node-a', self.items[0]), ('node-b', self.items[1]),
+                           ('node-a', self.items[2])]:
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': node
+            }}):
+                EbayItem.objects.filter(id=item.id).update(stock=item.item_no)
+            stamps.append(EbayItem.objects.get(id=item.id).catalog_version)
+        self.assertEqual(stamps, sorted(set(stamps)))
+        self.assertEqual(catalog.get_catalog_version(), stamps[-1])
+        response, objects = self.feed({'since': since, 'fields': 'item_no'})
+        self.assertEqual(objects, [{'item_no': 1}, {'item_no': 2}, {'item_no': 3}])
+        _, objects = self.feed({'since': response['X-Catalog-Version']})
+        self.assertEqual(objects, [])
+
+    def test_gzip(self) -> None:
+        """
+            Test that the feed is compressed for clients accepting gzip
+        :return: None
+        """
+        response, objects = self.feed(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(objects), 5)
+
+
+class TestItemPartitioningCase(TestCase):
+    """
+        Test the country partitioning of the item table
+    """
+
+    def setUp(self) -> None:
+        """
+            Create items of two countries
+        :return: None
+        """
+        create_ebayitem(item_no=1, country='DE', lrw=10)
+        create_ebayitem(item_no=2, country='FR', lrw=10)
+        create_ebayitem(item_no=3, country='DE', lrw=60)
+
+    @override_settings(ITEM_PARTITIONING='list', ITEM_PARTITION_COUNTRIES={
+        'p_dach': ['DE', 'AT'], 'p_fr': ['FR']
+    })
+    def test_partition_table(self) -> None:
+        """
+            Test the statements partitioning the table and merging it again
+        :return: None
+        """
+        schema_editor = mock.Mock(quote_name=connection.ops.quote_name, connection=connection)
+        partitioning.partition_table(schema_editor, EbayItem)
+        statements = [call[0][0] for call in schema_editor.execute.call_args_list]
+        self.assertEqual(statements, [
+            'DROP INDEX ebayitem_description_ft ON "ebayItems_ebayitem"',
+            'ALTER TABLE "ebayItems_ebayitem" DROP PRIMARY KEY, ADD PRIMARY KEY ("id", "Country")',
+            'ALTER TABLE "ebayItems_ebayitem" PARTITION BY LIST COLUMNS ("Country") '
+            "(PARTITION p_dach VALUES IN ('DE', 'AT'), PARTITION p_fr VALUES IN ('FR'))",
+        ])
+        schema_editor.reset_mock()
+        partitioning.unpartition_table(schema_editor, EbayItem)
+        statements = [call[0][0] for call in schema_editor.execute.call_args_list]
+        self.assertEqual(statements[0], 'ALTER TABLE "ebayItems_ebayitem" REMOVE PARTITIONING')
+        self.assertEqual(statements[-1], 'CREATE FULLTEXT INDEX ebayitem_description_ft '
+                                         'ON "ebayItems_ebayitem" ("ItemDescription")')
+        with override_settings(ITEM_PARTITIONING='key', ITEM_PARTITION_COUNT=4):
+            self.assertEqual(partitioning.partition_clause('`Country`'),
+                             'PARTITION BY KEY (`Country`) PARTITIONS 4')
+        with override_settings(ITEM_PARTITION_COUNTRIES={}), self.assertRaises(ValueError):
+            partitioning.partition_clause('`Country`')
+
+    def test_unpartitioned(self) -> None:
+        """
+            Test that selectors and the search work unchanged without partitions
+        :return: None
+        """
+        self.assertFalse(partitioning.is_partitioned(connection.alias, 'ebayItems_ebayitem'))
+        self.assertIsNone(partitioning.explain_partitions(EbayItem.objects.filter(country='DE')))
+        self.assertEqual(list(tasks.rule_items(rules.LRW_LIST_RULE, countries=['DE'])
+                              .values_list('item_no', flat=True)), [1])
+        tasks.maintain_lrw_list(countries=['FR'])
+        self.assertEqual(list(EbayItem.objects.filter(item_status=BWStageEnum.LRW_LIST.value)
+                              .values_list('item_no', flat=True)), [2])
+
+    def test_pipeline_countries(self) -> None:
+        """
+            Test that the pipeline of one market filters every item query on its country,
+            which MySQL prunes the partitions by
+        :return: None
+        """
+        with mock.patch.object(tasks, 'sync_eaby_item') as sync, \
+                CaptureQueriesContext(connection) as queries:
+            tasks.ebay_badewanne_update.now(countries=['DE'])
+        sync.assert_called_once_with()
+        selects = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and '"ebayItems_ebayitem"' in query['sql']]
+        self.assertEqual(len(selects), 2)
+        for sql in selects:
+            self.assertIn('"ebayItems_ebayitem"."Country" IN (\'DE\')', sql)
+        self.assertEqual(list(EbayItem.objects.order_by('item_no').values_list('item_status',
+                                                                               flat=True)),
+                         ['LRW_LIST', 'NORMAL', 'BW_READY'])
+
+    def test_partition_command(self) -> None:
+        """
+            Test the partition_item_table command
+        :return: None
+        """
+        with self.assertRaisesRegex(CommandError, 'needs MySQL'):
+            call_command('partition_item_table', '--by', 'key')
+        schema_editor = mock.MagicMock()
+        with mock.patch.object(connection, 'vendor', 'mysql'), \
+                mock.patch.object(connection, 'schema_editor', return_value=schema_editor), \
+                mock.patch.object(partitioning, 'is_partitioned', return_value=False), \
+                mock.patch.object(partitioning, 'partition_table') as partition_table:
+            with self.assertRaisesRegex(CommandError, 'ITEM_PARTITIONING'):
+                call_command('partition_item_table', stdout=io.StringIO())
+            call_command('partition_item_table', '--by', 'key', '--count', '4',
+                         stdout=io.StringIO())
+        partition_table.assert_called_once_with(schema_editor.__enter__.return_value, EbayItem,
+                                                'key', 4)
+
+
+@skipUnless(connection.vendor == 'mysql', 'partitions need MySQL')
+class TestItemPartitionPruningCase(TransactionTestCase):
+    """
+        Test the partition pruning on a partitioned MySQL item table, the DDL
+        commits, so the test does not run in a transaction
+    """
+
+    def test_partition_pruning(self) -> None:
+        """
+            Test that the queries of one country read only its partition
+        :return: None
+        """
+        call_command('partition_item_table', '--by', 'key', '--count', '4',
+                     stdout=io.StringIO())
+        try:
+            for item_no, country in enumerate(['DE', 'FR', 'AT', 'IT']):
+                create_ebayitem(item_no=item_no, country=country, lrw=10)
+            selections = [
+                EbayItemsFilter({'country': 'DE'}, queryset=EbayItem.objects.all()).qs,
+                tasks.rule_items(rules.LRW_LIST_RULE, countries=['DE']),
+                tasks.rule_items(rules.BLOCK_RULE, ids=[1, 2, 3], countries=['DE']),
+                EbayItem.objects.filter(country__in=['DE']).values_list(*tasks.STATUS_COLUMNS),
+            ]
+            for items in selections:
+                self.assertEqual(len(partitioning.explain_partitions(items)), 1,
+                                 str(items.query))
+            self.assertGreater(len(partitioning.explain_partitions(EbayItem.objects.all())), 1)
+        finally:
+            call_command('partition_item_table', '--merge', stdout=io.StringIO())
+
+
+class TestSyncCommandCase(TestCase):
+    """
+        Test the sync_ebay_items management command
+    """
+
+    def setUp(self) -> None:
+        """
+            Create an item and a source file with it and two new rows
+        :return: None
+        """
+        create_ebayitem(item_no=1, auction_id='100001', item_status=BWStageEnum.BW_TOBLOCK.value)
+        rows = 3
+        self.frame = pd.DataFrame({
+            'ItemNo': [1, 2, 3],
+            'eBayItemID': ['31', '32', '33'],
+            'AuctionID': ['100001', '100002', '100003'],
+            'SKU': ['1;0', '2;0', '3;0'],
+            'ItemDescription': ['Klarstein Einkochtopf'] * rows,
+            'SalesGoalReachedInLast14Days': [80.5] * rows,
+            'SalesGoalReachedInLast7Days': [90.5] * rows,
+            'FC_Erf_MTD': [70.5] * rows,
+            'COGS24HVS7D': [20.0] * rows,
+            'Channel': ['ebay'] * rows,
+            'Country': ['DE'] * rows,
+            'OurPurchasePrice': [40.0] * rows,
+            'CurrentSalePrice': [99.99] * rows,
+            'SuggestedSalePrice': [69.99] * rows,
+            'DIO1': [24] * rows,
+            'DIO2': [67] * rows,
+            'Bestand_Gesamt': [113] * rows,
+            'LRW': [195] * rows,
+            'FC': [115] * rows,
+            'PositionCurrentDay': [300] * rows,
+        })
+
+    def sync(self, *args) -> str:
+        """
+            Run the command on the source file
+        :param args: command options
+        :return: output
+        """
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'biserver.csv')
+            self.frame.to_csv(path, index=False)
+            call_command('sync_ebay_items', '--source', path, *args, stdout=output)
+        return output.getvalue()
+
+    @staticmethod
+    def throughput(output: str) -> dict:
+        """
+            Rows of the throughput table by phase
+        :param output: command output
+        :return: dict of phase to rows, queries and api calls
+        """
+        lines = output.splitlines()
+        start = lines.index(next(line for line in lines if line.startswith('phase ')))
+        return {cells[0]: (int(cells[1]), int(cells[4]), int(cells[5]))
+                for cells in (line.split() for line in lines[start + 2:])}
+
+    def test_dry_run(self) -> None:
+        """
+            Test that a dry run reports the changes without writing them
+        :return: None
+        """
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api') as api:
+            output = self.sync('--dry-run')
+        api.assert_not_called()
+        self.assertIn('Dry run: 2 rows to insert, 1 rows to update', output)
+        self.assertIn('Dry run: 1 items to BW_BLOCKED', output)
+        self.assertEqual(EbayItem.objects.count(), 1)
+        table = self.throughput(output)
+        self.assertEqual(list(table), ['fetch', 'sync', 'status', 'badewanne'])
+        self.assertEqual(table['sync'][0], 3)
+        self.assertEqual(table['badewanne'][0], 1)
+
+    def test_phases(self) -> None:
+        """
+            Test the chosen phases with their rows, queries and api calls
+        :return: None
+        """
+        output = self.sync('--fetch', '--chunk-size', '1')
+        self.assertEqual(EbayItem.objects.count(), 3)
+        self.assertIn('sync: 3/3 rows', output)
+        table = self.throughput(output)
+        self.assertEqual(list(table), ['fetch', 'sync'])
+        self.assertEqual(table['fetch'], (3, 0, 0))
+        self.assertEqual(table['sync'][0], 3)
+        # one insert per new row and one update of the existing one
+        self.assertGreaterEqual(table['sync'][1], 3)
+        response = mock.Mock(json=mock.Mock(return_value={'HasErrors': False}))
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api', return_value=response):
+            table = self.throughput(self.sync('--badewanne'))
+        self.assertEqual(list(table), ['badewanne'])
+        self.assertEqual(table['badewanne'][2], 1)
+        self.assertEqual(EbayItem.objects.get(item_no=1).item_status,
+                         BWStageEnum.BW_BLOCKED.value)
+        with self.assertRaises(CommandError):
+            self.sync('--chunk-size', '0')
+
+    @override_settings(PIPELINE_LEASES=True, PIPELINE_HASH_PARTITIONS=4)
+    def test_leases(self) -> None:
+        """
+            Test that the command refuses to run while a node holds a partition and
+            holds all partitions while it runs
+        :return: None
+        """
+        leases.claim_partitions('node-a')
+        with self.assertRaisesRegex(CommandError, r'Partitions \[0, 1, 2, 3\] are leased'):
+            self.sync('--status')
+        self.assertEqual(set(PartitionLease.objects.values_list('owner', flat=True)),
+                         {'node-a'})
+        leases.release_partitions('node-a', [0, 1, 2, 3])
+
+        def status(workers, countries):
+            self.assertEqual((workers, countries), (2, None))
+            self.assertEqual(leases.claim_partitions('node-a'), [])
+            self.assertEqual(
+                len(set(PartitionLease.objects.values_list('owner', flat=True))), 1
+            )
+
+        with mock.patch.object(tasks, 'sync_items_status', side_effect=status) as sync:
+            self.sync('--status', '--workers', '2')
+        sync.assert_called_once()
+        self.assertEqual(set(PartitionLease.objects.values_list('owner', flat=True)), {''})
+
+
+class TestTaskLanesCase(TestCase):
+    """
+        Test the interactive and the background task lane
+    """
+
+    def test_tracking_lane(self) -> None:
+        """
+            Test that the tracking of moved items goes to the interactive lane
+        :return: None
+        """
+        create_ebayitem(item_no=1, item_status=BWStageEnum.BW_READY.value)
+        ids = transitions.start_badewanne(EbayItem.objects.all())
+        task = Task.objects.get(task_name=enqueue.TRACKING_TASK)
+        self.assertEqual(task.queue, 'interactive')
+        self.assertEqual(task.params(), ([ids], {}))
+        enqueue.schedule_pipeline()
+        for lane, task_name in [(enqueue.LANE_INTERACTIVE, enqueue.TRACKING_TASK),
+                                (enqueue.LANE_BACKGROUND, enqueue.PIPELINE_TASK)]:
+            self.assertEqual(list(enqueue.lane_tasks(Task.objects, lane)
+                                  .values_list('task_name', flat=True)), [task_name])
+        with override_settings(PIPELINE_LEASES=True, PIPELINE_NODE_NAME='node-a'):
+            self.assertFalse(enqueue.lane_tasks(Task.objects, enqueue.LANE_BACKGROUND).exists())
+
+    def test_lane_stats(self) -> None:
+        """
+            Test queue depth and wait times per lane
+        :return: None
+        """
+        now = datetime.datetime.now(tz=get_current_timezone())
+        enqueue.schedule(enqueue.PIPELINE_TASK, delay=-600, queue='background')
+        enqueue.schedule(enqueue.PIPELINE_TASK, delay=600, queue='background')
+        enqueue.badewanne_process_tracking([1], delay=-30)
+        running = enqueue.schedule(enqueue.TRACKING_TASK, [[2]], delay=-20, queue='interactive')
+        running.locked_by, running.locked_at = '4242', now
+        running.save()
+        for wait in (2, 4):
+            CompletedTask.objects.create(
+                task_name=enqueue.TRACKING_TASK, task_params='[[[3], {}]]', task_hash='x',
+                queue='interactive', run_at=now - datetime.timedelta(seconds=60),
+                locked_at=now - datetime.timedelta(seconds=60 - wait)
+            )
+        stats = enqueue.lane_stats(now)
+        self.assertEqual(list(stats), ['interactive', 'background'])
+        interactive = stats['interactive']
+        self.assertEqual((interactive['pending'], interactive['running'],
+                          interactive['scheduled'], interactive['completed']), (1, 1, 0, 2))
+        self.assertAlmostEqual(interactive['oldest_wait_seconds'], 30, delta=2)
+        self.assertEqual((interactive['mean_wait_seconds'], interactive['max_wait_seconds']),
+                         (3.0, 4.0))
+        background = stats['background']
+        self.assertEqual((background['queue'], background['pending'], background['scheduled'],
+                          background['completed']), ('background', 1, 1, 0))
+        self.assertAlmostEqual(background['oldest_wait_seconds'], 600, delta=2)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@test.de', 'pw'))
+        response = self.client.get(reverse('ebayItems:task-lanes'))
+        self.assertEqual(response.json()['interactive']['pending'], 1)
+
+    def test_coalesce_tracking(self) -> None:
+        """
+            Test that tracking requests merge into the task not started yet
+        :return: None
+        """
+        first = enqueue.badewanne_process_tracking([3, 1], delay=5)
+        self.assertEqual(enqueue.badewanne_process_tracking([2, 3], delay=5).pk, first.pk)
+        enqueue.badewanne_process_tracking([1], delay=5)
+        task = Task.objects.get(task_name=enqueue.TRACKING_TASK)
+        self.assertEqual(task.params(), ([[1, 2, 3]], {}))
+        self.assertEqual(task.run_at, first.run_at)
+        self.assertEqual(task.task_hash, Task.objects.new_task(
+            enqueue.TRACKING_TASK, [[1, 2, 3]]
+        ).task_hash)
+        task.lock('4242')
+        started = enqueue.badewanne_process_tracking([4], delay=5)
+        self.assertNotEqual(started.pk, task.pk)
+        self.assertEqual(started.params(), ([[4]], {}))
+        self.assertEqual(Task.objects.filter(task_name=enqueue.TRACKING_TASK).count(), 2)
+
+    def test_run_worker_lanes(self) -> None:
+        """
+            Test the workers of the interactive lane and of both lanes
+        :return: None
+        """
+        command = 'ebayItems.management.commands.run_worker'
+        with mock.patch(command + '.call_command') as process:
+            call_command('run_worker', lane='interactive', duration=1, stdout=mock.MagicMock())
+        process.assert_called_once_with('process_tasks', duration=1, sleep=5.0,
+                                        queue='interactive', log_std=False)
+        self.assertFalse(Task.objects.filter(task_name=enqueue.PIPELINE_TASK).exists())
+        with mock.patch(command + '.call_command') as process, \
+                mock.patch(command + '.multiprocessing.get_context') as context:
+            child = context.return_value.Process
+            # the interactive child dies once and is restarted
+            child.return_value.is_alive.side_effect = [False] + [True] * 100
+            call_command('run_worker', lane='all', duration=1, sleep=0.2,
+                         stdout=mock.MagicMock())
+        self.assertEqual([call[1]['args'][0] for call in child.call_args_list],
+                         ['interactive', 'background', 'interactive'])
+        self.assertEqual(child.call_args[1]['args'][1]['duration'], 0)
+        self.assertEqual(child.return_value.start.call_count, 3)
+        self.assertEqual(child.return_value.terminate.call_count, 2)
+        process.assert_not_called()
+        self.assertTrue(Task.objects.filter(task_name=enqueue.PIPELINE_TASK).exists())
+
+    def test_run_worker_pooled_child(self) -> None:
+        """
+            Test that a lane child can run a pipeline step in the process pool
+        :return: None
+        """
+        def pooled_step(queue, options):  # pylint: disable=unused-argument
+            result = parallel.run_partitioned(abs, [(-1,), (-2,)], workers=2)
+            sys.exit(0 if result == [1, 2] else 3)
+
+        with mock.patch.object(run_worker.Command, 'process', staticmethod(pooled_step)):
+            child = run_worker.Command().start_child('background', {})
+            child.join(60)
+        self.assertFalse(child.daemon)
+        self.assertEqual(child.exitcode, 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestPipelineProgressCase(TestCase):
+    """
+        Test the published progress of the pipeline jobs
+    """
+
+    def setUp(self) -> None:
+        """
+            Start from an empty cache
+        :return: None
+        """
+        cache.clear()
+
+    def test_publisher(self) -> None:
+        """
+            Test the progress written while a job runs and when it ended
+        :return: None
+        """
+        publisher = progress.Publisher('sync_ebay_items')
+        with override_settings(PROGRESS_PUBLISH_SECONDS=0):
+            with publisher.publishing():
+                with throughput.phase('sync'):
+                    throughput.expect(4)
+                    throughput.advance(1)
+                    running = progress.read_progress()['sync_ebay_items']
+        self.assertEqual((running['state'], running['phase'], running['rows'],
+                          running['total'], running['percent']), ('running', 'sync', 1, 4, 25.0))
+        self.assertIsNone(running['finished_at'])
+        finished = progress.read_progress()['sync_ebay_items']
+        self.assertEqual((finished['state'], finished['phase']), ('finished', None))
+        self.assertEqual([phase['phase'] for phase in finished['phases']], ['sync'])
+        with self.assertRaises(ValueError):
+            with publisher.publishing('status'):
+                raise ValueError
+        failed = progress.read_progress()['sync_ebay_items']
+        self.assertEqual((failed['state'], failed['phase']), ('failed', 'status'))
+        self.assertIsNone(progress.read_progress()['ebay_badewanne_update'])
+
+    def test_published_task(self) -> None:
+        """
+            Test that the tracking task publishes its rows and api batches
+        :return: None
+        """
+        create_ebayitem(item_no=1, auction_id='100001', item_status=BWStageEnum.BW_TOBLOCK.value)
+        response = mock.Mock(json=mock.Mock(return_value={'HasErrors': False}))
+        with mock.patch.object(tasks, 'execute_ebay_batch_pricing_api', return_value=response):
+            tasks.badewanne_process_tracking.now()
+        tracking = progress.read_progress()['badewanne_process_tracking']
+        self.assertEqual((tracking['state'], tracking['phase'], tracking['api_batches']),
+                         ('finished', None, None))
+        self.assertEqual([(phase['phase'], phase['api_batches']) for phase in tracking['phases']],
+                         [('badewanne', 1)])
+
+    def test_endpoints(self) -> None:
+        """
+            Test the JSON endpoint with its ETag and the opt-in event stream
+        :return: None
+        """
+        with progress.Publisher('sync_ebay_items').publishing('fetch'):
+            pass
+        url = reverse('ebayItems:progress')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('user', 'user@test.de', 'pw'))
+        response = self.client.get(url)
+        self.assertEqual(response.json()['jobs']['sync_ebay_items']['state'], 'finished')
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        # the page polls, the stream is opt-in
+        self.assertEqual(self.client.get(reverse('ebayItems:progress-stream')).status_code, 404)
+        with override_settings(PROGRESS_STREAM=True, PROGRESS_STREAM_SECONDS=0,
+                               PROGRESS_STREAM_INTERVAL=0.01):
+            response = self.client.get(reverse('ebayItems:progress-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertEqual(events[0], 'retry: 20')
+        event, data = events[1].split('\n')
+        self.assertEqual(event, 'event: progress')
+        self.assertEqual(json.loads(data[len('data: '):])['jobs']['sync_ebay_items']['phase'],
+                         None)
@@ -0,0 +1,204 @@
+"""
+This module measures the throughput of pipeline runs. Within metered() every
+phase records the rows it processed, its duration, the SQL statements it ran
+and the pricing api calls it made. The pipeline functions report their rows
+with expect() and advance() and their api calls with api_call(), which do
+nothing when no run is metered.
+"""
+
+import contextlib
+import contextvars
+import time
+from typing import Callable, List, Optional
+
+from .profiling import SQLTimer
+
+_METER = contextvars.ContextVar('pipeline_meter', default=None)
+
+
+class PhaseStats:
+    """
+    Counters of one phase of a metered run
+    """
+
+    def __init__(self, name: str, queries: int):
+        self.name = name
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.rows = 0
+        self.total = None
+        self.queries = -queries
+        self.api_calls = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        Processed rows per second of the phase so far
+        :return: float
+        """
+        seconds = self.seconds or time.perf_counter() - self.started
+        return self.rows / seconds if seconds > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        """
+        Seconds until all expected rows are processed at the current rate
+        :return: seconds or None when unknown
+        """
+        rate = self.rows_per_second
+        if self.total is None or not rate:
+            return None
+        return max(0.0, (self.total - self.rows) / rate)
+
+
+class Meter:
+    """
+    Throughput of the phases of one run, on_progress is called with the
+    current PhaseStats whenever rows are processed, on_phase when a phase
+    starts or ends
+    """
+
+    def __init__(self, on_progress: Callable[[PhaseStats], None] = None,
+                 on_phase: Callable[[PhaseStats], None] = None):
+        self.on_progress = on_progress
+        self.on_phase = on_phase
+        self.timer = SQLTimer()
+        self.phases = []
+        self.stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Measure the block as phase name
+        :param name: phase name
+        """
+        stats = PhaseStats(name, self.timer.count)
+        self.phases.append(stats)
+        self.stack.append(stats)
+        if self.on_phase is not None:
+            self.on_phase(stats)
+        try:
+            yield stats
+        finally:
+            self.stack.pop()
+            stats.seconds = time.perf_counter() - stats.started
+            stats.queries += self.timer.count
+            if self.on_phase is not None:
+                self.on_phase(stats)
+
+    @property
+    def current(self) -> Optional[PhaseStats]:
+        """
+        Innermost running phase
+        :return: PhaseStats or None
+        """
+        return self.stack[-1] if self.stack else None
+
+    def table(self) -> List[list]:
+        """
+        Rows of the throughput table, one per phase
+        :return: list of phase, rows, seconds, rows/s, queries, api calls
+        """
+        return [[stats.name, stats.rows, '{:.2f}'.format(stats.seconds),
+                 '{:.0f}'.format(stats.rows_per_second), stats.queries, stats.api_calls]
+                for stats in self.phases]
+
+
+def active() -> bool:
+    """
+    Whether a metered run is active
+    :return: bool
+    """
+    return _METER.get() is not None
+
+
+@contextlib.contextmanager
+def metered(on_progress: Callable[[PhaseStats], None] = None,
+            on_phase: Callable[[PhaseStats], None] = None):
+    """
+    Meter the block, the SQL statements are counted on all databases
+    :param on_progress: called with the PhaseStats when rows are processed
+    :param on_phase: called with the PhaseStats when a phase starts or ends
+    """
+    meter = Meter(on_progress, on_phase)
+    token = _METER.set(meter)
+    try:
+        with meter.timer.timing():
+            yield meter
+    finally:
+        _METER.reset(token)
+
+
+def phase(name: str):
+    """
+    Context manager measuring a phase of the metered run, a null context
+    when no run is metered
+    :param name: phase name
+    :return: context manager
+    """
+    meter = _METER.get()
+    if meter is None:
+        return contextlib.nullcontext()
+    return meter.phase(name)
+
+
+@contextlib.contextmanager
+def observed(on_progress: Callable[[PhaseStats], None]):
+    """
+    Call on_progress too whenever rows are processed in the block, nothing
+    when no run is metered
+    :param on_progress: called with the PhaseStats when rows are processed
+    """
+    meter = _METER.get()
+    if meter is None:
+        yield
+        return
+    previous = meter.on_progress
+
+    def chained(stats: PhaseStats) -> None:
+        if previous is not None:
+            previous(stats)
+        on_progress(stats)
+
+    meter.on_progress = chained
+    try:
+        yield
+    finally:
+        meter.on_progress = previous
+
+
+def expect(rows: int) -> None:
+    """
+    Set the rows the current phase is going to process
+    :param rows: number of rows
+    :return: None
+    """
+    meter = _METER.get()
+    if meter is not None and meter.current is not None:
+        meter.current.total = rows
+
+
+def advance(rows: int) -> None:
+    """
+    Account processed rows to the current phase
+    :param rows: number of rows
+    :return: None
+    """
+    meter = _METER.get()
+    if meter is None or meter.current is None:
+        return
+    meter.current.rows += rows
+    if meter.on_progress is not None:
+        meter.on_progress(meter.current)
+
+
+def api_call() -> None:
+    """
+    Account a pricing api call to the current phase
+    :return: None
+    """
+    meter = _METER.get()
+    if meter is None or meter.current is None:
+        return
+    meter.current.api_calls += 1
+    if meter.on_progress is not None:
+        meter.on_progress(meter.current)
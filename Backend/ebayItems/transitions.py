@@ -0,0 +1,62 @@
+"""
+This module starts and stops the badewanne of many items at once. The table
+view and the admin actions share it, so both move the items with the same
+few queries no matter how many are selected.
+"""
+
+import datetime
+import logging
+from typing import List
+
+from django.db import transaction
+from django.db.models import query
+from django.utils.timezone import get_current_timezone
+
+from .models import BWStageEnum
+from . import enqueue
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds until the tracking of the moved items starts
+TRACKING_DELAY = 5
+
+
+def transition(items: query.QuerySet, target: BWStageEnum, **fields) -> List[int]:
+    """
+    Move the items to target and schedule their tracking. The ids are locked
+    and read before the update, the update filters like the read so that
+    items changed meanwhile are not moved.
+    :param items: queryset of the items to move
+    :param target: status the items move to
+    :param fields: further fields to update
+    :return: ids of the moved items
+    """
+    with transaction.atomic(using=items.db):
+        ids = list(items.select_for_update().values_list('id', flat=True))
+        if not ids:
+            return ids
+        items.update(item_status=target.value, **fields)
+    LOGGER.info("Moved %s items to %s", len(ids), target.value)
+    enqueue.badewanne_process_tracking(ids, delay=TRACKING_DELAY)
+    return ids
+
+
+def start_badewanne(items: query.QuerySet) -> List[int]:
+    """
+    Start the badewanne of the ready items among items
+    :param items: queryset of selected items
+    :return: ids of the started items
+    """
+    return transition(
+        items.filter(item_status=BWStageEnum.BW_READY.value), BWStageEnum.BW_STAGE0,
+        last_bw_start_date=datetime.datetime.now(tz=get_current_timezone())
+    )
+
+
+def stop_badewanne(items: query.QuerySet) -> List[int]:
+    """
+    Stop the badewanne of the items among items which are in a stage
+    :param items: queryset of selected items
+    :return: ids of the stopped items
+    """
+    return transition(items.filter(item_status__startswith='BW_STAGE'), BWStageEnum.BW_TOBLOCK)
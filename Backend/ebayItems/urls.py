@@ -7,13 +7,29 @@ from .views import (
     FilteredEbayItemListView,
     item_badewanne,
     EbayItemsListView,
-    EbayItemsUpdateView
+    EbayItemsFeedView,
+    EbayItemsUpdateView,
+    pipeline_progress,
+    pipeline_progress_stream,
+    request_profile,
+    request_profiles,
+    slow_queries,
+    slow_query,
+    task_lanes
 )
 
 
 urlpatterns = [
     path('', FilteredEbayItemListView.as_view(), name='ebay_index'),
     path('items/', EbayItemsListView.as_view(), name='items-list'),
+    path('items/feed/', EbayItemsFeedView.as_view(), name='items-feed'),
     path('items/<int:pk>/', EbayItemsUpdateView.as_view(), name='items-partial-update'),
     path('badewanne/', item_badewanne, name='badewanne'),
+    path('progress/', pipeline_progress, name='progress'),
+    path('progress/stream/', pipeline_progress_stream, name='progress-stream'),
+    path('profiles/', request_profiles, name='request-profiles'),
+    path('profiles/<int:pk>/', request_profile, name='request-profile'),
+    path('slow-queries/', slow_queries, name='slow-queries'),
+    path('slow-queries/<int:pk>/', slow_query, name='slow-query'),
+    path('task-lanes/', task_lanes, name='task-lanes'),
 ]
@@ -2,30 +2,97 @@
 ebayItems's views, which defines how to response the user request.
 """
 
+import hashlib
+import itertools
+import json
 import logging
-from datetime import datetime
+import re
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import redirect
-from django.utils.timezone import get_current_timezone
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
 from django_filters.views import FilterView
 from django_filters.rest_framework import DjangoFilterBackend
 from django_tables2.views import SingleTableMixin
-from django_tables2.export.views import ExportMixin
 from rest_framework.mixins import UpdateModelMixin
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 
-from .serializers import EbayItemsSerializer
-from .models import EbayItem, EbayItemsFilter, BWStageEnum
-from .tables import EbayItemTable
-from .tasks import badewanne_process_tracking
+from . import catalog, enqueue, progress, routers, streaming, transitions
+from .serializers import EbayItemsSerializer, field_columns, parse_fieldset
+from .streaming import NDJSONRenderer
+from .models import ArchivedEbayItem, EbayItem, EbayItemsFilter, RequestProfile, SlowQuery
+from .tables import COLUMN_PRESETS, DEFAULT_PRESET, EbayItemTable, preset_exclude, preset_fields
 
 
 LOGGER = logging.getLogger(__name__)
 
+PRESET_SESSION_KEY = 'ebayItems_column_preset'
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
 
-class FilteredEbayItemListView(LoginRequiredMixin, SingleTableMixin, ExportMixin, FilterView):
+
+class ReplicaReadMixin:
+    """
+    Read the items of the view from the read replica. The response is
+    rendered inside the view, so that the lazy querysets of the template are
+    evaluated on the replica, too.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+            Dispatch the request with the reads routed to the replica
+        :param request:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        with routers.read_from(routers.read_alias_for(request)):
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class DeferredExportMixin:
+    """
+    ExportMixin of django_tables2 which imports it on the first export only.
+    Its tablib loads pandas and openpyxl for the formats, which the web
+    processes should not load at startup.
+    """
+    export_name = 'table'
+    export_trigger_param = '_export'
+    exclude_columns = ()
+
+    def render_to_response(self, context, **kwargs):
+        """
+            Render the export when the trigger parameter names a format
+        :param context:
+        :param kwargs:
+        :return: response
+        """
+        export_format = self.request.GET.get(self.export_trigger_param)
+        if export_format:
+            from django_tables2.export import TableExport  # pylint: disable=import-outside-toplevel
+            if TableExport.is_valid_format(export_format):
+                exporter = TableExport(
+                    export_format=export_format, table=self.get_table(**self.get_table_kwargs()),
+                    exclude_columns=self.exclude_columns
+                )
+                return exporter.response(
+                    filename='{}.{}'.format(self.export_name, export_format)
+                )
+        return super().render_to_response(context, **kwargs)
+
+
+class FilteredEbayItemListView(LoginRequiredMixin, ReplicaReadMixin, SingleTableMixin,
+                               DeferredExportMixin, FilterView):
     """
     Display filter form and item detail table
     """
@@ -36,6 +103,73 @@ class FilteredEbayItemListView(LoginRequiredMixin, SingleTableMixin, ExportMixin
 
     filterset_class = EbayItemsFilter
 
+    @cached_property
+    def column_preset(self) -> str:
+        """
+            Column preset chosen by the preset parameter, it is kept in the
+            session for the next page loads
+        :return: name in COLUMN_PRESETS
+        """
+        preset = self.request.GET.get('preset')
+        if preset in COLUMN_PRESETS:
+            self.request.session[PRESET_SESSION_KEY] = preset
+            return preset
+        preset = self.request.session.get(PRESET_SESSION_KEY)
+        return preset if preset in COLUMN_PRESETS else DEFAULT_PRESET
+
+    def get_table_kwargs(self):
+        """
+            Show the columns of the preset in its order, also in the export
+        :return: table kwargs
+        """
+        return {
+            'exclude': preset_exclude(self.column_preset),
+            'sequence': ['selection'] + preset_fields(self.column_preset)
+        }
+
+    def get_table_data(self):
+        """
+            Load only the columns of the preset
+        :return: queryset
+        """
+        return super().get_table_data().only(*preset_fields(self.column_preset))
+
+    def get_table_cache_key(self) -> str:
+        """
+            Cache key of the rendered table, by filter, sort and page of the
+            querystring, the column preset and the catalog version
+        :return: cache key
+        """
+        params = {name: ','.join(values) for name, values in self.request.GET.lists()}
+        params['preset'] = self.column_preset
+        return catalog.cache_key('ebayItems:table', params)
+
+    def get_context_data(self, **kwargs):
+        """
+            Add the rendered table to the context, from the cache when the
+            catalog did not change since it was rendered. The items are not
+            queried at all then.
+        :param kwargs:
+        :return: context
+        """
+        if self.request.GET.get(self.export_trigger_param):
+            return super().get_context_data(**kwargs)
+        key = self.get_table_cache_key()
+        table_html = cache.get(key)
+        if table_html is not None:
+            context = super(SingleTableMixin, self).get_context_data(**kwargs)
+        else:
+            context = super().get_context_data(**kwargs)
+            table_html = context['table'].as_html(self.request)
+            cache.set(key, str(table_html), settings.TABLE_CACHE_SECONDS)
+        context['table_html'] = mark_safe(table_html)
+        context['column_presets'] = list(COLUMN_PRESETS)
+        context['column_preset'] = self.column_preset
+        context['progress_stream'] = progress.stream_enabled()
+        context['progress_poll_ms'] = int(progress.get_poll_interval() * 1000)
+        return context
+
+
 @login_required()
 def item_badewanne(request):
     """
@@ -44,28 +178,151 @@ def item_badewanne(request):
     :return:
     """
     if request.method == "POST":
-        pks = request.POST.getlist("selection")
+        items = EbayItem.objects.filter(pk__in=request.POST.getlist("selection"))
         if "start-badewanne" in request.POST:
-            items = EbayItem.objects.filter(
-                pk__in=pks,
-                item_status=BWStageEnum.BW_READY.value,
-            )
-            LOGGER.info("Items to start Badewanne: %s", items)
-            items.update(item_status=BWStageEnum.BW_STAGE0.value,
-                         last_bw_start_date=datetime.now(tz=get_current_timezone()))
-            badewanne_process_tracking(list(items.values_list('id', flat=True)), schedule=5)
+            LOGGER.info("Items to start Badewanne: %s", transitions.start_badewanne(items))
+            routers.pin_primary(request)
         elif "stop-badewanne" in request.POST:
-            items = EbayItem.objects.filter(
-                pk__in=pks,
-                item_status__startswith='BW_STAGE',
-            )
-            LOGGER.info("Items to stop Badewanne: %s", items)
-            items.update(item_status=BWStageEnum.BW_TOBLOCK.value)
-            badewanne_process_tracking(list(items.values_list('id', flat=True)), schedule=5)
+            LOGGER.info("Items to stop Badewanne: %s", transitions.stop_badewanne(items))
+            routers.pin_primary(request)
     return redirect(request.META.get('HTTP_REFERER'))
 
 
-class EbayItemsListView(generics.ListAPIView):
+@staff_member_required
+def request_profiles(request):
+    """
+        List the slowest of the stored request profiles
+    :param request:
+    :return:
+    """
+    profiles = RequestProfile.objects.defer('profile').order_by('-duration_ms')[:100]
+    return render(request, 'ebayItems/request_profiles.html', {'profiles': profiles})
+
+
+@staff_member_required
+def request_profile(request, pk):
+    """
+        Show a request profile, download it with ?download=1
+    :param request:
+    :param pk: RequestProfile id
+    :return:
+    """
+    profile = get_object_or_404(RequestProfile, pk=pk)
+    if request.GET.get('download'):
+        response = HttpResponse(profile.profile, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="request-{}-{}.txt"'.format(
+            profile.pk, profile.mode
+        )
+        return response
+    return render(request, 'ebayItems/request_profile.html', {'profile': profile})
+
+
+@staff_member_required
+def slow_queries(request):
+    """
+        List the recorded slow statements by their total time
+    :param request:
+    :return:
+    """
+    queries = SlowQuery.objects.defer('example', 'explain').order_by('-total_ms')[:100]
+    return render(request, 'ebayItems/slow_queries.html', {'queries': queries})
+
+
+@staff_member_required
+def slow_query(request, pk):
+    """
+        Show a slow statement with its call sites, example and EXPLAIN
+    :param request:
+    :param pk: SlowQuery id
+    :return:
+    """
+    query = get_object_or_404(SlowQuery, pk=pk)
+    return render(request, 'ebayItems/slow_query.html', {'query': query})
+
+
+@login_required()
+def pipeline_progress(request):
+    """
+        Progress of the pipeline jobs as JSON, answered with 304 while the
+        ETag of the client is current
+    :param request:
+    :return:
+    """
+    data = json.dumps({'jobs': progress.read_progress()}, sort_keys=True)
+    etag = '"{}"'.format(hashlib.sha1(data.encode('utf-8')).hexdigest())
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(data, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@login_required()
+def pipeline_progress_stream(request):  # pylint: disable=unused-argument
+    """
+        Progress of the pipeline jobs as Server-Sent Events, only with
+        PROGRESS_STREAM on
+    :param request:
+    :return:
+    """
+    if not progress.stream_enabled():
+        raise Http404('The progress stream is disabled')
+    response = StreamingHttpResponse(
+        progress.event_stream(settings.PROGRESS_STREAM_SECONDS,
+                              settings.PROGRESS_STREAM_INTERVAL),
+        content_type='text/event-stream'
+    )
+    patch_cache_control(response, no_cache=True)
+    # keeps proxies from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+def task_lanes(request):  # pylint: disable=unused-argument
+    """
+        Queue depth and wait times of the task lanes as JSON
+    :param request:
+    :return:
+    """
+    return JsonResponse(enqueue.lane_stats())
+
+
+class FieldsetMixin:
+    """
+    ?fields= and ?exclude= choose the serialized fields and the selected
+    columns of the items
+    """
+
+    @cached_property
+    def fieldset(self):
+        """
+            Fields chosen by ?fields= and ?exclude=
+        :return: field names
+        """
+        return parse_fieldset(self.request.query_params)
+
+    def get_queryset(self):
+        """
+            Load only the columns of the chosen fields
+        :return: queryset
+        """
+        return super().get_queryset().only(*field_columns(self.fieldset))
+
+    def get_serializer(self, *args, **kwargs):
+        """
+            Build only the chosen fields
+        :param args:
+        :param kwargs:
+        :return: serializer
+        """
+        kwargs.setdefault('fields', self.fieldset)
+        return super().get_serializer(*args, **kwargs)
+
+
+class EbayItemsListView(FieldsetMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     API endpoint that allows users to be viewed or edited.
     """
@@ -75,6 +332,60 @@ class EbayItemsListView(generics.ListAPIView):
     filterset_class = EbayItemsFilter
 
 
+class EbayItemsFeedView(FieldsetMixin, ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Stream the filtered items as newline delimited JSON ordered by id, gzip
+    compressed when the client accepts it. ?since=<catalog version> limits
+    the feed to the items written after that version, followed by a
+    {"id": ..., "deleted": true} line per item archived after it, whatever
+    the filters. The X-Catalog-Version header holds the version to pass with
+    the next pull. The versions of the database counter increase in commit
+    order, so no write committed up to that version is missed, rows written
+    during the pull come again with the next one. Items deleted outright, by
+    the admin or a cleanup, leave no tombstone, clients pulling with since
+    need a full pull now and then to drop them.
+    """
+    queryset = EbayItem.objects.all()
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = EbayItemsFilter
+    renderer_classes = [NDJSONRenderer]
+
+    def get(self, request, *args, **kwargs):
+        """
+            Stream the items
+        :param request:
+        :param args:
+        :param kwargs:
+        :return: streaming response
+        """
+        version = catalog.get_catalog_version()
+        items = self.filter_queryset(self.get_queryset()).order_by('id')
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({'since': ['A catalog version is a whole number.']})
+            items = items.filter(catalog_version__gt=since)
+        # the stream runs after the view returned, outside of its routing
+        items = items.using(items.db)
+        lines = streaming.ndjson_lines(items, self.fieldset, field_columns(self.fieldset))
+        if since:
+            lines = itertools.chain(lines, streaming.tombstone_lines(
+                ArchivedEbayItem.objects.using(items.db)
+                .filter(catalog_version__gt=since).order_by('id')
+            ))
+        gzip = bool(ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        response = StreamingHttpResponse(
+            streaming.encoded(lines, gzip), content_type=NDJSONRenderer.media_type
+        )
+        response['X-Catalog-Version'] = version
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
 class EbayItemsUpdateView(generics.GenericAPIView, UpdateModelMixin):
     """
         REST API Update View
@@ -90,4 +401,5 @@ class EbayItemsUpdateView(generics.GenericAPIView, UpdateModelMixin):
         :param kwargs:
         :return:
         """
+        routers.pin_primary(request)
         return self.partial_update(request, *args, **kwargs)